@@ -0,0 +1,353 @@
+import multiprocessing as mp
+import argparse, json, queue, time
+import numpy as np
+from dqn_policy import DQNPolicy
+from rollout import BatchRollout
+from data_cache import load_database, load_json
+from shared_data import SharedData
+from utils import check_keras_free
+
+# Seconds between the checks of the actors while the learner waits for a push
+POLL_INTERVAL = 1.
+
+
+class ActorPolicy(DQNPolicy):
+    """The policy of an actor process, acts with the weights last broadcast by the learner and buffers experiences."""
+
+    def __init__(self, constants):
+        """
+        The constructor of ActorPolicy.
+
+        Parameters:
+            constants (dict): Loaded constants in dict
+        """
+
+        super().__init__(constants)
+        self.buffer = []
+
+    def add_experience(self, state, action, reward, next_state, done):
+        """
+        Buffers an experience until the next flush.
+
+        Parameters:
+            state (numpy.array)
+            action (int)
+            reward (int)
+            next_state (numpy.array)
+            done (bool)
+        """
+
+        self.buffer.append((state.astype(np.float32), action, reward, next_state.astype(np.float32), done))
+
+    def flush(self):
+        """
+        Empties the buffer and returns its experiences stacked into arrays, see ReplayMemory.add_batch.
+
+        Returns:
+            tuple: states, actions, rewards, next states and dones arrays
+        """
+
+        states, actions, rewards, next_states, dones = zip(*self.buffer)
+        self.buffer = []
+        return np.stack(states), np.array(actions, dtype=np.int32), np.array(rewards, dtype=np.float32), \
+            np.stack(next_states), np.array(dones, dtype=bool)
+
+
+def run_actor(constants, num_envs, flush_size, command_queue, transition_queue, shared_handle=None, env_offset=0,
+              seed_entropy=None):
+    """
+    The loop of an actor process: steps its own batch of dialogues and pushes the experiences to the learner.
+
+    Every message of the learner on command_queue is a dict('weights': list, 'warmup': bool, 'stop': bool), the actor
+    waits for the first one and then always acts with the newest one. Each push on transition_queue is a tuple of the
+    experience arrays, the (reward, success) of the finished episodes and the empty and non-empty inform counts.
+
+    Parameters:
+        constants (dict): Loaded constants in dict, the files in 'db_file_paths' are loaded from their compiled
+                          artifacts so every actor maps the same database pages
+        num_envs (int): The number of dialogues the actor steps in lockstep
+        flush_size (int): The number of experiences to buffer before pushing them
+        command_queue (multiprocessing.Queue)
+        transition_queue (multiprocessing.Queue)
+        shared_handle (tuple): SharedData.handle of the learner's data to attach to instead of loading the files.
+                               Default: None
+        env_offset (int): The index in the run of the actor's first dialogue. Default: 0
+        seed_entropy (int): The root of the random streams of the dialogues, see BatchRollout. Default: None
+    """
+
+    check_keras_free('actor')
+    if shared_handle is not None:
+        shared = SharedData.attach(shared_handle)
+        database, db_dict, user_goals = shared.database, shared.db_dict, shared.goal_pool
+    else:
+        file_path_dict = constants['db_file_paths']
+        cache_dir = file_path_dict.get('cache_dir', None)
+        database = load_database(file_path_dict['database'], cache_dir)
+        db_dict = load_json(file_path_dict['dict'], cache_dir)[0]
+        user_goals = load_json(file_path_dict['user_goals'], cache_dir)
+
+    policy = ActorPolicy(constants)
+    rollout = BatchRollout(policy, user_goals, database, db_dict, constants, num_envs, env_offset, seed_entropy)
+    command = command_queue.get()
+    finished = []
+    while not command['stop']:
+        policy.set_inference_weights(command['weights'])
+        finished += rollout.step(warmup=command['warmup'])
+        if len(policy.buffer) >= flush_size:
+            transition_queue.put((policy.flush(), finished, rollout.reset_empty_count()))
+            finished = []
+        # Switch to the newest command without waiting
+        try:
+            while True:
+                command = command_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class ActorLearner:
+    """
+    Runs the rollouts in actor processes while this process learns.
+
+    Every actor runs its own user sims., state trackers and error model controllers (see BatchRollout) and pushes its
+    experiences to the agent's replay memory in this process. The learner trains the agent and broadcasts the new
+    weights back to the actors.
+    """
+
+    def __init__(self, dqn_agent, constants, num_actors, envs_per_actor=1, flush_size=64, shared_handle=None,
+                 seed_entropy=None):
+        """
+        The constructor of ActorLearner.
+
+        Parameters:
+            dqn_agent (DQNAgent): The learning agent, its memory is the shared replay store
+            constants (dict): Loaded constants in dict
+            num_actors (int): The number of actor processes
+            envs_per_actor (int): The number of dialogues each actor steps in lockstep. Default: 1
+            flush_size (int): The number of experiences an actor buffers before pushing them. Default: 64
+            shared_handle (tuple): SharedData.handle of the data the actors attach to, by default every actor
+                                   loads the files in 'db_file_paths'. Default: None
+            seed_entropy (int): The root of the random streams of the dialogues, actor k runs the dialogues
+                                k * envs_per_actor onwards of the run (see BatchRollout). Default: None
+        """
+
+        self.dqn_agent = dqn_agent
+        self.constants = constants
+        self.num_actors = num_actors
+        self.envs_per_actor = envs_per_actor
+        self.flush_size = flush_size
+        self.shared_handle = shared_handle
+        self.seed_entropy = seed_entropy
+        # Spawned rather than forked so the actors do not inherit the learner's keras state
+        self.ctx = mp.get_context('spawn')
+        self.command_queues = []
+        self.transition_queue = None
+        self.actors = []
+        self.num_transitions = 0
+        self.start_time = None
+
+    def start(self, warmup=True):
+        """
+        Starts the actor processes and sends them the current weights.
+
+        Parameters:
+            warmup (bool): Start with the rule-based policy. Default: True
+        """
+
+        # Bounded so the actors cannot get far ahead of the learner
+        self.transition_queue = self.ctx.Queue(maxsize=4 * self.num_actors)
+        self.command_queues = [self.ctx.Queue() for _ in range(self.num_actors)]
+        self.actors = [self.ctx.Process(target=run_actor, daemon=True,
+                                        args=(self.constants, self.envs_per_actor, self.flush_size, command_queue,
+                                              self.transition_queue, self.shared_handle, k * self.envs_per_actor,
+                                              self.seed_entropy))
+                       for k, command_queue in enumerate(self.command_queues)]
+        for actor in self.actors:
+            actor.start()
+        self.broadcast(warmup)
+        self.num_transitions = 0
+        self.start_time = time.time()
+
+    def broadcast(self, warmup=False, stop=False):
+        """
+        Sends the agent's current behavior weights and mode to every actor.
+
+        Parameters:
+            warmup (bool): Act with the rule-based policy. Default: False
+            stop (bool): Make the actors exit. Default: False
+        """
+
+        command = {'weights': self.dqn_agent.get_inference_weights(), 'warmup': warmup, 'stop': stop}
+        for command_queue in self.command_queues:
+            command_queue.put(command)
+
+    def collect(self, timeout=None):
+        """
+        Waits for the next push of an actor and adds its experiences to the agent's memory.
+
+        It checks that the actors are still running before and every POLL_INTERVAL seconds while waiting, if one of
+        them died the actors are stopped and a RuntimeError is raised instead of waiting forever.
+
+        Parameters:
+            timeout (float): Seconds to wait, None to wait forever. Default: None
+
+        Returns:
+            list: Of tuple(float, bool), the reward and success of the episodes finished in the push
+            tuple: The empty and non-empty inform counts of the push
+
+        Raises:
+            RuntimeError: An actor process exited
+            queue.Empty: No push arrived within timeout
+        """
+
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            self.check_actors()
+            wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, max(deadline - time.time(), 0))
+            try:
+                experiences, finished, empty_counts = self.transition_queue.get(timeout=wait)
+                break
+            except queue.Empty:
+                if deadline is not None and time.time() >= deadline:
+                    raise
+        self.dqn_agent.memory.add_batch(*experiences)
+        self.num_transitions += len(experiences[1])
+        return finished, empty_counts
+
+    def check_actors(self):
+        """
+        Stops the actors and raises if one of them exited.
+
+        Raises:
+            RuntimeError: An actor process exited
+        """
+
+        dead = [(k, actor.exitcode) for k, actor in enumerate(self.actors) if not actor.is_alive()]
+        if dead:
+            self.stop()
+            raise RuntimeError('Actor {} exited with code {}'.format(*dead[0]))
+
+    def transitions_per_sec(self):
+        """Returns the number of experiences collected per second since start."""
+
+        return self.num_transitions / max(time.time() - self.start_time, 1e-9)
+
+    def stop(self):
+        """Stops and joins the actor processes."""
+
+        self.broadcast(stop=True)
+        # Drain the queue so no actor blocks on a full queue while exiting
+        deadline = time.time() + 10
+        while any(actor.is_alive() for actor in self.actors) and time.time() < deadline:
+            try:
+                self.transition_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in self.actors:
+            actor.join(timeout=1)
+            if actor.is_alive():
+                actor.terminate()
+        self.actors = []
+
+    def warmup_run(self, warmup_mem):
+        """
+        Collects experiences of the rule-based policy until the memory holds warmup_mem of them or is full.
+
+        Parameters:
+            warmup_mem (int)
+        """
+
+        print('Warmup Started...')
+        self.start(warmup=True)
+        while len(self.dqn_agent.memory) < warmup_mem and not self.dqn_agent.is_memory_full():
+            self.collect()
+        print('...Warmup Ended')
+
+    def train_run(self, num_ep_train, train_freq, end_period):
+        """
+        Trains the agent on the experiences of the actors until num_ep_train episodes finished.
+
+        Parameters:
+            num_ep_train (int)
+            train_freq (int): The number of episodes per period
+            end_period (function): Called at the end of every period like Trainer.end_period, it trains the agent and
+                                   returns the best success rate so far
+        """
+
+        print('Training Started...')
+        self.broadcast(warmup=False)
+        episode = 0
+        period_reward_total = 0
+        period_success_total = 0
+        period_empty, period_non_empty = 0, 0
+        success_rate_best = 0.9
+        while episode < num_ep_train:
+            finished, (empty, non_empty) = self.collect()
+            period_empty += empty
+            period_non_empty += non_empty
+            for ep_reward, success in finished:
+                episode += 1
+                period_reward_total += ep_reward
+                period_success_total += success
+                if episode % train_freq == 0:
+                    success_rate_best = end_period(episode, period_success_total, period_reward_total,
+                                                   success_rate_best, period_empty, period_non_empty)
+                    print('Transitions/sec: {:.1f}'.format(self.transitions_per_sec()))
+                    period_success_total = 0
+                    period_reward_total = 0
+                    period_empty, period_non_empty = 0, 0
+                    self.broadcast(warmup=False)
+        self.stop()
+        print('...Training Ended')
+
+
+def measure_scaling(dqn_agent, constants, actor_counts, seconds, envs_per_actor=1):
+    """
+    Measures the experiences collected per second with each number of actors.
+
+    Parameters:
+        dqn_agent (DQNAgent)
+        constants (dict): Loaded constants in dict
+        actor_counts (list): The numbers of actors to measure
+        seconds (float): How long to measure each number of actors, after the first push of every actor
+        envs_per_actor (int): Default: 1
+
+    Returns:
+        dict: dict(int: float) The transitions per second of each number of actors
+    """
+
+    results = {}
+    for num_actors in actor_counts:
+        actor_learner = ActorLearner(dqn_agent, constants, num_actors, envs_per_actor)
+        actor_learner.start(warmup=False)
+        # Leave out the start up of the actors
+        for _ in range(num_actors):
+            actor_learner.collect()
+        actor_learner.num_transitions = 0
+        actor_learner.start_time = time.time()
+        while time.time() - actor_learner.start_time < seconds:
+            actor_learner.collect()
+        results[num_actors] = actor_learner.transitions_per_sec()
+        actor_learner.stop()
+        print('Actors: {} Transitions/sec: {:.1f}'.format(num_actors, results[num_actors]))
+    return results
+
+
+if __name__ == "__main__":
+    # Measures the transitions/sec scaling with the number of actors, e.g.
+    # python actor_learner.py --constants_path "constants.json" --actors 1 2 4 8 --seconds 20
+    from dqn_agent import DQNAgent
+    from state_tracker import StateTracker
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--constants_path', dest='constants_path', type=str, default='constants.json')
+    parser.add_argument('--actors', dest='actors', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seconds', dest='seconds', type=float, default=10.)
+    parser.add_argument('--envs_per_actor', dest='envs_per_actor', type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.constants_path) as f:
+        constants = json.load(f)
+    file_path_dict = constants['db_file_paths']
+    database = load_database(file_path_dict['database'], file_path_dict.get('cache_dir', None))
+    dqn_agent = DQNAgent(StateTracker(database, constants).get_state_size(), constants)
+    measure_scaling(dqn_agent, constants, args.actors, args.seconds, args.envs_per_actor)
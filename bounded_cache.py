@@ -0,0 +1,165 @@
+from collections import OrderedDict, defaultdict
+import sys
+
+
+def estimate_size(key, value):
+    """
+    Returns a rough estimate in bytes of the memory held by a cache entry.
+
+    Containers are only measured one level deep, the items they reference (e.g. database records) are shared with
+    the database and so are not counted.
+
+    Parameters:
+        key (hashable)
+        value (object)
+
+    Returns:
+        int
+    """
+
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    if isinstance(key, (frozenset, tuple)):
+        size += sum(sys.getsizeof(item) for item in key)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) for k in value)
+    elif hasattr(value, 'nbytes'):
+        size += value.nbytes
+    return size
+
+
+class BoundedCache:
+    """A cache bounded by number of entries and memory, with LRU or LFU eviction and hit/miss/eviction counters."""
+
+    def __init__(self, max_entries=None, max_bytes=None, policy='lru', sizeof=estimate_size):
+        """
+        The constructor for BoundedCache.
+
+        Parameters:
+            max_entries (int): Max number of entries, None for no limit. Default: None
+            max_bytes (int): Memory budget in bytes as measured by sizeof, None for no limit. Default: None
+            policy (string): Eviction policy, 'lru' (least recently used) or 'lfu' (least frequently used).
+                             Default: 'lru'
+            sizeof (function): Returns the size in bytes of an entry given key and value. Default: estimate_size
+        """
+
+        if policy not in ('lru', 'lfu'):
+            raise ValueError('Cache policy must be lru or lfu, not {}'.format(policy))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.sizeof = sizeof
+        # {key: (value, size)} in least to most recently used order
+        self.entries = OrderedDict()
+        # Only used by lfu: {key: int} and {int: OrderedDict(key: None)}, the keys of each use count in LRU order
+        self.counts = {}
+        self.count_keys = defaultdict(OrderedDict)
+        self.min_count = 0
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for key or default if it is not cached. Never inserts anything.
+
+        Parameters:
+            key (hashable)
+            default (object): Default: None
+
+        Returns:
+            object
+        """
+
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._touch(key)
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Evicts entries until the new entry fits within the limits of the cache then caches value for key.
+
+        Parameters:
+            key (hashable)
+            value (object)
+        """
+
+        if key in self.entries:
+            self._remove(key)
+        size = self.sizeof(key, value)
+        while self.entries and self._over_budget(size):
+            self._evict()
+        self.entries[key] = (value, size)
+        self.num_bytes += size
+        if self.policy == 'lfu':
+            self.counts[key] = 1
+            self.count_keys[1][key] = None
+            self.min_count = 1
+
+    def clear(self):
+        """Empties the cache, the counters are kept."""
+
+        self.entries.clear()
+        self.counts.clear()
+        self.count_keys.clear()
+        self.min_count = 0
+        self.num_bytes = 0
+
+    def stats(self):
+        """
+        Returns the counters and current usage of the cache.
+
+        Returns:
+            dict
+        """
+
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self.entries),
+                'bytes': self.num_bytes, 'hit_rate': self.hits / lookups if lookups else 0.}
+
+    def _over_budget(self, new_size):
+        if self.max_entries is not None and len(self.entries) + 1 > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.num_bytes + new_size > self.max_bytes
+
+    def _touch(self, key):
+        if self.policy == 'lru':
+            self.entries.move_to_end(key)
+            return
+        count = self.counts[key]
+        del self.count_keys[count][key]
+        if not self.count_keys[count]:
+            del self.count_keys[count]
+            if self.min_count == count:
+                self.min_count = count + 1
+        self.counts[key] = count + 1
+        self.count_keys[count + 1][key] = None
+
+    def _evict(self):
+        if self.policy == 'lru':
+            key = next(iter(self.entries))
+        else:
+            key = next(iter(self.count_keys[self.min_count]))
+        self._remove(key)
+        self.evictions += 1
+
+    def _remove(self, key):
+        _, size = self.entries.pop(key)
+        self.num_bytes -= size
+        if self.policy == 'lfu':
+            count = self.counts.pop(key)
+            del self.count_keys[count][key]
+            if not self.count_keys[count]:
+                del self.count_keys[count]
+                if self.min_count == count and self.count_keys:
+                    self.min_count = min(self.count_keys)
@@ -0,0 +1,264 @@
+import json
+import numpy as np
+
+
+def value_key(value):
+    """
+    Returns the key of a value in the value dictionary: the value itself, or for an unhashable value (e.g. the dict
+    '_id' values of some databases) a tuple holding its json, which cannot collide with a value loaded from json.
+
+    Parameters:
+        value (object)
+
+    Returns:
+        object
+    """
+
+    try:
+        hash(value)
+    except TypeError:
+        return ('json', json.dumps(value, sort_keys=True))
+    return value
+
+
+class ValueIndex:
+    """The ids of the values of a value dictionary, in a dict keyed by value_key."""
+
+    def __init__(self, values):
+        """
+        The constructor for ValueIndex.
+
+        Parameters:
+            values (list): The value dictionary, value id to value
+        """
+
+        self.ids = {value_key(value): i for i, value in enumerate(values)}
+
+    def get(self, value, default=None):
+        """
+        Returns the id of a value like dict.get would.
+
+        Parameters:
+            value (object)
+            default (object): Returned if the value is not in the value dictionary. Default: None
+
+        Returns:
+            int
+        """
+
+        return self.ids.get(value_key(value), default)
+
+
+class ColumnarDB:
+    """
+    A columnar, read-only representation of the database shared by DBQuery, StateTracker and UserSimulator.
+
+    Every distinct slot value is stored once in a value dictionary and every slot is a column of value ids in CSR
+    layout: the value ids of item i for a slot are column_ids[slot][column_offsets[slot][i]:column_offsets[slot][i + 1]].
+    Indexing the store with an item id still returns that item as a dict so it can be used in place of the list of
+    dicts loaded from the json file.
+    """
+
+    def __init__(self, slots, list_slots, values, column_ids, column_offsets, has_slot, value_counts=None,
+                 value_index=None):
+        """
+        The constructor for ColumnarDB, use ColumnarDB.from_records to build one from the loaded database.
+
+        Parameters:
+            slots (list): All slot names in item order
+            list_slots (list): The slots whose values are lists, the other slots hold a single scalar value
+            values (list): The value dictionary, value id to value
+            column_ids (dict): dict(string: numpy.array) The int32 value ids of every slot
+            column_offsets (dict): dict(string: numpy.array) The int64 offsets of every item into column_ids
+            has_slot (numpy.array): bool array of shape (num items, num slots), false where an item lacks the slot
+            value_counts (numpy.array): Precomputed value_counts, e.g. in shared memory. Default: computed from the
+                                        offsets
+            value_index (object): Looks up the id of a value with get(value, default), e.g. a
+                                  data_cache.StringTableIndex over shared memory. Default: a ValueIndex of the values
+        """
+
+        self.slots = slots
+        self.slot_index = {slot: i for i, slot in enumerate(slots)}
+        self.list_slots = set(list_slots)
+        self.values = values
+        self.value_index = ValueIndex(values) if value_index is None else value_index
+        self.column_ids = column_ids
+        self.column_offsets = column_offsets
+        self.has_slot = has_slot
+        self.num_items = has_slot.shape[0]
+        # int32 array of shape (num items, num slots), the number of values of every slot of every item
+        self.value_counts = value_counts
+        if value_counts is None:
+            self.value_counts = np.zeros(has_slot.shape, dtype=np.int32)
+            for slot, offsets in column_offsets.items():
+                self.value_counts[:, self.slot_index[slot]] = np.diff(offsets)
+        self._index = None
+
+    @classmethod
+    def from_records(cls, database):
+        """
+        Builds the columnar store from the database as loaded from json.
+
+        Parameters:
+            database (list): The database in the format list(dict)
+
+        Returns:
+            ColumnarDB
+        """
+
+        slots = []
+        list_slots = []
+        for data in database:
+            for slot, value in data.items():
+                if slot not in slots:
+                    slots.append(slot)
+                if isinstance(value, list) and slot not in list_slots:
+                    list_slots.append(slot)
+
+        values = []
+        value_index = {}
+        column_ids = {slot: [] for slot in slots}
+        column_offsets = {slot: [0] for slot in slots}
+        has_slot = np.zeros((len(database), len(slots)), dtype=bool)
+        for i, data in enumerate(database):
+            for j, slot in enumerate(slots):
+                if slot in data:
+                    has_slot[i, j] = True
+                    item_values = data[slot] if slot in list_slots else [data[slot]]
+                    for value in item_values:
+                        key = value_key(value)
+                        if key not in value_index:
+                            value_index[key] = len(values)
+                            values.append(value)
+                        column_ids[slot].append(value_index[key])
+                column_offsets[slot].append(len(column_ids[slot]))
+
+        column_ids = {slot: np.array(ids, dtype=np.int32) for slot, ids in column_ids.items()}
+        column_offsets = {slot: np.array(offsets, dtype=np.int64) for slot, offsets in column_offsets.items()}
+        return cls(slots, list_slots, values, column_ids, column_offsets, has_slot)
+
+    @property
+    def index(self):
+        """The db_index.InvertedIndex of the database, built on first use and shared by every DBQuery over it."""
+
+        if self._index is None:
+            # db_index imports data_cache, which imports this module
+            from db_index import InvertedIndex
+            self._index = InvertedIndex(self)
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self.num_items
+
+    def __getitem__(self, i):
+        """Materializes item i as a dict in the same format as the json database."""
+
+        if not 0 <= i < self.num_items:
+            raise IndexError('Item: {} not in range of the database'.format(i))
+        data = {}
+        for j, slot in enumerate(self.slots):
+            if self.has_slot[i, j]:
+                data[slot] = self.get_value(i, slot)
+        return data
+
+    def __iter__(self):
+        return (self[i] for i in range(self.num_items))
+
+    def get_value_ids(self, i, slot):
+        """
+        Returns the value ids of a slot of item i.
+
+        Parameters:
+            i (int)
+            slot (string)
+
+        Returns:
+            numpy.array
+        """
+
+        offsets = self.column_offsets[slot]
+        return self.column_ids[slot][offsets[i]:offsets[i + 1]]
+
+    def get_value(self, i, slot):
+        """
+        Returns the value of a slot of item i, a new list for list slots.
+
+        Parameters:
+            i (int)
+            slot (string)
+
+        Returns:
+            list or scalar
+        """
+
+        value = [self.values[value_id] for value_id in self.get_value_ids(i, slot)]
+        return value if slot in self.list_slots else value[0]
+
+    def get(self, i, slot, default=None):
+        """
+        Returns the value of a slot of item i like dict.get would on the materialized item.
+
+        Parameters:
+            i (int)
+            slot (string)
+            default (object): Returned if the item lacks the slot. Default: None
+
+        Returns:
+            list or scalar
+        """
+
+        if not 0 <= i < self.num_items:
+            raise IndexError('Item: {} not in range of the database'.format(i))
+        j = self.slot_index.get(slot)
+        if j is None or not self.has_slot[i, j]:
+            return default
+        return self.get_value(i, slot)
+
+    def has_value(self, i, slot):
+        """
+        Returns true if the list slot of item i has at least one value.
+
+        Parameters:
+            i (int)
+            slot (string)
+
+        Returns:
+            bool
+        """
+
+        j = self.slot_index.get(slot)
+        return j is not None and slot in self.list_slots and self.value_counts[i, j] > 0
+
+    def encode(self, value):
+        """
+        Returns the value ids of a list of values, None if any value is not in the value dictionary.
+
+        Parameters:
+            value (list)
+
+        Returns:
+            tuple
+        """
+
+        value_ids = tuple(self.value_index.get(v) for v in value)
+        return None if None in value_ids else value_ids
+
+
+def as_columnar(database):
+    """
+    Returns the database as a ColumnarDB, building one if it is still a list of dicts.
+
+    Parameters:
+        database (list or ColumnarDB)
+
+    Returns:
+        ColumnarDB
+    """
+
+    if isinstance(database, ColumnarDB):
+        return database
+    return ColumnarDB.from_records(database)
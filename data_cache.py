@@ -0,0 +1,475 @@
+from collections.abc import Sequence
+import argparse, hashlib, json, os, shutil, tempfile, zlib
+import numpy as np
+from columnar_db import ColumnarDB
+
+# Bump whenever the layout of the compiled artifacts changes, old artifacts are then ignored
+FORMAT_VERSION = 2
+# Kinds of the values in a string table
+STR_KIND = 0
+JSON_KIND = 1
+
+
+def source_hash(path):
+    """
+    Returns the hash of a source file that keys its compiled artifact, it includes the FORMAT_VERSION.
+
+    Parameters:
+        path (string)
+
+    Returns:
+        string
+    """
+
+    sha = hashlib.sha256('v{}'.format(FORMAT_VERSION).encode())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _umask():
+    """Returns the umask of the process, which os.umask can only read by setting it."""
+
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def stamped_source_hash(path, cache_dir):
+    """
+    Returns the source_hash of a source file, only hashing the file again when its size or modification time changed
+    since the hash was stamped into cache_dir.
+
+    Parameters:
+        path (string)
+        cache_dir (string): Where the stamp file is kept
+
+    Returns:
+        string
+    """
+
+    path = os.path.abspath(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    # Keyed by the full path too since sources with the same name can share a cache_dir
+    stamp_path = os.path.join(cache_dir, '{}-{}.stamp'.format(name, hashlib.sha256(path.encode()).hexdigest()[:16]))
+    stat = os.stat(path)
+    key = {'version': FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    try:
+        with open(stamp_path) as f:
+            stamp = json.load(f)
+        if stamp['key'] == key:
+            return stamp['hash']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = source_hash(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temp file then renamed so parallel workers never read a partial stamp
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'key': key, 'hash': digest}, f)
+        os.chmod(tmp, 0o666 & ~_umask())
+        os.replace(tmp, stamp_path)
+    except OSError:
+        # E.g. a read-only cache_dir, the file is hashed again next time
+        pass
+    return digest
+
+
+def artifact_path(path, cache_dir=None):
+    """
+    Returns the directory of the compiled artifact of a source json file.
+
+    Parameters:
+        path (string): The source json file
+        cache_dir (string): Where artifacts are stored. Default: a .cache directory next to the source file
+
+    Returns:
+        string
+    """
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), '.cache')
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, '{}-{}'.format(name, stamped_source_hash(path, cache_dir)[:16]))
+
+
+def encode_string_table(values):
+    """
+    Encodes a list of values into a string table: a utf-8 blob, the offsets of each value into it and their kinds.
+
+    Strings are stored as is, any other json serializable value is stored as json.
+
+    Parameters:
+        values (list)
+
+    Returns:
+        numpy.array: uint8 blob
+        numpy.array: int64 offsets of shape (len(values) + 1,)
+        numpy.array: uint8 kinds
+    """
+
+    chunks = []
+    kinds = np.zeros((len(values),), dtype=np.uint8)
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            chunks.append(value.encode('utf-8'))
+        else:
+            kinds[i] = JSON_KIND
+            chunks.append(json.dumps(value).encode('utf-8'))
+    offsets = np.zeros((len(values) + 1,), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+    blob = np.frombuffer(b''.join(chunks), dtype=np.uint8)
+    return blob, offsets, kinds
+
+
+class StringTableView(Sequence):
+    """
+    A read-only sequence over a range of a string table (see encode_string_table).
+
+    A value is decoded on every access, so the caller gets its own copy and the shared table is never written to.
+    """
+
+    # Every access returns a new copy, see goal_pool.GoalPool
+    copies_on_access = True
+
+    def __init__(self, blob, offsets, kinds, start=0, stop=None):
+        """
+        The constructor for StringTableView.
+
+        Parameters:
+            blob (numpy.array)
+            offsets (numpy.array)
+            kinds (numpy.array)
+            start (int): The first value of the range. Default: 0
+            stop (int): The end of the range. Default: the end of the table
+        """
+
+        self.blob = blob
+        self.offsets = offsets
+        self.kinds = kinds
+        self.start = start
+        self.stop = len(kinds) if stop is None else stop
+        # Indexing memoryviews returns plain bytes and ints, much faster than indexing the arrays for one value
+        self._blob = memoryview(blob)
+        self._offsets = memoryview(offsets)
+        self._kinds = memoryview(kinds)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Value: {} not in range of the table'.format(i))
+        i += self.start
+        text = str(self._blob[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+        return text if self._kinds[i] == STR_KIND else json.loads(text)
+
+    def __deepcopy__(self, memo):
+        # Immutable, copies would only duplicate the shared memory
+        return self
+
+    def __reduce__(self):
+        # The memoryviews cannot be pickled, they are made again from the arrays
+        return StringTableView, (self.blob, self.offsets, self.kinds, self.start, self.stop)
+
+
+def decode_string_table(blob, offsets, kinds):
+    """
+    Decodes a string table made by encode_string_table back into the list of values.
+
+    Parameters:
+        blob (numpy.array)
+        offsets (numpy.array)
+        kinds (numpy.array)
+
+    Returns:
+        list
+    """
+
+    data = blob.tobytes()
+    offsets = offsets.tolist()
+    values = []
+    for i, kind in enumerate(kinds.tolist()):
+        text = data[offsets[i]:offsets[i + 1]].decode('utf-8')
+        values.append(text if kind == STR_KIND else json.loads(text))
+    return values
+
+
+def string_key(value):
+    """
+    Returns the kind and the utf-8 bytes a value is hashed by in a string index, json values with sorted keys.
+
+    Parameters:
+        value (object)
+
+    Returns:
+        int: STR_KIND or JSON_KIND
+        bytes
+    """
+
+    if isinstance(value, str):
+        return STR_KIND, value.encode('utf-8')
+    return JSON_KIND, json.dumps(value, sort_keys=True).encode('utf-8')
+
+
+def string_hash(value):
+    """
+    Returns the hash of a value in a string index, stable across processes unlike hash().
+
+    Parameters:
+        value (object)
+
+    Returns:
+        int
+    """
+
+    kind, data = string_key(value)
+    return zlib.crc32(data, kind)
+
+
+def build_string_index(values):
+    """
+    Builds the slots of an open addressing hash table from values to their position in a string table, see
+    StringTableIndex.
+
+    Parameters:
+        values (sequence): The values of the string table
+
+    Returns:
+        numpy.array: int32 positions, -1 in empty slots, of a power of two size at least twice len(values)
+    """
+
+    size = 1 << max(len(values) * 2 - 1, 1).bit_length()
+    table = np.full((size,), -1, dtype=np.int32)
+    for i, value in enumerate(values):
+        slot = string_hash(value) & (size - 1)
+        while table[slot] >= 0:
+            slot = (slot + 1) & (size - 1)
+        table[slot] = i
+    return table
+
+
+class StringTableIndex:
+    """
+    Looks up the position of a value in a string table with a hash table of int32 positions (see build_string_index),
+    so it works over shared or memory-mapped arrays without building a dict of the values.
+    """
+
+    def __init__(self, table, values):
+        """
+        The constructor for StringTableIndex.
+
+        Parameters:
+            table (numpy.array): See build_string_index
+            values (StringTableView): The string table
+        """
+
+        self.table = memoryview(table)
+        self.mask = len(table) - 1
+        self.values = values
+
+    def get(self, value, default=None):
+        """
+        Returns the position of a value in the string table like dict.get would.
+
+        Parameters:
+            value (object)
+            default (object): Returned if the value is not in the table. Default: None
+
+        Returns:
+            int
+        """
+
+        try:
+            slot = string_hash(value) & self.mask
+        except TypeError:
+            # Not json serializable, so not in the table
+            return default
+        while self.table[slot] >= 0:
+            i = self.table[slot]
+            if self.values[i] == value:
+                return i
+            slot = (slot + 1) & self.mask
+        return default
+
+
+def database_to_arrays(database):
+    """
+    Flattens a ColumnarDB into named arrays and json serializable metadata.
+
+    Parameters:
+        database (ColumnarDB)
+
+    Returns:
+        dict: dict(string: numpy.array)
+        dict: The metadata
+    """
+
+    arrays = {'has_slot': database.has_slot}
+    arrays['strings'], arrays['string_offsets'], arrays['string_kinds'] = encode_string_table(database.values)
+    for j, slot in enumerate(database.slots):
+        arrays['ids_{}'.format(j)] = database.column_ids[slot]
+        arrays['offsets_{}'.format(j)] = database.column_offsets[slot]
+    meta = {'slots': database.slots, 'list_slots': [slot for slot in database.slots if slot in database.list_slots]}
+    return arrays, meta
+
+
+def database_from_arrays(arrays, meta):
+    """
+    Builds a ColumnarDB on top of the arrays made by database_to_arrays, the arrays are not copied. An optional
+    'value_counts' array is used as is instead of being recomputed. With an optional 'string_index' array (see
+    build_string_index) the values are not decoded up front either: the value dictionary is a StringTableView and values
+    are looked up through a StringTableIndex, e.g. for the shared memory copy of shared_data.SharedData.
+
+    Parameters:
+        arrays (dict): dict(string: numpy.array)
+        meta (dict)
+
+    Returns:
+        ColumnarDB
+    """
+
+    slots = meta['slots']
+    value_index = None
+    if 'string_index' in arrays:
+        values = StringTableView(arrays['strings'], arrays['string_offsets'], arrays['string_kinds'])
+        value_index = StringTableIndex(arrays['string_index'], values)
+    else:
+        values = decode_string_table(arrays['strings'], arrays['string_offsets'], arrays['string_kinds'])
+    column_ids = {slot: arrays['ids_{}'.format(j)] for j, slot in enumerate(slots)}
+    column_offsets = {slot: arrays['offsets_{}'.format(j)] for j, slot in enumerate(slots)}
+    return ColumnarDB(slots, meta['list_slots'], values, column_ids, column_offsets, arrays['has_slot'],
+                      arrays.get('value_counts'), value_index)
+
+
+def compile_file(path, kind, cache_dir=None):
+    """
+    Compiles a source json file into its binary artifact, unless an artifact for the same content already exists.
+
+    A database is stored as one .npy file per array of its ColumnarDB and any other json file (goals, dicts) as the
+    string table of its items (see encode_string_table), so both can be memory-mapped.
+
+    Parameters:
+        path (string): The source json file
+        kind (string): 'database' or 'json'
+        cache_dir (string): Default: None, see artifact_path
+
+    Returns:
+        string: The directory of the artifact
+    """
+
+    dest = artifact_path(path, cache_dir)
+    if os.path.isfile(os.path.join(dest, 'meta.json')):
+        return dest
+
+    content = json.load(open(path, encoding='utf-8'))
+    meta = {'version': FORMAT_VERSION, 'kind': kind, 'source': os.path.basename(path)}
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    # Written to a temp dir then renamed so parallel workers never see a partial artifact
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(dest))
+    try:
+        # mkdtemp makes the dir private, give it the mode os.makedirs would so other users can read the artifact
+        os.chmod(tmp, 0o777 & ~_umask())
+        if kind == 'database':
+            arrays, db_meta = database_to_arrays(ColumnarDB.from_records(content))
+            meta.update(db_meta)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, name + '.npy'), array)
+        elif kind == 'json':
+            # A single value is stored as a table of one item
+            meta['is_list'] = isinstance(content, list)
+            table = encode_string_table(content if meta['is_list'] else [content])
+            for name, array in zip(['strings', 'string_offsets', 'string_kinds'], table):
+                np.save(os.path.join(tmp, name + '.npy'), array)
+        else:
+            raise ValueError('Kind must be database or json, not {}'.format(kind))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp, dest)
+    except OSError:
+        # Another worker won the race, use its artifact
+        if not os.path.isfile(os.path.join(dest, 'meta.json')):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return dest
+
+
+def load_artifact(path, kind, cache_dir=None):
+    """
+    Compiles a source json file if needed and memory-maps the arrays of its artifact.
+
+    Parameters:
+        path (string): The source json file
+        kind (string): 'database' or 'json'
+        cache_dir (string): Default: None, see artifact_path
+
+    Returns:
+        dict: dict(string: numpy.memmap) The read-only arrays
+        dict: The metadata
+    """
+
+    dest = compile_file(path, kind, cache_dir)
+    with open(os.path.join(dest, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {}
+    for file_name in os.listdir(dest):
+        if file_name.endswith('.npy'):
+            arrays[file_name[:-4]] = np.load(os.path.join(dest, file_name), mmap_mode='r')
+    return arrays, meta
+
+
+def load_database(path, cache_dir=None):
+    """
+    Loads a database json file as a ColumnarDB whose arrays are memory-mapped from its compiled artifact.
+
+    Parameters:
+        path (string): The database json file
+        cache_dir (string): Default: None, see artifact_path
+
+    Returns:
+        ColumnarDB
+    """
+
+    return database_from_arrays(*load_artifact(path, 'database', cache_dir))
+
+
+def load_json(path, cache_dir=None):
+    """
+    Loads a json file (user goals or dict) from its compiled artifact.
+
+    A json list is returned as a read-only StringTableView over the memory-mapped string table of its items, every
+    access decodes a fresh copy of an item, so a process only decodes the items it uses (e.g. the goals it draws).
+
+    Parameters:
+        path (string): The json file
+        cache_dir (string): Default: None, see artifact_path
+
+    Returns:
+        StringTableView or object: The items of a json list, any other json value decoded as json.load would
+    """
+
+    arrays, meta = load_artifact(path, 'json', cache_dir)
+    items = StringTableView(arrays['strings'], arrays['string_offsets'], arrays['string_kinds'])
+    return items if meta['is_list'] else items[0]
+
+
+if __name__ == "__main__":
+    # Compile step, e.g. python data_cache.py --database data/activity_db.json --json data/activity_dict.json
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', dest='database', nargs='*', default=[])
+    parser.add_argument('--json', dest='json', nargs='*', default=[])
+    parser.add_argument('--cache_dir', dest='cache_dir', type=str, default=None)
+    args = parser.parse_args()
+
+    for file_path in args.database:
+        print('{} -> {}'.format(file_path, compile_file(file_path, 'database', args.cache_dir)))
+    for file_path in args.json:
+        print('{} -> {}'.format(file_path, compile_file(file_path, 'json', args.cache_dir)))
@@ -0,0 +1,320 @@
+from collections import defaultdict
+import numpy as np
+from bounded_cache import BoundedCache
+from data_cache import encode_string_table, build_string_index, StringTableView, StringTableIndex
+
+# Length of the character n-grams used to shortlist slot values that may contain a constraint value
+NGRAM_SIZE = 3
+# Max number of entries of each cache of the matches of single constraint values
+CACHE_MAX_ENTRIES = 20000
+
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    """
+    Returns the set of character n-grams of a string.
+
+    Parameters:
+        text (string)
+        n (int): Default: NGRAM_SIZE
+
+    Returns:
+        set
+    """
+
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def build_index_arrays(database):
+    """
+    Builds the arrays of the InvertedIndex of a database.
+
+    Only list valued slots are indexed, InvertedIndex matches the few scalar slots with a scan of their values. For
+    the slot j of database.slots, 'values_j' holds its sorted distinct value ids, 'posting_offsets_j' and 'postings_j'
+    the sorted ids of the records that contain each of them in CSR layout, and 'gram_offsets_j' and 'gram_values_j' the
+    positions in values_j of the string values that contain each character n-gram, also in CSR layout. The n-grams
+    themselves are the string table 'grams', 'gram_offsets' and 'gram_kinds' (see data_cache.encode_string_table),
+    hashed in 'gram_index'.
+
+    Parameters:
+        database (ColumnarDB): The columnar database
+
+    Returns:
+        dict: dict(string: numpy.array)
+    """
+
+    num_records = len(database)
+    arrays = {}
+    # {int: {string: list(int)}} For every slot, the positions of the values that contain each n-gram
+    slot_grams = {}
+    for slot in database.slots:
+        if slot not in database.list_slots:
+            continue
+        j = database.slot_index[slot]
+        offsets = database.column_offsets[slot]
+        records = np.repeat(np.arange(num_records, dtype=np.int64), np.diff(offsets))
+        # Sorted distinct (value id, record id) pairs, one int each
+        pairs = np.unique(database.column_ids[slot].astype(np.int64) * max(num_records, 1) + records)
+        value_ids, counts = np.unique(pairs // max(num_records, 1), return_counts=True)
+        arrays['values_{}'.format(j)] = value_ids.astype(np.int32)
+        arrays['posting_offsets_{}'.format(j)] = np.cumsum(np.concatenate([[0], counts]), dtype=np.int64)
+        arrays['postings_{}'.format(j)] = (pairs % max(num_records, 1)).astype(np.int32)
+        slot_grams[j] = defaultdict(list)
+        for position, value_id in enumerate(value_ids.tolist()):
+            value = database.values[value_id]
+            if isinstance(value, str):
+                for gram in char_ngrams(value):
+                    slot_grams[j][gram].append(position)
+
+    grams = sorted({gram for gram_positions in slot_grams.values() for gram in gram_positions})
+    arrays['grams'], arrays['gram_offsets'], arrays['gram_kinds'] = encode_string_table(grams)
+    arrays['gram_index'] = build_string_index(grams)
+    for j, gram_positions in slot_grams.items():
+        positions = [gram_positions.get(gram, []) for gram in grams]
+        arrays['gram_offsets_{}'.format(j)] = np.cumsum([0] + [len(p) for p in positions], dtype=np.int64)
+        arrays['gram_values_{}'.format(j)] = np.array([p for gram_p in positions for p in gram_p], dtype=np.int32)
+    return arrays
+
+
+class InvertedIndex:
+    """
+    An inverted index over the database used by DBQuery to answer constraint queries.
+
+    The postings and n-grams are held in the arrays of build_index_arrays, so the index in shared memory (see
+    shared_data.SharedData) is used by every worker without a copy. Only the caches of the matches grow per process.
+    """
+
+    def __init__(self, database, arrays=None):
+        """
+        The constructor for InvertedIndex.
+
+        Parameters:
+            database (ColumnarDB): The columnar database
+            arrays (dict): The arrays of build_index_arrays, e.g. in shared memory. Default: built from the database
+        """
+
+        self.database = database
+        self.num_records = len(database)
+        self.arrays = build_index_arrays(database) if arrays is None else arrays
+        # {string: tuple} For every indexed slot, its value ids, postings and n-gram arrays (see build_index_arrays)
+        self.slot_arrays = {}
+        # {string: numpy.array} For every slot, a read-only boolean vector of the records that have the slot
+        self.slot_masks = {}
+        for j, slot in enumerate(database.slots):
+            if slot in database.list_slots:
+                self.slot_arrays[slot] = tuple(self.arrays['{}_{}'.format(name, j)] for name in
+                                               ['values', 'posting_offsets', 'postings', 'gram_offsets', 'gram_values'])
+            mask = database.has_slot[:, j]
+            mask.flags.writeable = False
+            self.slot_masks[slot] = mask
+        grams = StringTableView(self.arrays['grams'], self.arrays['gram_offsets'], self.arrays['gram_kinds'])
+        self.gram_index = StringTableIndex(self.arrays['gram_index'], grams)
+        # {string: frozenset(int)} The record ids that have the slot at all, built on first use like all_records
+        self.slot_records = {}
+        self._all_records = None
+        # {(string, string): frozenset(int)} Record ids matching a single constraint value of a slot
+        self.cached_child = BoundedCache(CACHE_MAX_ENTRIES)
+        # {(string, string): numpy.array} Same as cached_child but as boolean vectors over the record ids
+        self.cached_child_mask = BoundedCache(CACHE_MAX_ENTRIES)
+        self.empty_mask = self._ids_to_mask(np.zeros((0,), dtype=np.int32))
+
+    @property
+    def all_records(self):
+        """frozenset(int) The ids of all records."""
+
+        if self._all_records is None:
+            self._all_records = frozenset(range(self.num_records))
+        return self._all_records
+
+    def get_slot_records(self, slot):
+        """
+        Returns the ids of the records that have a slot at all.
+
+        Parameters:
+            slot (string)
+
+        Returns:
+            frozenset: Empty if no record has the slot
+        """
+
+        ids = self.slot_records.get(slot)
+        if ids is None:
+            mask = self.slot_masks.get(slot, self.empty_mask)
+            ids = self.slot_records[slot] = frozenset(np.flatnonzero(mask).tolist())
+        return ids
+
+    def _ids_to_mask(self, ids):
+        """
+        Returns a read-only boolean vector over the record ids with the given ids set.
+
+        Parameters:
+            ids (numpy.array)
+
+        Returns:
+            numpy.array: Of shape (num_records,) and dtype bool
+        """
+
+        mask = np.zeros((self.num_records,), dtype=bool)
+        mask[ids] = True
+        mask.flags.writeable = False
+        return mask
+
+    def match_child(self, slot, child_value):
+        """
+        Returns the ids of the records that have a value in the slot that contains child_value as a substring.
+
+        Parameters:
+            slot (string)
+            child_value (string)
+
+        Returns:
+            frozenset: The matching record ids
+        """
+
+        cache_key = (slot, child_value)
+        cache_return = self.cached_child.get(cache_key)
+        if cache_return is not None:
+            return cache_return
+
+        ids = frozenset(self._child_ids(slot, child_value).tolist())
+        self.cached_child.put(cache_key, ids)
+        return ids
+
+    def _child_ids(self, slot, child_value):
+        """
+        Returns the ids of the records that have a value in the slot that contains child_value as a substring, from the
+        postings of the matching values.
+
+        Parameters:
+            slot (string)
+            child_value (string)
+
+        Returns:
+            numpy.array: The matching record ids, a record is repeated if several of its values match
+        """
+
+        if slot not in self.slot_arrays:
+            return self._scalar_child_ids(slot, child_value)
+        value_ids, posting_offsets, postings = self.slot_arrays[slot][:3]
+        values = self.database.values
+        matched = [postings[posting_offsets[p]:posting_offsets[p + 1]]
+                   for p in self._candidate_values(slot, child_value) if child_value in values[int(value_ids[p])]]
+        return np.concatenate(matched) if matched else np.zeros((0,), dtype=np.int32)
+
+    def _scalar_child_ids(self, slot, child_value):
+        """
+        Returns the ids of the records whose scalar value of the slot matches child_value, from a scan of the distinct
+        values of the slot.
+
+        A scalar value is matched like a list of values would be, by iterating it: a string matches if child_value is
+        a substring of one of its characters, as the original query code did.
+
+        Parameters:
+            slot (string): A slot that is not indexed
+            child_value (string)
+
+        Returns:
+            numpy.array: The matching record ids
+        """
+
+        if slot not in self.slot_masks:
+            return np.zeros((0,), dtype=np.int32)
+        # Every record that has a scalar slot holds exactly one value id for it
+        records = np.flatnonzero(self.slot_masks[slot]).astype(np.int32)
+        value_ids, inverse = np.unique(self.database.column_ids[slot], return_inverse=True)
+        values = self.database.values
+        matches = np.array([any(child_value in part for part in values[int(value_id)]) for value_id in value_ids],
+                           dtype=bool)
+        return records[matches[inverse]]
+
+    def _candidate_values(self, slot, child_value):
+        """
+        Returns a shortlist of the slot's distinct values that may contain child_value as a substring.
+
+        Every value containing child_value also contains all of its n-grams, so the shortlist is the intersection of
+        the n-gram sets. Strings shorter than an n-gram (or non-strings) fall back to all values of the slot.
+
+        Parameters:
+            slot (string): An indexed slot
+            child_value (string)
+
+        Returns:
+            iterable: The positions of the candidate values in the value ids of the slot, they still have to be verified
+        """
+
+        value_ids, _, _, gram_offsets, gram_values = self.slot_arrays[slot]
+        if not isinstance(child_value, str) or len(child_value) < NGRAM_SIZE:
+            return range(len(value_ids))
+
+        gram_sets = []
+        for gram in char_ngrams(child_value):
+            gram_id = self.gram_index.get(gram)
+            if gram_id is None:
+                return ()
+            gram_sets.append(gram_values[gram_offsets[gram_id]:gram_offsets[gram_id + 1]])
+        # Start from the rarest n-gram so the intersection stays small
+        gram_sets.sort(key=len)
+        candidates = gram_sets[0]
+        for gram_set in gram_sets[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, gram_set, assume_unique=True)
+        return candidates.tolist()
+
+    def match_values(self, slot, child_values):
+        """
+        Returns the ids of the records where every child value is a substring of some value in the slot.
+
+        An empty child_values matches every record that has the slot.
+
+        Parameters:
+            slot (string)
+            child_values (list)
+
+        Returns:
+            frozenset: The matching record ids
+        """
+
+        ids = self.get_slot_records(slot)
+        for child_value in child_values:
+            if not ids:
+                break
+            ids = ids & self.match_child(slot, child_value)
+        return ids
+
+    def match_mask(self, slot, child_values):
+        """
+        Bitset version of match_values, returns a boolean vector over the record ids instead of a set.
+
+        Parameters:
+            slot (string)
+            child_values (list)
+
+        Returns:
+            numpy.array: Of shape (num_records,) and dtype bool
+        """
+
+        mask = self.slot_masks.get(slot, self.empty_mask)
+        for child_value in child_values:
+            cache_key = (slot, child_value)
+            child_mask = self.cached_child_mask.get(cache_key)
+            if child_mask is None:
+                child_mask = self._ids_to_mask(self._child_ids(slot, child_value))
+                self.cached_child_mask.put(cache_key, child_mask)
+            mask = mask & child_mask
+        return mask
+
+    def match(self, constraints):
+        """
+        Returns the ids of the records that match all of the constraints, sorted by their position in the database.
+
+        Parameters:
+            constraints (dict): Slots mapped to lists of constraint values
+
+        Returns:
+            list: The matching record ids
+        """
+
+        mask = np.ones((self.num_records,), dtype=bool)
+        for slot, child_values in constraints.items():
+            mask &= self.match_mask(slot, child_values)
+        return np.flatnonzero(mask).tolist()
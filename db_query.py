@@ -1,26 +1,75 @@
 from collections import defaultdict
+from collections.abc import Mapping
 from dialogue_config import no_query_keys, usersim_default_key
-import copy
+from columnar_db import as_columnar
+from bounded_cache import BoundedCache
+import numpy as np
+
+
+class DBResults(Mapping):
+    """A read-only view of the database items with the given ids, the items are only looked up when accessed."""
+
+    def __init__(self, database, ids):
+        """
+        The constructor for DBResults.
+
+        Parameters:
+            database (ColumnarDB): The columnar database
+            ids (numpy.array or list): The ids of the items in the view, in database order
+        """
+
+        self.database = database
+        self.ids = ids
+        self.id_set = None
+
+    def __getitem__(self, key):
+        # Built on first use since most callers only iterate the view
+        if self.id_set is None:
+            self.id_set = set(int(i) for i in self.ids)
+        i = int(key)
+        if i not in self.id_set:
+            raise KeyError(key)
+        return self.database[i]
+
+    def __iter__(self):
+        return (str(i) for i in self.ids)
+
+    def __len__(self):
+        return len(self.ids)
 
 
 class DBQuery:
     """Queries the database for the state tracker."""
 
-    def __init__(self, database):
+    def __init__(self, database, constants=None):
         """
         The constructor for DBQuery.
 
         Parameters:
-            database (dict): The database in the format dict(long: dict)
+            database (list or ColumnarDB): The database in the format list(dict) or the ColumnarDB built from it, pass
+                                           the same ColumnarDB to every component to share it
+            constants (dict): Loaded constants in dict, the optional 'db_query' section configures the query engine.
+                              Default: None
         """
 
-        self.database = database
+        self.C = constants.get('db_query', {}) if constants else {}
+        # Count slot matches with boolean vectors over the record ids instead of sets
+        self.use_bitsets = self.C.get('use_bitsets', True)
+
+        self.database = as_columnar(database)
+        # Both caches are bounded so long runs stay at flat memory, see get_cache_stats for their effectiveness
+        cache_max_entries = self.C.get('cache_max_entries', 20000)
+        cache_max_bytes = self.C.get('cache_max_bytes', None)
+        cache_policy = self.C.get('cache_policy', 'lru')
         # {frozenset: {string: int}} A dict of dicts
-        self.cached_db_slot = defaultdict(dict)
-        # {frozenset: {'#': {'slot': 'value'}}} A dict of dicts of dicts, a dict of DB sub-dicts
-        self.cached_db = defaultdict(dict)
+        self.cached_db_slot = BoundedCache(cache_max_entries, cache_max_bytes, cache_policy)
+        # {frozenset: numpy.array} The ids of the DB items matching each set of constraints
+        self.cached_db = BoundedCache(cache_max_entries, cache_max_bytes, cache_policy)
         self.no_query = no_query_keys
         self.match_key = usersim_default_key
+        # Built once per database so constraint matching is a posting set intersection instead of a scan of the
+        # database, every DBQuery over the same database shares it
+        self.index = self.database.index
 
     def fill_inform_slot(self, inform_slot_to_fill, current_inform_slots):
         """
@@ -44,27 +93,23 @@ class DBQuery:
 
         # This removes the inform we want to fill from the current informs if it is present in the current informs
         # so it can be re-queried
-        current_informs = copy.deepcopy(current_inform_slots)
+        current_informs = dict(current_inform_slots)
         current_informs.pop(key, None)
-        # db_results is a dict of dict in the same exact format as the db, it is just a subset of the db
-        db_results = self.get_db_results(current_informs)
-        db_results_no_empty = {}
-        
+        db_ids = self.get_db_result_ids(current_informs)
+        db_ids_no_empty = []
+
         if key != usersim_default_key:
-            for i, data in db_results.items():
-                if isinstance(data[key], list) and len(data[key]) > 0:
-                    db_results_no_empty[i] = copy.deepcopy(data)
-      
+            db_ids_no_empty = [i for i in db_ids if self.has_slot_value(i, key)]
+
         filled_inform = {}
-        if db_results_no_empty:
-            values_dict = self._count_slot_values(key, db_results_no_empty)
-            # printprint("INFORM: filtered out, values_dict: {}".format(values_dict))
+        if db_ids_no_empty:
+            values_dict = self._count_slot_values(key, db_ids_no_empty)
         else:
-            values_dict = self._count_slot_values(key, db_results)
+            values_dict = self._count_slot_values(key, db_ids)
             # print("INFORM: can not filtered out, values_dict: {}".format(values_dict))
 
         if key == usersim_default_key:
-            filled_inform[key] = list(db_results)[0]
+            filled_inform[key] = str(db_ids[0])
         elif values_dict:
             # Get key with max value (ie slot value with highest count of available results)
             filled_inform[key] = list(max(values_dict, key=values_dict.get))
@@ -73,116 +118,100 @@ class DBQuery:
 
         return filled_inform
 
-    def _count_slot_values(self, key, db_subdict):
+    def has_slot_value(self, i, key):
         """
-        Return a dict of the different values and occurrences of each, given a key, from a sub-dict of database
+        Returns true if the database item with id i has at least one value for the slot key.
 
         Parameters:
-            key (string): The key to be counted
-            db_subdict (dict): A sub-dict of the database
+            i (int)
+            key (string)
 
         Returns:
-            dict: The values and their occurrences given the key
-        """
-
-        slot_values = defaultdict(int)  # init to 0
-        # print(slot_values)
-        for id in db_subdict.keys():
-            current_option_dict = db_subdict[id]
-            # If there is a match
-            if key in current_option_dict.keys():
-                slot_value = current_option_dict[key]
-                # print(slot_value)
-                if any(isinstance(i,list) for i in slot_value):
-                  slot_value = [value for sub_list in slot_value for value in sub_list]
-
-          
-                tp_slot_value = tuple(slot_value)
-                # print(type(tp_slot_value))
-                # This will add 1 to 0 if this is the first time this value has been encountered, or it will add 1
-                # to whatever was already in there
-                slot_values[tp_slot_value] += 1
-        return slot_values
-
-    def check_match_sublist_and_substring(self,list_children,list_parent):
-        # print("match sublist")
-        count_match=0
-        for children_value in list_children:
-            for parent_value in list_parent:
-                if children_value in parent_value:
-                    count_match+=1
-                    break
-        if count_match==len(list_children):
-            # print("match sublist")
-            return True
-        return False
-            
+            bool
+        """
+
+        return self.database.has_value(i, key)
 
+    def get_item(self, i):
+        """
+        Returns the database item with id i.
+
+        Parameters:
+            i (int)
 
+        Returns:
+            dict
+        """
+
+        return self.database[i]
+
+    def _count_slot_values(self, key, db_ids):
+        """
+        Return a dict of the different values and occurrences of each, given a key, from a subset of the database
+
+        Parameters:
+            key (string): The key to be counted
+            db_ids (numpy.array or list): The ids of the subset of the database
+
+        Returns:
+            dict: The values (as tuples) and their occurrences given the key
+        """
+
+        if key not in self.database.slot_index:
+            return {}
+        has_slot = self.database.has_slot[:, self.database.slot_index[key]]
+        # Count on the value ids of the columnar DB then translate only the distinct values
+        value_id_counts = defaultdict(int)  # init to 0
+        for i in db_ids:
+            if has_slot[i]:
+                value_id_counts[tuple(self.database.get_value_ids(i, key).tolist())] += 1
+        values = self.database.values
+        return {tuple(values[value_id] for value_id in value_ids): count
+                for value_ids, count in value_id_counts.items()}
 
     def get_db_results(self, constraints):
         """
         Get all items in the database that fit the current constraints.
 
-        Looks at each item in the database and if its slots contain all constraints and their values match then the item
-        is added to the return dict.
+        Parameters:
+            constraints (dict): The current informs
+
+        Returns:
+            DBResults: A read-only dict like view of the available items in the database, keyed by str(id)
+        """
+
+        return DBResults(self.database, self.get_db_result_ids(constraints))
+
+    def get_db_result_ids(self, constraints):
+        """
+        Get the ids of all items in the database that fit the current constraints.
+
+        Intersects the posting sets of the inverted index for every constraint. Only the compact id arrays are cached,
+        items are looked up by the caller when it needs their fields.
 
         Parameters:
             constraints (dict): The current informs
 
         Returns:
-            dict: The available items in the database
+            numpy.array: Read-only int32 array of the ids of the available items in database order
         """
 
         # Filter non-queryable items and keys with the value 'anything' since those are inconsequential to the constraints
         new_constraints = {k: v for k, v in constraints.items() if k not in self.no_query and 'anything' not in v}
         new_constraints = {k: v for k, v in new_constraints.items() if v != 'no match available'}
         # print("new constraint at get db result: {}".format(new_constraints))
-        tuple_new_constraint=copy.deepcopy(new_constraints)
-        # print(tuple_new_constraint)
-        inform_items ={k:tuple(v) for k,v in tuple_new_constraint.items()}.items()
-        inform_items = frozenset(inform_items)
- 
-        # inform_items = frozenset(new_constraints.items())
-        cache_return = self.cached_db[inform_items]
- 
-        if cache_return == None:
-            # If it is none then no matches fit with the constraints so return an empty dict
-            return {}
-        # if it isnt empty then return what it is
-        if cache_return:
+        inform_items = frozenset((k, tuple(v)) for k, v in new_constraints.items())
+
+        # An empty array is cached too when no matches fit with the constraints
+        cache_return = self.cached_db.get(inform_items)
+        if cache_return is not None:
             return cache_return
-        # else continue on
-
-        available_options = {}
-        # results=[]
-        i=0
-        for data in self.database:
-            check_match=True
-            for constraint_key in list(new_constraints.keys()):
-                if not self.check_match_sublist_and_substring(new_constraints[constraint_key],data[constraint_key]): #check not sublist and substring
-                    check_match=False
-            if check_match:
-                # print("have match result")
-                # results.append(data)
-                available_options.update({str(i):data})
-                self.cached_db[inform_items].update({str(i): data})
-            i+=1
-
-        
-
-        # for result in results:
-        #     available_options.update({str(result['_id']):result})
-        #     self.cached_db[inform_items].update({str(result['_id']): result})
-
-        if not available_options:
-          self.cached_db[inform_items] = None
-
-        #   print("no match: ")
-          # print(new_constraints)
 
- 
-        return available_options
+        db_ids = np.array(self.index.match(new_constraints), dtype=np.int32)
+        db_ids.flags.writeable = False
+        self.cached_db.put(inform_items, db_ids)
+
+        return db_ids
 
     def get_db_results_for_slots(self, current_informs):
         """
@@ -198,14 +227,10 @@ class DBQuery:
             dict: Each key in current_informs with the count of the number of matches for that key
         """
 
-        tuple_current_informs=copy.deepcopy(current_informs)
-        # print(tuple_current_informs)
-        inform_items ={k:tuple(v) for k,v in tuple_current_informs.items()}.items()
-        inform_items = frozenset(inform_items)
-        # # A dict of the inform keys and their counts as stored (or not stored) in the cached_db_slot
-        cache_return = self.cached_db_slot[inform_items]
-        # temp_current_informs=copy.deepcopy(current_informs)
-        if cache_return:
+        inform_items = frozenset((k, tuple(v)) for k, v in current_informs.items())
+        # A dict of the inform keys and their counts as stored (or not stored) in the cached_db_slot
+        cache_return = self.cached_db_slot.get(inform_items)
+        if cache_return is not None:
             return cache_return
  
         # If it made it down here then a new query was made and it must add it to cached_db_slot and return it
@@ -215,32 +240,41 @@ class DBQuery:
 
 
 
-        for data in self.database:
-            all_slots_match = True
-            for CI_key, CI_value in current_informs.items():
-                # Skip if a no query item and all_slots_match stays true
-                if CI_key in self.no_query:
-                    continue
-                # If anything all_slots_match stays true AND the specific key slot gets a +1
-                if 'anything' in CI_value:
-                    db_results[CI_key] += 1
-                    continue
-                if CI_key in list(data.keys()):
-                    # print("-----------------CI_value")
-                    # print(type(CI_value))
-                    # print("-----------------data[CI_key]")
-                    # print(type(data[CI_key]))
-                    if self.check_match_sublist_and_substring(CI_value,data[CI_key]):
-                        db_results[CI_key] += 1
-                    else:
-                        all_slots_match = False
-                else:
-                    all_slots_match = False
-            if all_slots_match: db_results['matching_all_constraints'] += 1
-
-
-
-        # update cache (set the empty dict)
-        self.cached_db_slot[inform_items].update(db_results)
-        assert self.cached_db_slot[inform_items] == db_results
+        if self.use_bitsets:
+            all_slots_match = np.ones((self.index.num_records,), dtype=bool)
+        else:
+            all_slots_match = self.index.all_records
+        for CI_key, CI_value in current_informs.items():
+            # Skip if a no query item and all_slots_match stays the same
+            if CI_key in self.no_query:
+                continue
+            # If anything all_slots_match stays the same AND the specific key slot counts every item
+            if 'anything' in CI_value:
+                db_results[CI_key] += self.index.num_records
+                continue
+            if self.use_bitsets:
+                matches = self.index.match_mask(CI_key, CI_value)
+                db_results[CI_key] += int(np.count_nonzero(matches))
+                all_slots_match &= matches
+            else:
+                matches = self.index.match_values(CI_key, CI_value)
+                db_results[CI_key] += len(matches)
+                all_slots_match = all_slots_match & matches
+        if self.use_bitsets:
+            db_results['matching_all_constraints'] = int(np.count_nonzero(all_slots_match))
+        else:
+            db_results['matching_all_constraints'] = len(all_slots_match)
+
+        # update cache
+        self.cached_db_slot.put(inform_items, db_results)
         return db_results
+
+    def get_cache_stats(self):
+        """
+        Returns the hit, miss and eviction counters and the current size of both query caches.
+
+        Returns:
+            dict: dict('db': dict, 'db_slot': dict) with the stats of cached_db and cached_db_slot
+        """
+
+        return {'db': self.cached_db.stats(), 'db_slot': self.cached_db_slot.stats()}
@@ -1,20 +1,23 @@
 from keras.models import Sequential
 from keras.layers import Dense
 from keras.optimizers import Adam
-import random, copy
 import numpy as np
-from dialogue_config import rule_requests, agent_actions
+from dqn_policy import DQNPolicy
+from replay_memory import ReplayMemory
 import re
 
+# The batch size keras' fit uses by default, the original fit(epochs=1) took one gradient step per this many samples
+FIT_BATCH_SIZE = 32
+
 
 # Some of the code based off of https://jaromiru.com/2016/09/27/lets-make-a-dqn-theory/
 # Note: In original paper's code the epsilon is not annealed and annealing is not implemented in this code either
 
 
-class DQNAgent:
-    """The DQN agent that interacts with the user."""
+class DQNAgent(DQNPolicy):
+    """The DQN agent that interacts with the user, acts through DQNPolicy and owns the keras models and memory."""
 
-    def __init__(self, state_size, constants):
+    def __init__(self, state_size, constants, rng=None, memory_rng=None):
         """
         The constructor of DQNAgent.
 
@@ -23,14 +26,14 @@ class DQNAgent:
         Parameters:
             state_size (int): The state representation size or length of numpy array
             constants (dict): Loaded constants in dict
+            rng (random.Random): The exploration stream, see DQNPolicy. Default: None
+            memory_rng (numpy.random.Generator): The replay sampling stream, see ReplayMemory. Default: None
 
         """
 
+        super().__init__(constants, rng)
         self.C = constants['agent']
-        self.memory = []
-        self.memory_index = 0
         self.max_memory_size = self.C['max_mem_size']
-        self.eps = self.C['epsilon_init']
         self.vanilla = self.C['vanilla']
         self.lr = self.C['learning_rate']
         self.gamma = self.C['gamma']
@@ -44,18 +47,13 @@ class DQNAgent:
             raise ValueError('Max memory size must be at least as great as batch size!')
 
         self.state_size = state_size
-        self.possible_actions = agent_actions
-        self.num_actions = len(self.possible_actions)
-
-        self.rule_request_set = rule_requests
+        self.memory = ReplayMemory(self.max_memory_size, self.state_size, memory_rng)
 
         self.beh_model = self._build_model()
         self.tar_model = self._build_model()
 
         self._load_weights()
 
-        self.reset()
-
     def _build_model(self):
         """Builds and returns model/graph of neural network."""
 
@@ -66,128 +64,33 @@ class DQNAgent:
         model.compile(loss='mse', optimizer=Adam(lr=self.lr))
         return model
 
-    def reset(self):
-        """Resets the rule-based variables."""
-
-        self.rule_current_slot_index = 0
-        self.rule_phase = 'not done'
-
-    def get_action(self, state, use_rule=False):
-        """
-        Returns the action of the agent given a state.
-
-        Gets the action of the agent given the current state. Either the rule-based policy or the neural networks are
-        used to respond.
-
-        Parameters:
-            state (numpy.array): The database with format dict(long: dict)
-            use_rule (bool): Indicates whether or not to use the rule-based policy, which depends on if this was called
-                             in warmup or training. Default: False
-
-        Returns:
-            int: The index of the action in the possible actions
-            dict: The action/response itself
-
-        """
-
-        if self.eps > random.random():
-            index = random.randint(0, self.num_actions - 1)
-            action = self._map_index_to_action(index)
-            return index, action
-        else:
-            if use_rule:
-                return self._rule_action()
-            else:
-                return self._dqn_action(state)
-
-    def _rule_action(self):
-        """
-        Returns a rule-based policy action.
-
-        Selects the next action of a simple rule-based policy.
-
-        Returns:
-            int: The index of the action in the possible actions
-            dict: The action/response itself
-
-        """
-
-        if self.rule_current_slot_index < len(self.rule_request_set):
-            slot = self.rule_request_set[self.rule_current_slot_index]
-            self.rule_current_slot_index += 1
-            rule_response = {'intent': 'request', 'inform_slots': {}, 'request_slots': {slot: 'UNK'}}
-        elif self.rule_phase == 'not done':
-            rule_response = {'intent': 'match_found', 'inform_slots': {}, 'request_slots': {}}
-            self.rule_phase = 'done'
-        elif self.rule_phase == 'done':
-            rule_response = {'intent': 'done', 'inform_slots': {}, 'request_slots': {}}
-        else:
-            raise Exception('Should not have reached this clause')
-
-        index = self._map_action_to_index(rule_response)
-        return index, rule_response
-
-    def _map_action_to_index(self, response):
-        """
-        Maps an action to an index from possible actions.
-
-        Parameters:
-            response (dict)
-
-        Returns:
-            int
-        """
-
-        for (i, action) in enumerate(self.possible_actions):
-            if response == action:
-                return i
-        raise ValueError('Response: {} not found in possible actions'.format(response))
-
-    def _dqn_action(self, state):
+    def _dqn_predict_one(self, state, target=False):
         """
-        Returns a behavior model output given a state.
+        Returns a model prediction given a state, the behavior model prediction runs in NumPy (see DQNPolicy).
 
         Parameters:
             state (numpy.array)
+            target (bool)
 
         Returns:
-            int: The index of the action in the possible actions
-            dict: The action/response itself
-        """
-
-        index = np.argmax(self._dqn_predict_one(state))
-        action = self._map_index_to_action(index)
-        return index, action
-
-    def _map_index_to_action(self, index):
-        """
-        Maps an index to an action in possible actions.
-
-        Parameters:
-            index (int)
-
-        Returns:
-            dict
+            numpy.array
         """
 
-        for (i, action) in enumerate(self.possible_actions):
-            if index == i:
-                return copy.deepcopy(action)
-        raise ValueError('Index: {} not in range of possible actions'.format(index))
+        if target:
+            return self._dqn_predict(state.reshape(1, self.state_size), target=target).flatten()
+        return super()._dqn_predict_one(state)
 
-    def _dqn_predict_one(self, state, target=False):
+    def get_inference_weights(self):
         """
-        Returns a model prediction given a state.
-
-        Parameters:
-            state (numpy.array)
-            target (bool)
+        Returns the behavior model weights as float32 NumPy arrays, extracted again only after the model changed.
 
         Returns:
-            numpy.array
+            list: Kernel then bias for each layer, see utils.mlp_forward
         """
 
-        return self._dqn_predict(state.reshape(1, self.state_size), target=target).flatten()
+        if self.inference_weights is None:
+            self.set_inference_weights(self.beh_model.get_weights())
+        return self.inference_weights
 
     def _dqn_predict(self, states, target=False):
         """
@@ -201,10 +104,11 @@ class DQNAgent:
             numpy.array
         """
 
+        # predict_on_batch skips the batching and callback setup of predict, the states always fit in one batch here
         if target:
-            return self.tar_model.predict(states)
+            return np.array(self.tar_model.predict_on_batch(states))
         else:
-            return self.beh_model.predict(states)
+            return np.array(self.beh_model.predict_on_batch(states))
 
     def add_experience(self, state, action, reward, next_state, done):
         """
@@ -219,21 +123,17 @@ class DQNAgent:
 
         """
 
-        if len(self.memory) < self.max_memory_size:
-            self.memory.append(None)
-        self.memory[self.memory_index] = (state, action, reward, next_state, done)
-        self.memory_index = (self.memory_index + 1) % self.max_memory_size
+        self.memory.add(state, action, reward, next_state, done)
 
     def empty_memory(self):
         """Empties the memory and resets the memory index."""
 
-        self.memory = []
-        self.memory_index = 0
+        self.memory.clear()
 
     def is_memory_full(self):
         """Returns true if the memory is full."""
 
-        return len(self.memory) == self.max_memory_size
+        return self.memory.is_full()
 
     def train(self):
         """
@@ -247,33 +147,61 @@ class DQNAgent:
         # Calc. num of batches to run
         num_batches = len(self.memory) // self.batch_size
         for b in range(num_batches):
-            batch = random.sample(self.memory, self.batch_size)
-
-            states = np.array([sample[0] for sample in batch])
-            next_states = np.array([sample[3] for sample in batch])
+            states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
 
             assert states.shape == (self.batch_size, self.state_size), 'States Shape: {}'.format(states.shape)
             assert next_states.shape == states.shape
 
-            beh_state_preds = self._dqn_predict(states)  # For leveling error
-            if not self.vanilla:
-                beh_next_states_preds = self._dqn_predict(next_states)  # For indexing for DDQN
+            beh_next_states_preds = None
+            if self.vanilla:
+                beh_state_preds = self._dqn_predict(states)  # For leveling error
+            else:
+                # One behavior model call on [states; next_states], the next states are for indexing for DDQN
+                beh_preds = self._dqn_predict(np.concatenate([states, next_states]))
+                beh_state_preds, beh_next_states_preds = beh_preds[:self.batch_size], beh_preds[self.batch_size:]
             tar_next_state_preds = self._dqn_predict(next_states, target=True)  # For target value for DQN (& DDQN)
 
-            inputs = np.zeros((self.batch_size, self.state_size))
-            targets = np.zeros((self.batch_size, self.num_actions))
+            targets = self._bellman_targets(beh_state_preds, actions, rewards, dones, tar_next_state_preds,
+                                            beh_next_states_preds)
+
+            # The gradient steps of fit(epochs=1) through the compiled train function, without the setup cost of fit
+            for start in range(0, self.batch_size, FIT_BATCH_SIZE):
+                self.beh_model.train_on_batch(states[start:start + FIT_BATCH_SIZE],
+                                              targets[start:start + FIT_BATCH_SIZE])
 
-            for i, (s, a, r, s_, d) in enumerate(batch):
-                t = beh_state_preds[i]
-                if not self.vanilla:
-                    t[a] = r + self.gamma * tar_next_state_preds[i][np.argmax(beh_next_states_preds[i])] * (not d)
-                else:
-                    t[a] = r + self.gamma * np.amax(tar_next_state_preds[i]) * (not d)
+        # The behavior model changed
+        self.inference_weights = None
 
-                inputs[i] = s
-                targets[i] = t
+    def _bellman_targets(self, beh_state_preds, actions, rewards, dones, tar_next_state_preds,
+                         beh_next_states_preds=None):
+        """
+        Returns the Q-Learning targets of a batch, computed for the whole batch at once.
+
+        The target of each sample is its behavior model prediction with the value of the action taken replaced by the
+        Bellman equation. The next state value is the max of the target model (DQN) or the target model value of the
+        behavior model's best action (DDQN) and is 0 if done.
+
+        Parameters:
+            beh_state_preds (numpy.array): Behavior model predictions of the states, overwritten with the targets
+            actions (numpy.array)
+            rewards (numpy.array)
+            dones (numpy.array)
+            tar_next_state_preds (numpy.array): Target model predictions of the next states
+            beh_next_states_preds (numpy.array): Behavior model predictions of the next states, only for DDQN.
+                                                 Default: None
 
-            self.beh_model.fit(inputs, targets, epochs=1, verbose=0)
+        Returns:
+            numpy.array: The targets of shape (batch size, num actions)
+        """
+
+        if beh_next_states_preds is not None:
+            best_next_actions = np.argmax(beh_next_states_preds, axis=1)
+            next_values = np.take_along_axis(tar_next_state_preds, best_next_actions[:, None], axis=1)[:, 0]
+        else:
+            next_values = np.amax(tar_next_state_preds, axis=1)
+        targets = beh_state_preds
+        targets[np.arange(len(actions)), actions] = rewards + self.gamma * next_values * ~dones
+        return targets
 
     def copy(self):
         """Copies the behavior model's weights into the target model's weights."""
@@ -297,5 +225,6 @@ class DQNAgent:
             return
         beh_load_file_path = re.sub(r'\.h5', r'_beh.h5', self.load_weights_file_path)
         self.beh_model.load_weights(beh_load_file_path)
+        self.inference_weights = None
         tar_load_file_path = re.sub(r'\.h5', r'_tar.h5', self.load_weights_file_path)
         self.tar_model.load_weights(tar_load_file_path)
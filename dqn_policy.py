@@ -0,0 +1,312 @@
+from types import MappingProxyType
+import random
+import numpy as np
+from dialogue_config import rule_requests, agent_actions
+from utils import mlp_forward
+from frame import Frame, intern_slots
+
+
+class RuleState:
+    """The progress of the rule-based policy through an episode, used to run the policy for several dialogues at once."""
+
+    def __init__(self):
+        """The constructor for RuleState."""
+
+        self.reset()
+
+    def reset(self):
+        """Resets the rule-based variables."""
+
+        self.rule_current_slot_index = 0
+        self.rule_phase = 'not done'
+
+
+class ActionTable:
+    """
+    The possible actions compiled once into immutable templates and a hashable key to index map.
+
+    Mapping an action to its index is a dict lookup and an index to its action is a new Frame with copies of the
+    template's slot dicts, which is all a deep copy would copy since the slot values are strings.
+    """
+
+    def __init__(self, actions):
+        """
+        The constructor of ActionTable.
+
+        Parameters:
+            actions (list): Of dict, the possible actions in index order
+        """
+
+        self.templates = tuple(MappingProxyType({
+            'intent': action['intent'],
+            'inform_slots': MappingProxyType(intern_slots(action['inform_slots'])),
+            'request_slots': MappingProxyType(intern_slots(action['request_slots']))}) for action in actions)
+        self.indices = {}
+        for i, action in enumerate(actions):
+            # The first equal action wins, like a linear scan would
+            self.indices.setdefault(self.action_key(action), i)
+
+    def __len__(self):
+        return len(self.templates)
+
+    @staticmethod
+    def action_key(action):
+        """
+        Returns the hashable key of an action, equal actions have equal keys.
+
+        Parameters:
+            action (dict or Frame)
+
+        Returns:
+            frozenset
+        """
+
+        return frozenset((key, frozenset(value.items())) if isinstance(value, dict) else (key, value)
+                         for key, value in action.items())
+
+    def index_of(self, action):
+        """
+        Maps an action to its index.
+
+        Parameters:
+            action (dict or Frame)
+
+        Returns:
+            int
+        """
+
+        index = self.indices.get(self.action_key(action))
+        if index is None:
+            raise ValueError('Response: {} not found in possible actions'.format(action))
+        return index
+
+    def instantiate(self, index):
+        """
+        Returns a new action from the template at index, the caller is free to edit it.
+
+        Parameters:
+            index (int)
+
+        Returns:
+            Frame
+        """
+
+        if not 0 <= index < len(self.templates):
+            raise ValueError('Index: {} not in range of possible actions'.format(index))
+        template = self.templates[index]
+        return Frame(template['intent'], dict(template['inform_slots']), dict(template['request_slots']))
+
+
+# Compiled once for every policy
+action_table = ActionTable(agent_actions)
+
+
+class DQNPolicy:
+    """The acting side of the DQN agent: epsilon-greedy over a NumPy copy of the behavior network or the rule-based
+    policy. It does not need keras so it can also run in actor processes."""
+
+    def __init__(self, constants, rng=None):
+        """
+        The constructor of DQNPolicy.
+
+        Parameters:
+            constants (dict): Loaded constants in dict
+            rng (random.Random): The exploration stream, see seeding.EnvStreams. Default: None, the global random module
+
+        """
+
+        self.random = rng if rng is not None else random
+        self.eps = constants['agent']['epsilon_init']
+        self.possible_actions = agent_actions
+        self.action_table = action_table
+        self.num_actions = len(self.action_table)
+        self.rule_request_set = rule_requests
+        # The indices of the actions of the rule-based policy
+        self.rule_request_indices = [
+            self._map_action_to_index({'intent': 'request', 'inform_slots': {}, 'request_slots': {slot: 'UNK'}})
+            for slot in self.rule_request_set]
+        self.match_found_index = self._map_action_to_index({'intent': 'match_found', 'inform_slots': {},
+                                                            'request_slots': {}})
+        self.done_index = self._map_action_to_index({'intent': 'done', 'inform_slots': {}, 'request_slots': {}})
+        # NumPy copy of the behavior model weights, see utils.mlp_forward
+        self.inference_weights = None
+        self.reset()
+
+    def reset(self):
+        """Resets the rule-based variables."""
+
+        self.rule_current_slot_index = 0
+        self.rule_phase = 'not done'
+
+    def get_action(self, state, use_rule=False):
+        """
+        Returns the action of the agent given a state.
+
+        Gets the action of the agent given the current state. Either the rule-based policy or the neural networks are
+        used to respond.
+
+        Parameters:
+            state (numpy.array): The database with format dict(long: dict)
+            use_rule (bool): Indicates whether or not to use the rule-based policy, which depends on if this was called
+                             in warmup or training. Default: False
+
+        Returns:
+            int: The index of the action in the possible actions
+            dict: The action/response itself
+
+        """
+
+        if self.eps > self.random.random():
+            index = self.random.randint(0, self.num_actions - 1)
+            action = self._map_index_to_action(index)
+            return index, action
+        else:
+            if use_rule:
+                return self._rule_action()
+            else:
+                return self._dqn_action(state)
+
+    def get_actions(self, states, use_rule=False, rule_states=None, rngs=None):
+        """
+        Returns the actions of the agent given the states of several dialogues, the batched version of get_action.
+
+        The behavior model runs once on all the states that are not explored at random.
+
+        Parameters:
+            states (numpy.array): The states of the dialogues, of shape (num dialogues, state size)
+            use_rule (bool): Indicates whether or not to use the rule-based policy. Default: False
+            rule_states (list): A RuleState per dialogue, required if use_rule. Default: None
+            rngs (list): An exploration stream (random.Random) per dialogue, so the exploration of a dialogue does not
+                         depend on the other dialogues in the batch. Default: None, the policy's own stream
+
+        Returns:
+            list: Of tuple(int, dict), the index of the action and the action itself for each dialogue
+        """
+
+        if rngs is None:
+            rngs = [self.random] * len(states)
+        explore = [self.eps > rng.random() for rng in rngs]
+        q_values = None
+        if not use_rule and not all(explore):
+            q_values = mlp_forward(states, self.get_inference_weights())
+
+        actions = []
+        for i, explore_i in enumerate(explore):
+            if explore_i:
+                index = rngs[i].randint(0, self.num_actions - 1)
+                actions.append((index, self._map_index_to_action(index)))
+            elif use_rule:
+                actions.append(self._rule_action(rule_states[i]))
+            else:
+                index = np.argmax(q_values[i])
+                actions.append((index, self._map_index_to_action(index)))
+        return actions
+
+    def _rule_action(self, rule_state=None):
+        """
+        Returns a rule-based policy action.
+
+        Selects the next action of a simple rule-based policy.
+
+        Parameters:
+            rule_state (RuleState): The progress of the policy in the dialogue, if None the agent's own progress is
+                                    used. Default: None
+
+        Returns:
+            int: The index of the action in the possible actions
+            dict: The action/response itself
+
+        """
+
+        if rule_state is None:
+            rule_state = self
+        if rule_state.rule_current_slot_index < len(self.rule_request_set):
+            # Request the next slot
+            index = self.rule_request_indices[rule_state.rule_current_slot_index]
+            rule_state.rule_current_slot_index += 1
+        elif rule_state.rule_phase == 'not done':
+            index = self.match_found_index
+            rule_state.rule_phase = 'done'
+        elif rule_state.rule_phase == 'done':
+            index = self.done_index
+        else:
+            raise Exception('Should not have reached this clause')
+
+        return index, self._map_index_to_action(index)
+
+    def _map_action_to_index(self, response):
+        """
+        Maps an action to an index from possible actions.
+
+        Parameters:
+            response (dict)
+
+        Returns:
+            int
+        """
+
+        return self.action_table.index_of(response)
+
+    def _dqn_action(self, state):
+        """
+        Returns a behavior model output given a state.
+
+        Parameters:
+            state (numpy.array)
+
+        Returns:
+            int: The index of the action in the possible actions
+            dict: The action/response itself
+        """
+
+        index = np.argmax(self._dqn_predict_one(state))
+        action = self._map_index_to_action(index)
+        return index, action
+
+    def _map_index_to_action(self, index):
+        """
+        Maps an index to a new copy of the action in possible actions.
+
+        Parameters:
+            index (int)
+
+        Returns:
+            dict
+        """
+
+        return self.action_table.instantiate(index)
+
+    def _dqn_predict_one(self, state):
+        """
+        Returns a behavior model prediction given a state.
+
+        Runs directly in NumPy, which for a network this small is much faster than going through keras.
+
+        Parameters:
+            state (numpy.array)
+
+        Returns:
+            numpy.array
+        """
+
+        return mlp_forward(state.reshape(1, -1), self.get_inference_weights()).flatten()
+
+    def get_inference_weights(self):
+        """
+        Returns the behavior model weights as float32 NumPy arrays.
+
+        Returns:
+            list: Kernel then bias for each layer, see utils.mlp_forward
+        """
+
+        return self.inference_weights
+
+    def set_inference_weights(self, weights):
+        """
+        Sets the behavior model weights used to act.
+
+        Parameters:
+            weights (list): Kernel then bias for each layer, see utils.mlp_forward
+        """
+
+        self.inference_weights = [np.asarray(w, dtype=np.float32) for w in weights]
@@ -1,11 +1,12 @@
 import random
+import numpy as np
 from dialogue_config import usersim_intents
 
 
 class ErrorModelController:
     """Adds error to the user action."""
 
-    def __init__(self, db_dict, constants):
+    def __init__(self, db_dict, constants, rng=None, batch_rng=None):
         """
         The constructor for ErrorModelController.
 
@@ -13,8 +14,11 @@ class ErrorModelController:
 
         Parameters:
             db_dict (dict): The database dict with format dict(string: list) where each key is the slot name and
-                            the list is of possible values
+                            the list is of possible values, or a read-only view of it like shared_data.SlotValuesView
             constants (dict): Loaded constants in dict
+            rng (random.Random): The random stream of infuse_error, see seeding.EnvStreams. Default: the global
+                                 random module
+            batch_rng (numpy.random.Generator): The generator of infuse_errors. Default: a new unseeded generator
         """
 
         self.movie_dict = db_dict
@@ -22,6 +26,12 @@ class ErrorModelController:
         self.slot_error_mode = constants['emc']['slot_error_mode']  # [0, 3]
         self.intent_error_prob = constants['emc']['intent_error_prob']
         self.intents = usersim_intents
+        # Precomputed slot and value count arrays used to pick the noise
+        self.slots = list(self.movie_dict.keys())
+        self.slot_index = {slot: j for j, slot in enumerate(self.slots)}
+        self.value_counts = np.array([len(self.movie_dict[slot]) for slot in self.slots], dtype=np.int64)
+        self.random = rng if rng is not None else random
+        self.batch_rng = batch_rng if batch_rng is not None else np.random.default_rng()
 
     def infuse_error(self, frame):
         """
@@ -31,7 +41,7 @@ class ErrorModelController:
         replace slot and its values, delete a slot or do all three. It can also randomize the intent.
 
         Parameters:
-            frame (dict): format dict('intent': '', 'inform_slots': {}, 'request_slots': {}, 'round': int,
+            frame (Frame): Or a dict, format dict('intent': '', 'inform_slots': {}, 'request_slots': {}, 'round': int,
                           'speaker': 'User')
         """
 
@@ -42,7 +52,7 @@ class ErrorModelController:
             if key == 'activity':
                 continue
             assert key in self.movie_dict
-            if random.random() < self.slot_error_prob:
+            if self.random.random() < self.slot_error_prob:
                 if self.slot_error_mode == 0:  # replace the slot_value only
                     self._slot_value_noise(key, informs_dict)
                 elif self.slot_error_mode == 1:  # replace slot and its values
@@ -50,15 +60,102 @@ class ErrorModelController:
                 elif self.slot_error_mode == 2:  # delete the slot
                     self._slot_remove(key, informs_dict)
                 else:  # Combine all three
-                    rand_choice = random.random()
+                    rand_choice = self.random.random()
                     if rand_choice <= 0.33:
                         self._slot_value_noise(key, informs_dict)
                     elif rand_choice > 0.33 and rand_choice <= 0.66:
                         self._slot_noise(key, informs_dict)
                     else:
                         self._slot_remove(key, informs_dict)
-        if random.random() < self.intent_error_prob:  # add noise for intent level
-            frame['intent'] = random.choice(self.intents)
+        if self.random.random() < self.intent_error_prob:  # add noise for intent level
+            frame['intent'] = self.random.choice(self.intents)
+
+    def infuse_errors(self, frames, rngs=None):
+        """
+        Batched version of infuse_error, adds error to several frames at once.
+
+        The same modes and probabilities apply, but every random decision of the batch (which slots get an error, the
+        error of mode 3, the new slots and values and the intent errors) is drawn in bulk from self.batch_rng. The
+        frames are then edited in order.
+
+        Parameters:
+            frames (list): Of frames like in infuse_error
+            rngs (list): A numpy.random.Generator per frame, if given the decisions of every frame are drawn from its
+                         own generator so they do not depend on the other frames in the batch. Default: None
+        """
+
+        if not frames:
+            return
+        keys = []
+        num_keys = []
+        for frame in frames:
+            frame_keys = [key for key in frame['inform_slots'] if key != 'activity']
+            for key in frame_keys:
+                assert key in self.slot_index
+            keys += frame_keys
+            num_keys.append(len(frame_keys))
+
+        if rngs is None:
+            draws = self._draw_noise(self.batch_rng, keys, len(frames))
+        else:
+            frame_draws = []
+            k = 0
+            for rng, num in zip(rngs, num_keys):
+                frame_draws.append(self._draw_noise(rng, keys[k:k + num], 1))
+                k += num
+            draws = [np.concatenate(arrays) for arrays in zip(*frame_draws)]
+        errors, modes, values, new_slots, new_values, intent_errors, new_intents = draws
+
+        k = 0
+        for f, frame in enumerate(frames):
+            informs_dict = frame['inform_slots']
+            for key in keys[k:k + num_keys[f]]:
+                if errors[k]:
+                    if modes[k] == 0:  # replace the slot_value only
+                        informs_dict[key] = [self.movie_dict[key][values[k]]]
+                    elif modes[k] == 1:  # replace slot and its values
+                        informs_dict.pop(key)
+                        new_slot = self.slots[new_slots[k]]
+                        informs_dict[new_slot] = [self.movie_dict[new_slot][new_values[k]]]
+                    else:  # delete the slot
+                        informs_dict.pop(key)
+                k += 1
+            if intent_errors[f]:  # add noise for intent level
+                frame['intent'] = self.intents[new_intents[f]]
+
+    def _draw_noise(self, rng, keys, num_frames):
+        """
+        Draws the random decisions of infuse_errors in bulk.
+
+        Parameters:
+            rng (numpy.random.Generator)
+            keys (list): The inform slots of the frames, in order
+            num_frames (int)
+
+        Returns:
+            numpy.array: Per key, true if the slot gets an error
+            numpy.array: Per key, the error: 0, 1 or 2 for replace the value, replace the slot or delete the slot
+            numpy.array: Per key, the index of the new value for error 0
+            numpy.array: Per key, the index of the new slot for error 1
+            numpy.array: Per key, the index of the value of the new slot for error 1
+            numpy.array: Per frame, true if the intent gets an error
+            numpy.array: Per frame, the index of the new intent
+        """
+
+        n = len(keys)
+        errors = rng.random(n) < self.slot_error_prob
+        if self.slot_error_mode in (0, 1, 2):
+            modes = np.full((n,), self.slot_error_mode)
+        else:
+            # Combine all three with the thresholds of infuse_error
+            modes = np.digitize(rng.random(n), [0.33, 0.66], right=True)
+        key_counts = self.value_counts[np.array([self.slot_index[key] for key in keys], dtype=np.intp)]
+        values = (rng.random(n) * key_counts).astype(np.intp)
+        new_slots = rng.integers(len(self.slots), size=n)
+        new_values = (rng.random(n) * self.value_counts[new_slots]).astype(np.intp)
+        intent_errors = rng.random(num_frames) < self.intent_error_prob
+        new_intents = rng.integers(len(self.intents), size=num_frames)
+        return errors, modes, values, new_slots, new_values, intent_errors, new_intents
 
     def _slot_value_noise(self, key, informs_dict):
         """
@@ -69,7 +166,7 @@ class ErrorModelController:
             informs_dict (dict)
         """
 
-        informs_dict[key] = [random.choice(self.movie_dict[key])]
+        informs_dict[key] = [self.random.choice(self.movie_dict[key])]
 
     def _slot_noise(self, key, informs_dict):
         """
@@ -81,8 +178,8 @@ class ErrorModelController:
         """
 
         informs_dict.pop(key)
-        random_slot = random.choice(list(self.movie_dict.keys()))
-        informs_dict[random_slot] = [random.choice(self.movie_dict[random_slot])]
+        random_slot = self.random.choice(self.slots)
+        informs_dict[random_slot] = [self.random.choice(self.movie_dict[random_slot])]
 
     def _slot_remove(self, key, informs_dict):
         """
@@ -0,0 +1,329 @@
+import argparse, collections, concurrent.futures, gzip, itertools, json, os, time
+import multiprocessing as mp
+from dqn_policy import DQNPolicy
+from rollout import BatchRollout
+from data_cache import load_database, load_json
+from shared_data import SharedData
+from seeding import root_entropy
+from utils import check_keras_free
+
+
+def _frame_record(action):
+    """
+    Returns an action (Frame or dict) as a dict for a transcript, with its slot dicts copied.
+
+    Parameters:
+        action (Frame or dict)
+
+    Returns:
+        dict
+    """
+
+    return {key: dict(value) if isinstance(value, dict) else value for key, value in action.items()}
+
+
+class EvalRollout(BatchRollout):
+    """
+    Runs a fixed number of episodes in lockstep without learning and tallies them.
+
+    The first num_episodes episodes started are counted. A dialogue whose counted episode ends starts another one,
+    which is played but not counted, until every counted episode has ended, so short episodes are not favored.
+    """
+
+    def __init__(self, policy, goal_list, database, db_dict, constants, num_envs, num_episodes, transcripts=False,
+                 env_offset=0, seed_entropy=None):
+        """
+        The constructor for EvalRollout.
+
+        Parameters:
+            policy (DQNPolicy): The policy to evaluate, acts as is (set its eps to 0. for a greedy policy)
+            goal_list (list or GoalPool): User goals loaded from file, or the GoalPool compiled from them
+            database (ColumnarDB): The database
+            db_dict (dict): The database dict used by the error model controller
+            constants (dict): Loaded constants in dict
+            num_envs (int): The number of dialogues to run in lockstep
+            num_episodes (int): The number of episodes to count
+            transcripts (bool): Keep the actions of every counted episode. Default: False
+            env_offset (int): See BatchRollout. Default: 0
+            seed_entropy (int): See BatchRollout. Default: None
+        """
+
+        super().__init__(policy, goal_list, database, db_dict, constants, min(num_envs, num_episodes), env_offset,
+                         seed_entropy)
+        self.num_episodes = num_episodes
+        self.keep_transcripts = transcripts
+        self.started = 0
+        # The episode number of the episode each dialogue is playing, None if it is not counted
+        self.episode_ids = [None] * self.num_envs
+        self.turns = [0] * self.num_envs
+        self.actions = [[] for _ in range(self.num_envs)]
+        self.tallies = new_tallies()
+        self.transcripts = []
+
+    def _on_reset(self, env_id, user_action):
+        if self.started < self.num_episodes:
+            self.episode_ids[env_id] = self.started
+            self.started += 1
+        else:
+            self.episode_ids[env_id] = None
+        self.turns[env_id] = 0
+        self.actions[env_id] = [_frame_record(user_action)] if self.keep_transcripts else []
+        if self.episode_ids[env_id] is not None:
+            self.tallies['user_intents'][user_action['intent']] += 1
+
+    def _on_round(self, env_id, agent_action, user_action, reward, done, success):
+        episode = self.episode_ids[env_id]
+        if episode is None:
+            return
+        self.turns[env_id] += 1
+        self.tallies['agent_intents'][agent_action['intent']] += 1
+        self.tallies['user_intents'][user_action['intent']] += 1
+        if self.keep_transcripts:
+            self.actions[env_id] += [_frame_record(agent_action), _frame_record(user_action)]
+        if done:
+            episode_reward = float(self.episode_rewards[env_id])
+            self.tallies['episodes'] += 1
+            self.tallies['successes'] += int(success)
+            self.tallies['reward'] += episode_reward
+            self.tallies['turns'] += self.turns[env_id]
+            if self.keep_transcripts:
+                self.transcripts.append({'episode': episode, 'success': bool(success), 'reward': episode_reward,
+                                         'turns': self.turns[env_id], 'actions': self.actions[env_id]})
+
+    def run(self):
+        """
+        Runs until every counted episode has ended.
+
+        Returns:
+            dict: The tallies of the episodes, see new_tallies
+            list: Of dict, the transcript of every episode ordered by episode number, empty without transcripts
+        """
+
+        self.reset()
+        while self.tallies['episodes'] < self.num_episodes:
+            self.step(learn=False)
+        self.transcripts.sort(key=lambda transcript: transcript['episode'])
+        return self.tallies, self.transcripts
+
+
+def new_tallies():
+    """
+    Returns empty evaluation tallies.
+
+    Returns:
+        dict: The number of 'episodes' and 'successes', the summed 'reward' and 'turns' and the 'agent_intents' and
+              'user_intents' counts (collections.Counter) of every action
+    """
+
+    return {'episodes': 0, 'successes': 0, 'reward': 0., 'turns': 0,
+            'agent_intents': collections.Counter(), 'user_intents': collections.Counter()}
+
+
+def merge_tallies(tallies_list):
+    """
+    Returns the sum of several tallies, e.g. of several worker processes.
+
+    Parameters:
+        tallies_list (list): Of dict, see new_tallies
+
+    Returns:
+        dict
+    """
+
+    merged = new_tallies()
+    for tallies in tallies_list:
+        for key, value in tallies.items():
+            merged[key] += value
+    return merged
+
+
+def summarize(tallies):
+    """
+    Returns the success rate, average reward and average turns of the tallies and their intent counts.
+
+    Parameters:
+        tallies (dict): See new_tallies
+
+    Returns:
+        dict
+    """
+
+    episodes = max(tallies['episodes'], 1)
+    return {'episodes': tallies['episodes'],
+            'success_rate': tallies['successes'] / episodes,
+            'avg_reward': tallies['reward'] / episodes,
+            'avg_turns': tallies['turns'] / episodes,
+            'agent_intents': dict(tallies['agent_intents'].most_common()),
+            'user_intents': dict(tallies['user_intents'].most_common())}
+
+
+def _eval_policy(constants, weights, eps):
+    """
+    Returns a DQNPolicy that acts epsilon-greedily with the given weights.
+
+    Parameters:
+        constants (dict): Loaded constants in dict
+        weights (list): The behavior model weights, see DQNPolicy.set_inference_weights
+        eps (float): The chance of a random action, 0. for a greedy policy
+
+    Returns:
+        DQNPolicy
+    """
+
+    policy = DQNPolicy(constants)
+    policy.eps = eps
+    policy.set_inference_weights(weights)
+    return policy
+
+
+def _run_worker(constants, weights, eps, shared_handle, num_episodes, num_envs, env_offset, seed_entropy,
+                transcripts):
+    """
+    Evaluates a share of the episodes in a worker process, which attaches to the data of the evaluating process.
+
+    Parameters:
+        constants (dict): Loaded constants in dict
+        weights (list): The behavior model weights
+        eps (float)
+        shared_handle (tuple): SharedData.handle of the data
+        num_episodes (int): The episodes of the share
+        num_envs (int)
+        env_offset (int): The index in the evaluation of the first dialogue of the worker
+        seed_entropy (int)
+        transcripts (bool)
+
+    Returns:
+        dict: The tallies of the share
+        list: The transcripts of the share
+    """
+
+    check_keras_free('evaluation worker')
+    shared = SharedData.attach(shared_handle)
+    rollout = EvalRollout(_eval_policy(constants, weights, eps), shared.goal_pool, shared.database, shared.db_dict,
+                          constants, num_envs, num_episodes, transcripts, env_offset, seed_entropy)
+    return rollout.run()
+
+
+def evaluate(constants, weights, database, db_dict, user_goals, num_episodes, num_envs=1, num_workers=1, seed=None,
+             transcript_path=None, eps=0.):
+    """
+    Evaluates the policy of the given weights against the user sim., greedy unless eps is given.
+
+    The episodes run num_envs at a time in lockstep, split across num_workers processes if more than 1. The workers
+    attach to one shared memory copy of the data (see shared_data.py). Nothing is printed per episode, the
+    transcripts of every episode are only written, gzipped with one json episode per line, if transcript_path is
+    given.
+
+    Parameters:
+        constants (dict): Loaded constants in dict
+        weights (list): The behavior model weights, e.g. DQNAgent.get_inference_weights()
+        database (ColumnarDB): The database
+        db_dict (dict): The database dict
+        user_goals (list or GoalPool): The user goals
+        num_episodes (int)
+        num_envs (int): The number of dialogues stepped in lockstep per process. Default: 1
+        num_workers (int): The number of processes. Default: 1
+        seed (int): Seeds the user sims., errors and exploration of every dialogue, see seeding.EnvStreams.
+                    Default: None
+        transcript_path (string): Default: None, no transcripts
+        eps (float): The chance of a random action, e.g. the "epsilon_init" the agent acts with. Default: 0., greedy
+
+    Returns:
+        dict: See summarize
+    """
+
+    entropy = root_entropy(seed) if seed is not None else None
+    transcripts = transcript_path is not None
+    num_workers = max(min(num_workers, num_episodes), 1)
+    if num_workers == 1:
+        rollout = EvalRollout(_eval_policy(constants, weights, eps), user_goals, database, db_dict, constants,
+                              num_envs, num_episodes, transcripts, seed_entropy=entropy)
+        tallies, episode_transcripts = rollout.run()
+    else:
+        shares = [num_episodes // num_workers + (w < num_episodes % num_workers) for w in range(num_workers)]
+        with SharedData.create(database, db_dict, user_goals) as shared, \
+                concurrent.futures.ProcessPoolExecutor(num_workers, mp_context=mp.get_context('spawn')) as executor:
+            # Every worker gets its own range of dialogue indices, so its dialogues have their own streams
+            futures = [executor.submit(_run_worker, constants, weights, eps, shared.handle, share, num_envs,
+                                       w * num_envs, entropy, transcripts) for w, share in enumerate(shares)]
+            results = [future.result() for future in futures]
+        tallies = merge_tallies([result[0] for result in results])
+        # Numbered on from the episodes of the workers before
+        episode_transcripts = []
+        for share_start, (_, share_transcripts) in zip(itertools.accumulate([0] + shares), results):
+            for transcript in share_transcripts:
+                transcript['episode'] += share_start
+                episode_transcripts.append(transcript)
+
+    if transcripts:
+        write_transcripts(episode_transcripts, transcript_path)
+    return summarize(tallies)
+
+
+def write_transcripts(transcripts, path):
+    """
+    Writes the transcripts gzipped, one json episode per line.
+
+    Parameters:
+        transcripts (list): Of dict, see EvalRollout.run
+        path (string)
+    """
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for transcript in transcripts:
+            f.write(json.dumps(transcript, ensure_ascii=False) + '\n')
+
+
+def print_summary(summary):
+    """
+    Prints the results of an evaluation.
+
+    Parameters:
+        summary (dict): See summarize
+    """
+
+    print('Episodes: {episodes} Success rate: {success_rate:.3f} Avg reward: {avg_reward:.2f} '
+          'Avg turns: {avg_turns:.2f}'.format(**summary))
+    for speaker in ['agent', 'user']:
+        counts = summary['{}_intents'.format(speaker)]
+        print('{} intents: {}'.format(speaker.capitalize(),
+                                      ', '.join('{} {}'.format(intent, count) for intent, count in counts.items())))
+
+
+if __name__ == "__main__":
+    # Evaluates the weights of "load_weights_file_path", e.g.
+    # python evaluate.py --constants_path "constants.json" --episodes 5000 --envs 16 --workers 4
+    from dqn_agent import DQNAgent
+    from state_tracker import StateTracker
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--constants_path', dest='constants_path', type=str, default='constants.json')
+    parser.add_argument('--episodes', dest='episodes', type=int, default=None,
+                        help='Default: "num_ep_run" under run')
+    parser.add_argument('--envs', dest='envs', type=int, default=1)
+    parser.add_argument('--workers', dest='workers', type=int, default=1)
+    parser.add_argument('--seed', dest='seed', type=int, default=None, help='Default: "seed" under run')
+    parser.add_argument('--eps', dest='eps', type=float, default=0., help='Default: 0., the greedy policy')
+    parser.add_argument('--transcripts', dest='transcripts', type=str, default=None,
+                        help='Write the transcripts to this path, e.g. transcripts.jsonl.gz')
+    args = parser.parse_args()
+
+    with open(args.constants_path) as f:
+        constants = json.load(f)
+    file_path_dict = constants['db_file_paths']
+    cache_dir = file_path_dict.get('cache_dir', None)
+    database = load_database(file_path_dict['database'], cache_dir)
+    db_dict = load_json(file_path_dict['dict'], cache_dir)[0]
+    user_goals = load_json(file_path_dict['user_goals'], cache_dir)
+    run_dict = constants['run']
+
+    # The agent loads the weights of "load_weights_file_path"
+    dqn_agent = DQNAgent(StateTracker(database, constants).get_state_size(), constants)
+    start = time.time()
+    summary = evaluate(constants, dqn_agent.get_inference_weights(), database, db_dict, user_goals,
+                       args.episodes or run_dict['num_ep_run'], args.envs, args.workers,
+                       args.seed if args.seed is not None else run_dict.get('seed', None), args.transcripts, args.eps)
+    print_summary(summary)
+    print('Evaluated in {:.1f}s'.format(time.time() - start))
@@ -0,0 +1,197 @@
+import sys
+from dialogue_config import all_intents, usersim_intents, all_slots
+
+
+class Interner:
+    """Maps names to small ints and back, names first seen at runtime are added."""
+
+    def __init__(self, names=()):
+        """
+        The constructor for Interner.
+
+        Parameters:
+            names (iterable): The names known up front, they get the ids 0, 1, ... in order
+        """
+
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        """
+        Returns the id of a name, adding it if new.
+
+        Parameters:
+            name (string)
+
+        Returns:
+            int
+        """
+
+        i = self.ids.get(name)
+        if i is None:
+            i = len(self.names)
+            # The names are also interned as strings so every frame refers to the same string object
+            name = sys.intern(name) if isinstance(name, str) else name
+            self.names.append(name)
+            self.ids[name] = i
+        return i
+
+    def name(self, i):
+        """
+        Returns the name of an id.
+
+        Parameters:
+            i (int)
+
+        Returns:
+            string
+        """
+
+        return self.names[i]
+
+
+intents = Interner(all_intents + [intent for intent in usersim_intents if intent not in all_intents])
+speakers = Interner(['Agent', 'User'])
+# Slot names used as keys of the slot dicts, interned so that the history holds one string object per slot name
+slot_names = {slot: sys.intern(slot) for slot in all_slots}
+
+
+def intern_slots(slots):
+    """
+    Returns a slot dict whose known slot names are the interned ones.
+
+    Parameters:
+        slots (dict)
+
+    Returns:
+        dict
+    """
+
+    return {slot_names.get(slot, slot): value for slot, value in slots.items()}
+
+
+class Frame:
+    """
+    A compact dialogue frame (user or agent action) with dict-compatible access.
+
+    Holds the intent and speaker as small ints and the inform and request slots as dicts, frame['intent'],
+    frame['inform_slots'] etc. read and write them like the dicts they replace. 'round' and 'speaker' are only set once
+    the state tracker adds them, until then they are missing like in the dict format.
+    """
+
+    __slots__ = ('intent_id', 'inform_slots', 'request_slots', 'round', 'speaker_id')
+    # The keys of the dict format in order
+    KEYS = ('intent', 'inform_slots', 'request_slots', 'round', 'speaker')
+
+    def __init__(self, intent, inform_slots=None, request_slots=None):
+        """
+        The constructor for Frame.
+
+        Parameters:
+            intent (string)
+            inform_slots (dict): Used as is, not copied. Default: a new empty dict
+            request_slots (dict): Used as is, not copied. Default: a new empty dict
+        """
+
+        self.intent_id = intents.intern(intent)
+        self.inform_slots = {} if inform_slots is None else inform_slots
+        self.request_slots = {} if request_slots is None else request_slots
+
+    @classmethod
+    def from_dict(cls, action):
+        """
+        Builds a frame from an action in the dict format, the slot dicts are copied.
+
+        Parameters:
+            action (dict)
+
+        Returns:
+            Frame
+        """
+
+        frame = cls(action['intent'], intern_slots(action.get('inform_slots', {})),
+                    intern_slots(action.get('request_slots', {})))
+        for key in ('round', 'speaker'):
+            if key in action:
+                frame[key] = action[key]
+        return frame
+
+    def to_dict(self):
+        """
+        Returns the frame in the dict format, e.g. for logging. The slot dicts are shared, not copied.
+
+        Returns:
+            dict
+        """
+
+        return {key: self[key] for key in self.keys()}
+
+    def __getitem__(self, key):
+        try:
+            if key == 'intent':
+                return intents.name(self.intent_id)
+            if key == 'speaker':
+                return speakers.name(self.speaker_id)
+            if key in self.KEYS:
+                return getattr(self, key)
+        except AttributeError:
+            pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'intent':
+            self.intent_id = intents.intern(value)
+        elif key == 'speaker':
+            self.speaker_id = speakers.intern(value)
+        elif key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Frame, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def keys(self):
+        """Returns the keys that are set, in the order of the dict format."""
+
+        return [key for key in self.KEYS if key not in ('round', 'speaker') or
+                hasattr(self, 'round' if key == 'round' else 'speaker_id')]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, other):
+        """
+        Sets several keys at once like dict.update.
+
+        Parameters:
+            other (dict)
+        """
+
+        for key, value in other.items():
+            self[key] = value
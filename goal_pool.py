@@ -0,0 +1,330 @@
+from dialogue_config import no_query_keys
+from bounded_cache import BoundedCache
+import argparse, json
+import numpy as np
+
+# Max number of relaxed goals whose answers a GoalAnswers keeps
+RELAXED_CACHE_ENTRIES = 10000
+
+
+class FrozenDict(tuple):
+    """A dict frozen into a tuple of its (key, value) items."""
+
+
+class FrozenList(tuple):
+    """A list holding dicts or lists, frozen into a tuple of its frozen items. Lists of plain values freeze to tuples."""
+
+
+def freeze(value):
+    """
+    Returns an immutable copy of a goal loaded from json: dicts become FrozenDicts and lists tuples or FrozenLists.
+
+    Parameters:
+        value (object)
+
+    Returns:
+        object
+    """
+
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        items = tuple(freeze(item) for item in value)
+        return FrozenList(items) if any(isinstance(item, tuple) for item in items) else items
+    return value
+
+
+def thaw(value):
+    """
+    Returns a mutable copy of a value made by freeze, equal to the original.
+
+    Parameters:
+        value (object)
+
+    Returns:
+        object
+    """
+
+    # Exact type checks, this runs on every reset
+    cls = type(value)
+    if cls is FrozenDict:
+        return {key: thaw(item) for key, item in value}
+    if cls is tuple:
+        return list(value)
+    if cls is FrozenList:
+        return [thaw(item) for item in value]
+    return value
+
+
+class GoalPool:
+    """
+    The user goals in immutable form.
+
+    The user sim. edits its goal during an episode, so every episode gets a fresh working copy of a pool goal: the
+    pool itself never changes, however long the training runs and however many user sims. share it. A list of goals is
+    frozen once, a sequence that already returns a fresh copy on every access (copies_on_access, e.g. the shared goals
+    of shared_data.SharedData) is used as is, so a worker only ever decodes the goal it draws.
+    """
+
+    def __init__(self, goals):
+        """
+        The constructor for GoalPool.
+
+        Parameters:
+            goals (list): User goals loaded from file, or any sequence of them
+        """
+
+        if getattr(goals, 'copies_on_access', False):
+            # thaw returns the fresh copies as they are
+            self.goals = goals
+        else:
+            self.goals = tuple(freeze(goal) for goal in goals)
+        self._answers = None
+
+    def __len__(self):
+        return len(self.goals)
+
+    def __getitem__(self, i):
+        """Returns a working copy of goal i."""
+
+        return thaw(self.goals[i])
+
+    def __iter__(self):
+        return (thaw(goal) for goal in self.goals)
+
+    def sample_index(self, rng):
+        """
+        Returns the index of a goal picked uniformly at random, with the same draw as sample.
+
+        Parameters:
+            rng (random.Random): Or the random module
+
+        Returns:
+            int
+        """
+
+        return rng.choice(range(len(self.goals)))
+
+    def sample(self, rng):
+        """
+        Returns a working copy of a goal picked uniformly at random.
+
+        Parameters:
+            rng (random.Random): Or the random module
+
+        Returns:
+            dict
+        """
+
+        return thaw(self.goals[self.sample_index(rng)])
+
+    def answers(self, database, arrays=None):
+        """
+        Returns the GoalAnswers of the pool over a database, built on the first call and shared by later ones.
+
+        Parameters:
+            database (ColumnarDB): The database
+            arrays (dict): GoalAnswers.arrays of the pool over the database, e.g. in shared memory. Default: None, the
+                           answers are computed
+
+        Returns:
+            GoalAnswers
+        """
+
+        if self._answers is None or self._answers.database is not database:
+            self._answers = GoalAnswers(self, database, arrays=arrays)
+        return self._answers
+
+
+class GoalAnswers:
+    """
+    The ids of the DB items that satisfy the inform constraints of every goal of a pool.
+
+    An item satisfies a goal if it has every inform slot of the goal, other than the no query slots, with the same
+    value. The ids are computed once from the columns of the ColumnarDB and kept as sorted arrays in CSR layout (see
+    arrays), so the answers in shared memory (see shared_data.SharedData) are used by every worker as is, and checking
+    a match the agent found is one lookup. Goals relaxed during an episode (by dropping inform slots) are looked up the
+    same way through a bounded cache keyed by their constraints.
+    """
+
+    def __init__(self, goal_pool, database, skip_slots=no_query_keys, arrays=None):
+        """
+        The constructor for GoalAnswers.
+
+        Parameters:
+            goal_pool (GoalPool)
+            database (ColumnarDB): The database
+            skip_slots (list): The inform slots not checked against the items. Default: dialogue_config.no_query_keys
+            arrays (dict): The arrays of the answers of the same pool, database and skip slots, e.g. in shared memory.
+                           Default: computed from the database
+        """
+
+        self.database = database
+        self.skip_slots = frozenset(skip_slots)
+        # {frozenset: numpy.array} The answers of the relaxed goals looked up so far
+        self.cache = BoundedCache(RELAXED_CACHE_ENTRIES)
+        if arrays is None:
+            answers = [self._match(self.constraints(goal.get('inform_slots', {}))) for goal in goal_pool]
+            arrays = {'constrained': np.array([ids is not None for ids in answers], dtype=bool),
+                      'offsets': np.cumsum([0] + [0 if ids is None else len(ids) for ids in answers], dtype=np.int64),
+                      'ids': np.concatenate([np.zeros((0,), dtype=np.int32)] +
+                                            [ids for ids in answers if ids is not None]).astype(np.int32)}
+        # dict(string: numpy.array) The answers of goal i are ids[offsets[i]:offsets[i + 1]], None if not constrained
+        self.arrays = arrays
+        self.num_goals = len(arrays['constrained'])
+
+    def get(self, goal_id):
+        """
+        Returns the ids of the items that satisfy a goal of the pool.
+
+        Parameters:
+            goal_id (int): The index of the goal in the pool
+
+        Returns:
+            numpy.array: The sorted ids, or None if no slot is constrained, then any match (even none) satisfies the goal
+        """
+
+        if not self.arrays['constrained'][goal_id]:
+            return None
+        offsets = self.arrays['offsets']
+        return self.arrays['ids'][offsets[goal_id]:offsets[goal_id + 1]]
+
+    def constraints(self, inform_slots):
+        """
+        Returns the constraints of the inform slots of a goal, as a frozenset of (slot, frozen value) pairs.
+
+        Parameters:
+            inform_slots (dict or FrozenDict)
+
+        Returns:
+            frozenset
+        """
+
+        items = inform_slots if isinstance(inform_slots, tuple) else inform_slots.items()
+        return frozenset((slot, freeze(value)) for slot, value in items if slot not in self.skip_slots)
+
+    def lookup(self, inform_slots):
+        """
+        Returns the ids of the items that satisfy the inform slots of a goal.
+
+        Parameters:
+            inform_slots (dict or FrozenDict)
+
+        Returns:
+            numpy.array: The sorted ids, or None if no slot is constrained, then any match (even none) satisfies the goal
+        """
+
+        constraints = self.constraints(inform_slots)
+        if not constraints:
+            return None
+        answers = self.cache.get(constraints)
+        if answers is None:
+            answers = self._match(constraints)
+            self.cache.put(constraints, answers)
+        return answers
+
+    def _match(self, constraints):
+        """
+        Returns the ids of the items that satisfy every constraint.
+
+        Parameters:
+            constraints (frozenset): See constraints
+
+        Returns:
+            numpy.array: The sorted ids, or None if there are no constraints
+        """
+
+        ids = None
+        for slot, value in constraints:
+            slot_ids = self._match_value(slot, value)
+            ids = slot_ids if ids is None else np.intersect1d(ids, slot_ids, assume_unique=True)
+            if not len(ids):
+                break
+        return ids
+
+    def _match_value(self, slot, value):
+        """
+        Returns the ids of the items whose slot has the value, comparing the value ids of their column.
+
+        Parameters:
+            slot (string)
+            value (object): A frozen value
+
+        Returns:
+            numpy.array: The sorted ids
+        """
+
+        database = self.database
+        j = database.slot_index.get(slot)
+        is_list = type(value) in (tuple, FrozenList)
+        value_ids = database.encode([thaw(item) for item in value] if is_list else [thaw(value)])
+        # A list never equals a scalar
+        if j is None or is_list != (slot in database.list_slots) or value_ids is None:
+            return np.zeros((0,), dtype=np.int32)
+        offsets = database.column_offsets[slot]
+        column = database.column_ids[slot]
+        # Items with as many values, then with the same value at every position
+        ids = np.flatnonzero(database.has_slot[:, j] & (database.value_counts[:, j] == len(value_ids)))
+        for position, value_id in enumerate(value_ids):
+            ids = ids[column[offsets[ids] + position] == value_id]
+        return ids.astype(np.int32)
+
+    def report(self):
+        """
+        Returns how many goals of the pool can be satisfied and by how many items.
+
+        Returns:
+            dict: 'goals', 'satisfiable', 'unconstrained', the 'unsatisfiable' goal indices and the 'min', 'mean' and
+                  'max' number of items that satisfy a constrained goal
+        """
+
+        constrained = self.arrays['constrained']
+        goal_sizes = np.diff(self.arrays['offsets'])
+        sizes = goal_sizes[constrained]
+        return {'goals': self.num_goals,
+                'satisfiable': int(np.count_nonzero(sizes)),
+                'unconstrained': self.num_goals - len(sizes),
+                'unsatisfiable': np.flatnonzero(constrained & (goal_sizes == 0)).tolist(),
+                'min': int(sizes.min()) if len(sizes) else 0,
+                'mean': float(sizes.mean()) if len(sizes) else 0.,
+                'max': int(sizes.max()) if len(sizes) else 0}
+
+
+def as_goal_pool(goals):
+    """
+    Returns the goals as a GoalPool, compiling one if they are still a list.
+
+    Parameters:
+        goals (list or GoalPool)
+
+    Returns:
+        GoalPool
+    """
+
+    if isinstance(goals, GoalPool):
+        return goals
+    return GoalPool(goals)
+
+
+if __name__ == "__main__":
+    # Reports which user goals the database can satisfy, e.g. python goal_pool.py --constants_path constants.json
+    from data_cache import load_database, load_json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--constants_path', dest='constants_path', type=str, default='constants.json')
+    parser.add_argument('--goals', dest='goals', type=str, nargs='*', default=None,
+                        help='Goal files to report on. Default: the user goals of the constants')
+    args = parser.parse_args()
+
+    with open(args.constants_path) as f:
+        constants = json.load(f)
+    file_path_dict = constants['db_file_paths']
+    cache_dir = file_path_dict.get('cache_dir', None)
+    database = load_database(file_path_dict['database'], cache_dir)
+
+    for goals_path in args.goals or [file_path_dict['user_goals']]:
+        report = GoalPool(load_json(goals_path, cache_dir)).answers(database).report()
+        print('{}: {satisfiable}/{goals} goals satisfiable, {unconstrained} unconstrained, items per goal: min {min} '
+              'mean {mean:.1f} max {max}'.format(goals_path, **report))
+        if report['unsatisfiable']:
+            print('Unsatisfiable goals: {}'.format(report['unsatisfiable']))
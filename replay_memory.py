@@ -0,0 +1,113 @@
+import random
+import numpy as np
+
+
+class ReplayMemory:
+    """A fixed size ring buffer of experiences backed by preallocated contiguous arrays."""
+
+    def __init__(self, max_size, state_size, rng=None):
+        """
+        The constructor for ReplayMemory.
+
+        Parameters:
+            max_size (int): The max number of experiences, the oldest experience is overwritten once full
+            state_size (int): The state representation size
+            rng (numpy.random.Generator): The sampling stream, see seeding.learner_generator. Default: None, the global
+                                          random module
+        """
+
+        self.max_size = max_size
+        self.rng = rng
+        self.state_size = state_size
+        self.states = np.zeros((max_size, state_size), dtype=np.float32)
+        self.actions = np.zeros((max_size,), dtype=np.int32)
+        self.rewards = np.zeros((max_size,), dtype=np.float32)
+        self.next_states = np.zeros((max_size, state_size), dtype=np.float32)
+        self.dones = np.zeros((max_size,), dtype=bool)
+        self.index = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        Adds an experience to the memory.
+
+        Parameters:
+            state (numpy.array)
+            action (int)
+            reward (int)
+            next_state (numpy.array)
+            done (bool)
+        """
+
+        self.states[self.index] = state
+        self.actions[self.index] = action
+        self.rewards[self.index] = reward
+        self.next_states[self.index] = next_state
+        self.dones[self.index] = done
+        self.index = (self.index + 1) % self.max_size
+        self.size = min(self.size + 1, self.max_size)
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Adds several experiences to the memory at once, in order.
+
+        Parameters:
+            states (numpy.array): Of shape (num experiences, state size)
+            actions (numpy.array)
+            rewards (numpy.array)
+            next_states (numpy.array): Of shape (num experiences, state size)
+            dones (numpy.array)
+        """
+
+        num = len(actions)
+        if num > self.max_size:
+            # Only the newest max_size experiences would survive anyway, skip the others
+            self.index = (self.index + num - self.max_size) % self.max_size
+            states, actions, rewards, next_states, dones = \
+                states[-self.max_size:], actions[-self.max_size:], rewards[-self.max_size:], \
+                next_states[-self.max_size:], dones[-self.max_size:]
+            num = self.max_size
+        indices = (self.index + np.arange(num)) % self.max_size
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices] = dones
+        self.index = (self.index + num) % self.max_size
+        self.size = min(self.size + num, self.max_size)
+
+    def sample(self, batch_size):
+        """
+        Returns a batch of distinct experiences picked uniformly at random.
+
+        Parameters:
+            batch_size (int)
+
+        Returns:
+            numpy.array: float32 states of shape (batch_size, state_size)
+            numpy.array: int32 actions of shape (batch_size,)
+            numpy.array: float32 rewards of shape (batch_size,)
+            numpy.array: float32 next states of shape (batch_size, state_size)
+            numpy.array: bool dones of shape (batch_size,)
+        """
+
+        if self.rng is not None:
+            indices = self.rng.choice(self.size, batch_size, replace=False)
+        else:
+            indices = np.array(random.sample(range(self.size), batch_size), dtype=np.intp)
+        return self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices], \
+            self.dones[indices]
+
+    def clear(self):
+        """Empties the memory, the arrays are kept allocated."""
+
+        self.index = 0
+        self.size = 0
+
+    def is_full(self):
+        """Returns true if the memory is full."""
+
+        return self.size == self.max_size
@@ -0,0 +1,173 @@
+from user_simulator import UserSimulator
+from error_model_controller import ErrorModelController
+from state_tracker import StateTracker
+from db_query import DBQuery
+from dqn_policy import RuleState
+from seeding import EnvStreams
+from goal_pool import as_goal_pool
+import numpy as np
+
+
+class BatchRollout:
+    """Steps several independent dialogues in lockstep so the agent picks the actions of all of them at once."""
+
+    def __init__(self, dqn_agent, goal_list, database, db_dict, constants, num_envs, env_offset=0, seed_entropy=None):
+        """
+        The constructor for BatchRollout.
+
+        Creates a user sim., state tracker and rule-based policy state per dialogue. The database, the DB query object
+        (and so its caches) and the error model controller, which adds the errors of all the dialogues in one batch,
+        are shared by all of them.
+
+        Parameters:
+            dqn_agent (DQNAgent): The agent acting in, and learning from, every dialogue, any DQNPolicy that has an
+                                  add_experience method works
+            goal_list (list or GoalPool): User goals loaded from file, or the GoalPool compiled from them
+            database (ColumnarDB): The database
+            db_dict (dict): The database dict used by the error model controller
+            constants (dict): Loaded constants in dict
+            num_envs (int): The number of dialogues to run in lockstep
+            env_offset (int): The index in the run of the first dialogue, e.g. when the dialogues of a run are split
+                              across actors. Default: 0
+            seed_entropy (int): If given, every dialogue gets its own random streams for the user sim., errors and
+                                exploration derived from it and the dialogue's index (see seeding.EnvStreams), so a
+                                dialogue plays out the same however the dialogues of a run are split. Default: None
+        """
+
+        self.dqn_agent = dqn_agent
+        self.num_envs = num_envs
+        db_helper = DBQuery(database, constants)
+        streams = [EnvStreams(seed_entropy, env_offset + i) for i in range(num_envs)] if seed_entropy is not None \
+            else None
+        self.agent_rngs = [stream.agent for stream in streams] if streams else None
+        self.emc_rngs = [stream.emc_batch for stream in streams] if streams else None
+        # One pool for all the user sims., each works on its own copy of its current goal
+        goal_pool = as_goal_pool(goal_list)
+        self.users = [UserSimulator(goal_pool, constants, database,
+                                    rng=streams[i].user if streams else None) for i in range(num_envs)]
+        self.emc = ErrorModelController(db_dict, constants)
+        self.state_trackers = [StateTracker(database, constants, db_helper=db_helper) for _ in range(num_envs)]
+        self.rule_states = [RuleState() for _ in range(num_envs)]
+        self.states = None
+        self.episode_rewards = np.zeros((num_envs,))
+
+    def reset(self):
+        """Resets every dialogue."""
+
+        self.states = np.zeros((self.num_envs, self.state_trackers[0].get_state_size()))
+        self._reset_envs(range(self.num_envs))
+
+    def _reset_envs(self, env_ids):
+        """
+        Resets the given dialogues and sets their initial states.
+
+        Parameters:
+            env_ids (list): The indices of the dialogues
+        """
+
+        user_actions = []
+        for i in env_ids:
+            self.state_trackers[i].reset()
+            user_actions.append(self.users[i].reset())
+        self.emc.infuse_errors(user_actions, self._emc_rngs(env_ids))
+        for i, user_action in zip(env_ids, user_actions):
+            self.state_trackers[i].update_state_user(user_action)
+            self.rule_states[i].reset()
+            self.episode_rewards[i] = 0
+            self.states[i] = self.state_trackers[i].get_state()
+            self._on_reset(i, user_action)
+
+    def step(self, warmup=False, learn=True):
+        """
+        Runs one round of every dialogue and adds the experiences to the agent's memory.
+
+        The agent picks all the actions with one batched call, finished dialogues are reset right away.
+
+        Parameters:
+            warmup (bool): Use the rule-based policy. Default: False
+            learn (bool): Add the experiences to the agent's memory, the agent needs no add_experience method if
+                          false. Default: True
+
+        Returns:
+            list: Of tuple(float, bool), the reward and success of each episode that finished in this round
+        """
+
+        if self.states is None:
+            self.reset()
+        finished = []
+        actions = self.dqn_agent.get_actions(self.states, use_rule=warmup, rule_states=self.rule_states,
+                                             rngs=self.agent_rngs)
+        steps = []
+        for i, (_, agent_action) in enumerate(actions):
+            self.state_trackers[i].update_state_agent(agent_action)
+            steps.append(self.users[i].step(agent_action))
+        # The errors of every dialogue that goes on are added in one batch
+        going_on = [i for i, (_, _, done, _) in enumerate(steps) if not done]
+        self.emc.infuse_errors([steps[i][0] for i in going_on], self._emc_rngs(going_on))
+
+        done_ids = []
+        for i, ((agent_action_index, agent_action), (user_action, reward, done, success)) in \
+                enumerate(zip(actions, steps)):
+            state_tracker = self.state_trackers[i]
+            state_tracker.update_state_user(user_action)
+            next_state = state_tracker.get_state(done)
+            if learn:
+                self.dqn_agent.add_experience(self.states[i], agent_action_index, reward, next_state, done)
+            self.episode_rewards[i] += reward
+            self._on_round(i, agent_action, user_action, reward, done, success)
+            if done:
+                finished.append((self.episode_rewards[i], success))
+                done_ids.append(i)
+            self.states[i] = next_state
+        if done_ids:
+            self._reset_envs(done_ids)
+        return finished
+
+    def _on_reset(self, env_id, user_action):
+        """
+        Called with the initial user action of every episode, after the errors are added. Does nothing, for subclasses.
+
+        Parameters:
+            env_id (int): The index of the dialogue
+            user_action (Frame)
+        """
+
+    def _on_round(self, env_id, agent_action, user_action, reward, done, success):
+        """
+        Called with every round of every dialogue, before a finished dialogue is reset. Does nothing, for subclasses.
+
+        Parameters:
+            env_id (int): The index of the dialogue
+            agent_action (Frame)
+            user_action (Frame): After the errors are added
+            reward (int)
+            done (bool)
+            success (bool)
+        """
+
+    def _emc_rngs(self, env_ids):
+        """
+        Returns the error streams of the given dialogues, None if the dialogues have no streams of their own.
+
+        Parameters:
+            env_ids (list)
+
+        Returns:
+            list
+        """
+
+        if self.emc_rngs is None:
+            return None
+        return [self.emc_rngs[i] for i in env_ids]
+
+    def reset_empty_count(self):
+        """
+        Returns the empty and non-empty inform counts summed over the user sims. and resets them.
+
+        Returns:
+            int: Empty count
+            int: Non-empty count
+        """
+
+        counts = [user.reset_empty_count() for user in self.users]
+        return sum(empty for empty, _ in counts), sum(non_empty for _, non_empty in counts)
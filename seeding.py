@@ -0,0 +1,74 @@
+import random
+import numpy as np
+
+# First spawn key of the streams of a dialogue and of the learner
+ENV_KEY = 0
+LEARNER_KEY = 1
+
+
+def root_entropy(seed=None):
+    """
+    Returns the entropy every stream of a run is derived from.
+
+    Parameters:
+        seed (int): The seed of the run, None for fresh entropy. Default: None
+
+    Returns:
+        int
+    """
+
+    return np.random.SeedSequence(seed).entropy
+
+
+def python_random(seed_sequence):
+    """
+    Returns a random.Random seeded from a SeedSequence.
+
+    Parameters:
+        seed_sequence (numpy.random.SeedSequence)
+
+    Returns:
+        random.Random
+    """
+
+    return random.Random(int.from_bytes(seed_sequence.generate_state(4).tobytes(), 'little'))
+
+
+class EnvStreams:
+    """
+    The random streams of the components of one dialogue.
+
+    They only depend on the root entropy and the index of the dialogue in the run, not on how the dialogues are
+    split across batches or processes, so a dialogue plays out the same either way.
+    """
+
+    def __init__(self, entropy, env_id):
+        """
+        The constructor for EnvStreams.
+
+        Parameters:
+            entropy (int): See root_entropy
+            env_id (int): The index of the dialogue in the run
+        """
+
+        user, emc, emc_batch, agent = np.random.SeedSequence(entropy, spawn_key=(ENV_KEY, env_id)).spawn(4)
+        # random.Random for the components that pick from Python lists
+        self.user = python_random(user)
+        self.emc = python_random(emc)
+        self.agent = python_random(agent)
+        # numpy.random.Generator for the batched error injection
+        self.emc_batch = np.random.default_rng(emc_batch)
+
+
+def learner_generator(entropy):
+    """
+    Returns the numpy.random.Generator of the learner, used to sample the replay memory.
+
+    Parameters:
+        entropy (int): See root_entropy
+
+    Returns:
+        numpy.random.Generator
+    """
+
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(LEARNER_KEY,)))
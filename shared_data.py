@@ -0,0 +1,237 @@
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+import numpy as np
+from data_cache import database_to_arrays, database_from_arrays, encode_string_table, build_string_index, \
+    StringTableView
+from db_index import InvertedIndex
+from goal_pool import GoalPool, as_goal_pool
+
+# Byte alignment of every array in a shared block
+ALIGNMENT = 64
+
+
+class SharedArrays:
+    """Named NumPy arrays packed into one shared memory block, attached to as read-only views without copying."""
+
+    def __init__(self, shm, layout, owner):
+        """
+        The constructor for SharedArrays, use SharedArrays.create or SharedArrays.attach.
+
+        Parameters:
+            shm (multiprocessing.shared_memory.SharedMemory)
+            layout (dict): dict(string: tuple) The byte offset, dtype string and shape of every array
+            owner (bool): True in the process that created the block, it unlinks the block on close
+        """
+
+        self.shm = shm
+        self.layout = layout
+        self.owner = owner
+        self.arrays = {}
+        for name, (offset, dtype, shape) in layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[name] = array
+
+    @classmethod
+    def create(cls, arrays):
+        """
+        Creates a shared block and copies the arrays into it.
+
+        Parameters:
+            arrays (dict): dict(string: numpy.array)
+
+        Returns:
+            SharedArrays
+        """
+
+        arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            size = -(-size // ALIGNMENT) * ALIGNMENT
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += array.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            offset, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+        return cls(shm, layout, owner=True)
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Attaches to a block created in another process.
+
+        Parameters:
+            handle (tuple): SharedArrays.handle of the block
+
+        Returns:
+            SharedArrays
+        """
+
+        name, layout = handle
+        return cls(shared_memory.SharedMemory(name=name), layout, owner=False)
+
+    @property
+    def handle(self):
+        """The picklable name and layout of the block, to pass to SharedArrays.attach in another process."""
+
+        return self.shm.name, self.layout
+
+    def close(self):
+        """Detaches from the block and, in the owner process, frees it."""
+
+        self.arrays = {}
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views of the block are still alive, the mapping goes away with them
+            pass
+        if self.owner:
+            self.shm.unlink()
+            self.owner = False
+
+
+class SlotValuesView(Mapping):
+    """A read-only dict(slot: sequence of values) view over a string table of the values of every slot in order."""
+
+    def __init__(self, slots, slot_offsets, blob, offsets, kinds):
+        """
+        The constructor for SlotValuesView.
+
+        Parameters:
+            slots (list): The slot names
+            slot_offsets (numpy.array): The values of slot j are the table values slot_offsets[j]:slot_offsets[j + 1]
+            blob (numpy.array)
+            offsets (numpy.array)
+            kinds (numpy.array)
+        """
+
+        self.slot_index = {slot: j for j, slot in enumerate(slots)}
+        self.slot_offsets = slot_offsets
+        self.table = (blob, offsets, kinds)
+
+    def __getitem__(self, slot):
+        j = self.slot_index[slot]
+        return StringTableView(*self.table, start=int(self.slot_offsets[j]), stop=int(self.slot_offsets[j + 1]))
+
+    def __iter__(self):
+        return iter(self.slot_index)
+
+    def __len__(self):
+        return len(self.slot_index)
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _with_prefix(arrays, prefix):
+    """
+    Returns the arrays whose name starts with a prefix, named without it.
+
+    Parameters:
+        arrays (dict): dict(string: numpy.array)
+        prefix (string)
+
+    Returns:
+        dict
+    """
+
+    return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+
+class SharedData:
+    """
+    The database, dict and user goals in one shared memory block, with the index of the database and the answers of
+    the goals.
+
+    The process that creates it passes SharedData.handle to its workers, which attach to the block without copying:
+    the database is a ColumnarDB over the shared arrays, whose values are decoded on access and looked up through a
+    shared hash table, its InvertedIndex (database.index) uses the shared postings and n-grams, the dict is a
+    SlotValuesView and goal_pool a GoalPool over a StringTableView that decodes a fresh copy of a goal on every access,
+    with the shared GoalAnswers. So the memory of a worker does not grow with the data and forked workers never write
+    to (and so duplicate) the shared pages. What a worker still builds is bounded by its caches, see the README.
+    """
+
+    def __init__(self, block, meta):
+        """
+        The constructor for SharedData, use SharedData.create or SharedData.attach.
+
+        Parameters:
+            block (SharedArrays)
+            meta (dict): The database metadata (see data_cache.database_to_arrays) and the dict slots
+        """
+
+        self.block = block
+        self.meta = meta
+        arrays = block.arrays
+        self.database = database_from_arrays(_with_prefix(arrays, 'db_'), meta['database'])
+        self.database.index = InvertedIndex(self.database, _with_prefix(arrays, 'index_'))
+        self.db_dict = SlotValuesView(meta['dict_slots'], arrays['dict_slot_offsets'], arrays['dict_strings'],
+                                      arrays['dict_string_offsets'], arrays['dict_string_kinds'])
+        self.user_goals = StringTableView(arrays['goal_strings'], arrays['goal_string_offsets'],
+                                          arrays['goal_string_kinds'])
+        # Pass it to the user sims. instead of user_goals, its answers are the shared ones
+        self.goal_pool = GoalPool(self.user_goals)
+        self.goal_pool.answers(self.database, _with_prefix(arrays, 'answers_'))
+
+    @classmethod
+    def create(cls, database, db_dict, user_goals):
+        """
+        Copies the data into a new shared block.
+
+        Parameters:
+            database (ColumnarDB): The database
+            db_dict (dict): The database dict with format dict(string: list)
+            user_goals (list or GoalPool): User goals loaded from file, or the GoalPool compiled from them
+
+        Returns:
+            SharedData
+        """
+
+        db_arrays, db_meta = database_to_arrays(database)
+        arrays = {'db_' + name: array for name, array in db_arrays.items()}
+        arrays['db_value_counts'] = database.value_counts
+        arrays['db_string_index'] = build_string_index(database.values)
+        arrays.update({'index_' + name: array for name, array in database.index.arrays.items()})
+        goal_pool = as_goal_pool(user_goals)
+        arrays.update({'answers_' + name: array for name, array in goal_pool.answers(database).arrays.items()})
+        dict_slots = list(db_dict)
+        arrays['dict_slot_offsets'] = np.cumsum([0] + [len(db_dict[slot]) for slot in dict_slots], dtype=np.int64)
+        arrays['dict_strings'], arrays['dict_string_offsets'], arrays['dict_string_kinds'] = \
+            encode_string_table([value for slot in dict_slots for value in db_dict[slot]])
+        arrays['goal_strings'], arrays['goal_string_offsets'], arrays['goal_string_kinds'] = \
+            encode_string_table(list(goal_pool))
+        return cls(SharedArrays.create(arrays), {'database': db_meta, 'dict_slots': dict_slots})
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Attaches to the shared data created in another process.
+
+        Parameters:
+            handle (tuple): SharedData.handle
+
+        Returns:
+            SharedData
+        """
+
+        block_handle, meta = handle
+        return cls(SharedArrays.attach(block_handle), meta)
+
+    @property
+    def handle(self):
+        """The picklable handle to pass to SharedData.attach in a worker process."""
+
+        return self.block.handle, self.meta
+
+    def close(self):
+        """Detaches from the block, the creating process also frees it."""
+
+        self.block.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -2,14 +2,13 @@ from db_query import DBQuery
 import numpy as np
 from utils import convert_list_to_dict
 from dialogue_config import all_intents, all_slots, usersim_default_key,agent_inform_slots,agent_request_slots
-import copy
 import time
 
 
 class StateTracker:
     """Tracks the state of the episode/conversation and prepares the state representation for the agent."""
 
-    def __init__(self, database, constants):
+    def __init__(self, database, constants, db_helper=None):
         """
         The constructor of StateTracker.
 
@@ -17,22 +16,49 @@ class StateTracker:
         calls reset.
 
         Parameters:
-            database (dict): The database with format dict(long: dict)
+            database (list or ColumnarDB): The database with format list(dict) or the ColumnarDB built from it
             constants (dict): Loaded constants in dict
+            db_helper (DBQuery): A DB query object to share with other state trackers, a new one is made if None.
+                                 Default: None
 
         """
 
-        self.db_helper = DBQuery(database)
+        self.db_helper = db_helper if db_helper is not None else DBQuery(database, constants)
         self.match_key = usersim_default_key
         self.intents_dict = convert_list_to_dict(all_intents)
         self.num_intents = len(all_intents)
         self.slots_dict = convert_list_to_dict(all_slots)
         self.num_slots = len(all_slots)
+        # The columns of the columnar DB list slots and their positions in the slot representations of the state
+        db = self.db_helper.database
+        db_slots = [slot for slot in db.slots if slot in self.slots_dict and slot in db.list_slots]
+        self.db_slot_columns = np.array([db.slot_index[slot] for slot in db_slots], dtype=np.intp)
+        self.db_slot_positions = np.array([self.slots_dict[slot] for slot in db_slots], dtype=np.intp)
         self.max_round_num = constants['run']['max_round_num']
         self.none_state = np.zeros(self.get_state_size())
+        # Keep one state buffer and only update its segments changed since the last get_state
+        self.incremental = constants.get('state_tracker', {}).get('incremental', True)
+        self.state = np.zeros(self.get_state_size())
+        self._make_segments()
         self.reset()
         self.current_request_slots = []
 
+    def _make_segments(self):
+        """Makes a view into the state buffer for every segment of the state representation, in order."""
+
+        sizes = [('user_act_rep', self.num_intents), ('user_inform_slots_rep', self.num_slots),
+                 ('user_request_slots_rep', self.num_slots), ('agent_act_rep', self.num_intents),
+                 ('agent_inform_slots_rep', self.num_slots), ('agent_request_slots_rep', self.num_slots),
+                 ('current_slots_rep', self.num_slots), ('turn_rep', 1), ('turn_onehot_rep', self.max_round_num),
+                 ('kb_binary_rep', self.num_slots + 1), ('kb_count_rep', self.num_slots + 1),
+                 ('db_binary_slot_rep', self.num_slots + 1)]
+        self.segments = {}
+        offset = 0
+        for name, size in sizes:
+            self.segments[name] = self.state[offset:offset + size]
+            offset += size
+        assert offset == self.get_state_size()
+
     def get_state_size(self):
         """Returns the state size of the state representation used by the agent."""
 
@@ -46,6 +72,27 @@ class StateTracker:
         self.history = []
         self.round_num = 0
         self.current_request_slots = []
+        # Bumped on every change of current_informs, the DB results are only queried again when it changed
+        self.informs_version = 0
+        # What the state buffer was last built from
+        self.state[:] = 0
+        self.built_history_len = 0
+        self.built_request_slots = 0
+        self.built_round_num = None
+        self.built_informs_version = None
+
+    def _set_inform(self, key, value):
+        """
+        Sets a current inform, bumping informs_version if the value changed.
+
+        Parameters:
+            key (string)
+            value (list or string)
+        """
+
+        if key not in self.current_informs or self.current_informs[key] != value:
+            self.informs_version += 1
+        self.current_informs[key] = value
 
     def print_history(self):
         """Helper function if you want to see the current history action by action."""
@@ -71,6 +118,8 @@ class StateTracker:
         # If done then fill state with zeros
         if done:
             return self.none_state
+        if self.incremental:
+            return self._update_state()
 
         user_action = self.history[-1]
         db_results_dict = self.db_helper.get_db_results_for_slots(self.current_informs)
@@ -141,18 +190,11 @@ class StateTracker:
 
         # represent current slot has value in db result
         db_binary_slot_rep = np.zeros((self.num_slots + 1,))
-        db_results = self.db_helper.get_db_results(self.current_informs)
-        if db_results:
-            # Arbitrarily pick the first value of the dict
-            key, data = list(db_results.items())[0]
-            # print("size state: {} ".format(self.num_slots + 1))
-            # print("first value:   {}".format(data))
-            for slot, value in data.items():
-                if slot in self.slots_dict and isinstance(value, list) and len(value) > 0:
-                    # if slot not in self.current_request_slots:
-                    db_binary_slot_rep[self.slots_dict[slot]] = 1.0
-                   
-
+        db_ids = self.db_helper.get_db_result_ids(self.current_informs)
+        if len(db_ids):
+            # Arbitrarily pick the first item
+            value_counts = self.db_helper.database.value_counts[db_ids[0]]
+            db_binary_slot_rep[self.db_slot_positions] = value_counts[self.db_slot_columns] > 0
 
         state_representation = np.hstack(
             [user_act_rep, user_inform_slots_rep, user_request_slots_rep, agent_act_rep, agent_inform_slots_rep,
@@ -163,6 +205,72 @@ class StateTracker:
         # time.sleep(0.5)
         return state_representation
 
+    def _update_state(self):
+        """
+        Incremental version of get_state, updates only the segments of the state buffer changed since the last call.
+
+        Returns:
+            numpy.array: A copy of the state buffer of shape (state size,)
+
+        """
+
+        seg = self.segments
+        # A new action changes both the last user action and the last agent action
+        if len(self.history) != self.built_history_len:
+            user_action = self.history[-1]
+            last_agent_action = self.history[-2] if len(self.history) > 1 else None
+            seg['user_act_rep'][:] = 0
+            seg['user_act_rep'][self.intents_dict[user_action['intent']]] = 1.0
+            seg['user_inform_slots_rep'][:] = 0
+            for key in user_action['inform_slots'].keys():
+                seg['user_inform_slots_rep'][self.slots_dict[key]] = 1.0
+            seg['agent_act_rep'][:] = 0
+            seg['agent_inform_slots_rep'][:] = 0
+            seg['agent_request_slots_rep'][:] = 0
+            if last_agent_action:
+                seg['agent_act_rep'][self.intents_dict[last_agent_action['intent']]] = 1.0
+                for key in last_agent_action['inform_slots'].keys():
+                    if key in agent_inform_slots:
+                        seg['agent_inform_slots_rep'][self.slots_dict[key]] = 1.0
+                for key in last_agent_action['request_slots'].keys():
+                    if key in agent_request_slots:
+                        seg['agent_request_slots_rep'][self.slots_dict[key]] = 1.0
+            self.built_history_len = len(self.history)
+
+        # Request slots are only ever added during an episode
+        for key in self.current_request_slots[self.built_request_slots:]:
+            seg['user_request_slots_rep'][self.slots_dict[key]] = 1.0
+        self.built_request_slots = len(self.current_request_slots)
+
+        if self.round_num != self.built_round_num:
+            seg['turn_rep'][0] = self.round_num / 5.
+            seg['turn_onehot_rep'][:] = 0
+            seg['turn_onehot_rep'][self.round_num - 1] = 1.0
+            self.built_round_num = self.round_num
+
+        if self.informs_version != self.built_informs_version:
+            seg['current_slots_rep'][:] = 0
+            for key in self.current_informs:
+                seg['current_slots_rep'][self.slots_dict[key]] = 1.0
+
+            db_results_dict = self.db_helper.get_db_results_for_slots(self.current_informs)
+            seg['kb_count_rep'][:] = db_results_dict['matching_all_constraints'] / 100.
+            seg['kb_binary_rep'][:] = np.sum(db_results_dict['matching_all_constraints'] > 0.)
+            for key in db_results_dict.keys():
+                if key in self.slots_dict:
+                    seg['kb_count_rep'][self.slots_dict[key]] = db_results_dict[key] / 100.
+                    seg['kb_binary_rep'][self.slots_dict[key]] = np.sum(db_results_dict[key] > 0.)
+
+            seg['db_binary_slot_rep'][:] = 0
+            db_ids = self.db_helper.get_db_result_ids(self.current_informs)
+            if len(db_ids):
+                value_counts = self.db_helper.database.value_counts[db_ids[0]]
+                seg['db_binary_slot_rep'][self.db_slot_positions] = value_counts[self.db_slot_columns] > 0
+            self.built_informs_version = self.informs_version
+
+        # Copied since the caller keeps the state after the buffer is updated again
+        return self.state.copy()
+
     def update_state_agent(self, agent_action):
         """
         Updates the dialogue history with the agent's action and augments the agent's action.
@@ -171,7 +279,7 @@ class StateTracker:
         any other necessary information.
 
         Parameters:
-            agent_action (dict): The agent action of format dict('intent': string, 'inform_slots': dict,
+            agent_action (Frame): The agent action (or a dict) of format dict('intent': string, 'inform_slots': dict,
                                  'request_slots': dict) and changed to dict('intent': '', 'inform_slots': {},
                                  'request_slots': {}, 'round': int, 'speaker': 'Agent')
 
@@ -189,41 +297,30 @@ class StateTracker:
             assert key != 'match_found'
             assert value != 'PLACEHOLDER', 'KEY: {}'.format(key)
             if isinstance(value, tuple):
-              self.current_informs[key] = list(value)
+              self._set_inform(key, list(value))
             else:
-              self.current_informs[key] = value
+              self._set_inform(key, value)
         # If intent is match_found then fill the action informs with the matches informs (if there is a match)
         elif agent_action['intent'] == 'match_found':
             assert not agent_action['inform_slots'], 'Cannot inform and have intent of match found!'
             # print("intent: match found, current informs: {}".format(self.current_informs))
 
-            db_results = self.db_helper.get_db_results(self.current_informs)
-            if db_results:
-                # Arbitrarily pick the first value of the dict
-
-
-                # list_results = list(db_results.items())
-                # index = 0
-                # key, data = list_results[index]
-                # while index < len(list_results) and isinstance(data[index][self.current_request_slots[0]],list) and len(data[index][self.current_request_slots[0]]) == 0:
-                #     key, data = list(db_results.items())[index]
-                #     index += 1
-                db_results_no_empty = {}
-                if self.current_request_slots[0] != usersim_default_key:
-                    for key, data in db_results.items():
-                        if isinstance(data[self.current_request_slots[0]], list) and len(data[self.current_request_slots[0]]) > 0:
-                            db_results_no_empty[key] = copy.deepcopy(data)
-                if db_results_no_empty:
-                    key, data = list(db_results_no_empty.items())[0]
-                    # print("MATCH FOUND: filtered only not empty data ")
-                else:
-                    key, data = list(db_results.items())[0]
-                # key, data = list(db_results.items())[0]
-                agent_action['inform_slots'] = copy.deepcopy(data)
-                agent_action['inform_slots'][self.match_key] = str(key)
+            db_ids = self.db_helper.get_db_result_ids(self.current_informs)
+            if len(db_ids):
+                # Pick the first item that has a value for the first user request, else arbitrarily the first item
+                request_slot = self.current_request_slots[0]
+                index = db_ids[0]
+                if request_slot != usersim_default_key:
+                    for i in db_ids:
+                        if self.db_helper.has_slot_value(i, request_slot):
+                            index = i
+                            break
+                # The item is shared with the database so only the top level dict is copied
+                agent_action['inform_slots'] = dict(self.db_helper.get_item(index))
+                agent_action['inform_slots'][self.match_key] = str(index)
             else:
                 agent_action['inform_slots'][self.match_key] = 'no match available'
-            self.current_informs[self.match_key] = agent_action['inform_slots'][self.match_key]
+            self._set_inform(self.match_key, agent_action['inform_slots'][self.match_key])
         agent_action.update({'round': self.round_num, 'speaker': 'Agent'})
         self.history.append(agent_action)
 
@@ -234,14 +331,14 @@ class StateTracker:
         Takes a user action and updates the history. Also augments the user_action param with necessary information.
 
         Parameters:
-            user_action (dict): The user action of format dict('intent': string, 'inform_slots': dict,
+            user_action (Frame): The user action (or a dict) of format dict('intent': string, 'inform_slots': dict,
                                  'request_slots': dict) and changed to dict('intent': '', 'inform_slots': {},
                                  'request_slots': {}, 'round': int, 'speaker': 'User')
 
         """
 
         for key, value in user_action['inform_slots'].items():
-            self.current_informs[key] = value
+            self._set_inform(key, value)
         for key, value in user_action['request_slots'].items():
             if key not in self.current_request_slots:
                 self.current_request_slots.append(key)
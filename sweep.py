@@ -0,0 +1,230 @@
+import argparse, contextlib, copy, csv, itertools, json, math, os, random, re, time
+import concurrent.futures
+import multiprocessing as mp
+from data_cache import load_database, load_json
+from shared_data import SharedData
+
+# The shared data attached to once per worker process by _init_worker and used by all the trials the worker runs
+worker_data = {}
+
+
+def grid_trials(space):
+    """
+    Returns every combination of the values in a search space.
+
+    Parameters:
+        space (dict): dict(string: list) The values of every constant, keyed by 'section.name', e.g.
+                      {'agent.learning_rate': [1e-4, 1e-3], 'emc.slot_error_prob': [0.0, 0.05]}
+
+    Returns:
+        list: Of dict(string: value), the constants overridden by every trial
+    """
+
+    keys = sorted(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+
+
+def random_trials(space, num_trials, seed=None):
+    """
+    Returns num_trials random picks from a search space.
+
+    Parameters:
+        space (dict): Like in grid_trials, but a value can also be dict('low': float, 'high': float, 'log': bool) to
+                      pick uniformly from a range, on a log scale if 'log' is true
+        num_trials (int)
+        seed (int): Default: None
+
+    Returns:
+        list: Of dict(string: value), the constants overridden by every trial
+    """
+
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(num_trials):
+        trial = {}
+        for key in sorted(space):
+            values = space[key]
+            if isinstance(values, dict):
+                if values.get('log', False):
+                    trial[key] = math.exp(rng.uniform(math.log(values['low']), math.log(values['high'])))
+                else:
+                    trial[key] = rng.uniform(values['low'], values['high'])
+            else:
+                trial[key] = rng.choice(values)
+        trials.append(trial)
+    return trials
+
+
+def apply_overrides(constants, overrides):
+    """
+    Returns a copy of the constants with the overrides of a trial applied.
+
+    The files in 'db_file_paths' cannot be overridden since run_sweep loads them once for all the trials.
+
+    Parameters:
+        constants (dict): Loaded constants in dict
+        overrides (dict): dict(string: value) keyed by 'section.name'
+
+    Returns:
+        dict
+    """
+
+    constants = copy.deepcopy(constants)
+    for key, value in overrides.items():
+        section, name = key.split('.', 1)
+        if section == 'db_file_paths':
+            raise ValueError('{} cannot be swept, the data is loaded once for all the trials'.format(key))
+        if section not in constants:
+            raise ValueError('Section: {} of {} not in the constants'.format(section, key))
+        constants[section][name] = value
+    return constants
+
+
+def _init_worker(shared_handle):
+    """
+    Attaches a worker process to the shared data once, for all its trials.
+
+    Parameters:
+        shared_handle (tuple): SharedData.handle
+    """
+
+    worker_data['shared'] = SharedData.attach(shared_handle)
+
+
+def _run_trial(trial_id, constants, log_path):
+    """
+    Trains an agent in a worker process with the constants of one trial, its output is written to log_path.
+
+    Parameters:
+        trial_id (int)
+        constants (dict): The constants with the overrides of the trial applied
+        log_path (string)
+
+    Returns:
+        dict: The results of the trial
+    """
+
+    # Imported here so keras is only loaded by the workers
+    import train
+
+    start = time.time()
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log):
+        shared = worker_data['shared']
+        # The pool is never edited (every episode works on a copy of its goal), so the trials cannot affect each other
+        history = train.train_agent(constants, shared.database, shared.db_dict, shared.goal_pool)
+    success_rates = [period['success_rate'] for period in history]
+    return {'trial': trial_id,
+            'best_success_rate': max(success_rates, default=0.),
+            'final_success_rate': success_rates[-1] if history else 0.,
+            'final_avg_reward': history[-1]['avg_reward'] if history else 0.,
+            'periods': len(history),
+            'seconds': round(time.time() - start, 1)}
+
+
+def run_sweep(constants, trials, out_dir, max_workers=None):
+    """
+    Runs the trials across a pool of worker processes and writes a summary table of their results.
+
+    The data is loaded once here and put in shared memory that every worker attaches to. Every trial saves its
+    weights (if 'save_weights_file_path' is set) to its own file and writes its training output to
+    out_dir/trial_<id>.log. A trial that raises is recorded with its error and empty results, the other trials keep
+    running. The summary table is out_dir/summary.csv, sorted by best success rate with the failed trials last.
+
+    Parameters:
+        constants (dict): Loaded constants in dict, the base of every trial
+        trials (list): Of dict, the overrides of every trial, see grid_trials and random_trials
+        out_dir (string)
+        max_workers (int): Default: the number of cores, never more than the number of trials
+
+    Returns:
+        list: Of dict, the results of every trial
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    if not trials:
+        print('No trials to run')
+        write_summary([], [], os.path.join(out_dir, 'summary.csv'))
+        return []
+    # Checked before loading the data, so a bad override fails right away
+    trials_constants = [apply_overrides(constants, overrides) for overrides in trials]
+    file_path_dict = constants['db_file_paths']
+    cache_dir = file_path_dict.get('cache_dir', None)
+    database = load_database(file_path_dict['database'], cache_dir)
+    db_dict = load_json(file_path_dict['dict'], cache_dir)[0]
+    user_goals = load_json(file_path_dict['user_goals'], cache_dir)
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(trials))
+    print('Running {} trials on {} workers'.format(len(trials), max_workers))
+    results = []
+    with SharedData.create(database, db_dict, user_goals) as shared, \
+            concurrent.futures.ProcessPoolExecutor(max_workers, mp_context=mp.get_context('spawn'),
+                                                   initializer=_init_worker, initargs=(shared.handle,)) as executor:
+        futures = {}
+        for trial_id, (overrides, trial_constants) in enumerate(zip(trials, trials_constants)):
+            save_path = trial_constants['agent'].get('save_weights_file_path', '')
+            if save_path:
+                trial_constants['agent']['save_weights_file_path'] = \
+                    re.sub(r'\.h5$', '_trial{}.h5'.format(trial_id), save_path)
+            log_path = os.path.join(out_dir, 'trial_{}.log'.format(trial_id))
+            futures[executor.submit(_run_trial, trial_id, trial_constants, log_path)] = (trial_id, overrides)
+        for future in concurrent.futures.as_completed(futures):
+            trial_id, overrides = futures[future]
+            try:
+                result = dict(overrides, **future.result())
+            except Exception as e:
+                result = dict(overrides, trial=trial_id, error='{}: {}'.format(type(e).__name__, e))
+                print('Trial {trial} failed: {error}'.format(**result))
+            else:
+                print('Trial {trial} done in {seconds}s, best success rate: {best_success_rate}'.format(**result))
+            results.append(result)
+
+    results.sort(key=lambda result: ('error' in result, -result.get('best_success_rate', 0.), result['trial']))
+    write_summary(results, list(trials[0]) if trials else [], os.path.join(out_dir, 'summary.csv'))
+    return results
+
+
+def write_summary(results, keys, path):
+    """
+    Writes the results of the trials as a csv table and prints it.
+
+    Parameters:
+        results (list): Of dict, see run_sweep, the missing results of a failed trial are left empty
+        keys (list): The overridden constants, the first columns after the trial id
+        path (string)
+    """
+
+    fields = ['trial'] + keys + ['best_success_rate', 'final_success_rate', 'final_avg_reward', 'periods', 'seconds',
+                                 'error']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, restval='')
+        writer.writeheader()
+        writer.writerows(results)
+    print(' | '.join(fields))
+    for result in results:
+        print(' | '.join(str(result.get(field, '')) for field in fields))
+    print('Summary written to {}'.format(path))
+
+
+if __name__ == "__main__":
+    # Runs a sweep, e.g. python sweep.py --space space.json --mode random --num_trials 16
+    # where space.json is like {"agent.learning_rate": {"low": 1e-4, "high": 1e-2, "log": true},
+    #                           "emc.slot_error_prob": [0.0, 0.05]}
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--constants_path', dest='constants_path', type=str, default='constants.json')
+    parser.add_argument('--space', dest='space', type=str, required=True)
+    parser.add_argument('--mode', dest='mode', type=str, choices=['grid', 'random'], default='grid')
+    parser.add_argument('--num_trials', dest='num_trials', type=int, default=10)
+    parser.add_argument('--seed', dest='seed', type=int, default=None)
+    parser.add_argument('--workers', dest='workers', type=int, default=None)
+    parser.add_argument('--out_dir', dest='out_dir', type=str, default='sweeps/sweep-{}'.format(int(time.time())))
+    args = parser.parse_args()
+
+    with open(args.constants_path) as f:
+        constants = json.load(f)
+    with open(args.space) as f:
+        space = json.load(f)
+    if args.mode == 'grid':
+        trials = grid_trials(space)
+    else:
+        trials = random_trials(space, args.num_trials, args.seed)
+    run_sweep(constants, trials, args.out_dir, args.workers)
@@ -1,18 +1,26 @@
-from user_simulator import UserSimulator
 from error_model_controller import ErrorModelController
-from dqn_agent import DQNAgent
 from state_tracker import StateTracker
 import pickle, argparse, json
 from user import User
+from data_cache import load_database, load_json
 from utils import remove_empty_slots
+from evaluate import evaluate, print_summary
 
 
 if __name__ == "__main__":
+    # Imported here, not at the top, since the evaluation workers run this module again and must not load keras
+    from dqn_agent import DQNAgent
+
     # Can provide constants file path in args OR run it as is and change 'CONSTANTS_FILE_PATH' below
     # 1) In terminal: python test.py --constants_path "constants.json"
     # 2) Run this file as is
+    # With the user sim. the episodes run in the evaluation harness (see evaluate.py), which only prints the results,
+    # e.g. python test.py --envs 16 --workers 4 --transcripts transcripts.jsonl.gz
     parser = argparse.ArgumentParser()
     parser.add_argument('--constants_path', dest='constants_path', type=str, default='')
+    parser.add_argument('--envs', dest='envs', type=int, default=1)
+    parser.add_argument('--workers', dest='workers', type=int, default=1)
+    parser.add_argument('--transcripts', dest='transcripts', type=str, default=None)
     args = parser.parse_args()
     params = vars(args)
 
@@ -31,33 +39,37 @@ if __name__ == "__main__":
     DATABASE_FILE_PATH = file_path_dict['database']
     DICT_FILE_PATH = file_path_dict['dict']
     USER_GOALS_FILE_PATH = file_path_dict['user_goals']
+    # Where the compiled binary artifacts of the files above are stored, next to the files by default
+    CACHE_DIR = file_path_dict.get('cache_dir', None)
 
     # Load run constants
     run_dict = constants['run']
     USE_USERSIM = run_dict['usersim']
     NUM_EP_TEST = run_dict['num_ep_run']
     MAX_ROUND_NUM = run_dict['max_round_num']
+    SEED = run_dict.get('seed', None)
 
     # Load movie DB
     # Note: If you get an unpickling error here then run 'pickle_converter.py' and it should fix it
     # database = pickle.load(open(DATABASE_FILE_PATH, 'rb'), encoding='latin1')
-    database= json.load(open(DATABASE_FILE_PATH,encoding='utf-8'))
+    # Loaded as a ColumnarDB memory-mapped from its compiled artifact, shared by the user sim, state tracker and its
+    # DB query
+    database = load_database(DATABASE_FILE_PATH, CACHE_DIR)
 
     # Clean DB
     # remove_empty_slots(database)
 
     # Load movie dict
     # db_dict = pickle.load(open(DICT_FILE_PATH, 'rb'), encoding='latin1')
-    db_dict = json.load(open(DICT_FILE_PATH,encoding='utf-8'))[0]
+    db_dict = load_json(DICT_FILE_PATH, CACHE_DIR)[0]
 
     # Load goal file
     # user_goals = pickle.load(open(USER_GOALS_FILE_PATH, 'rb'), encoding='latin1')
-    user_goals = json.load(open(USER_GOALS_FILE_PATH,encoding='utf-8'))
+    user_goals = load_json(USER_GOALS_FILE_PATH, CACHE_DIR)
 
     # Init. Objects
-    if USE_USERSIM:
-        user = UserSimulator(user_goals, constants, database)
-    else:
+    # The user sim. is created by the evaluation harness
+    if not USE_USERSIM:
         user = User(constants)
     emc = ErrorModelController(db_dict, constants)
     state_tracker = StateTracker(database, constants)
@@ -68,8 +80,8 @@ def test_run():
     """
     Runs the loop that tests the agent.
 
-    Tests the agent on the goal-oriented chatbot task. Only for evaluating a trained agent. Terminates when the episode
-    reaches NUM_EP_TEST.
+    Tests the agent on the goal-oriented chatbot task with a real user, printing every action. Only for evaluating a
+    trained agent. Terminates when the episode reaches NUM_EP_TEST.
 
     """
 
@@ -120,4 +132,14 @@ def episode_reset():
     dqn_agent.reset()
 
 
-test_run()
+if __name__ == "__main__":
+    # Guarded since the evaluation workers import this module again
+    if USE_USERSIM:
+        print('Testing Started...')
+        # The agent explores with its "epsilon_init", like it does in test_run
+        summary = evaluate(constants, dqn_agent.get_inference_weights(), database, db_dict, user_goals, NUM_EP_TEST,
+                           params['envs'], params['workers'], SEED, params['transcripts'], dqn_agent.eps)
+        print_summary(summary)
+        print('...Testing Ended')
+    else:
+        test_run()
@@ -0,0 +1,61 @@
+import json, os
+import numpy as np
+import pytest
+import actor_learner
+from actor_learner import ActorLearner
+from columnar_db import ColumnarDB
+from dialogue_config import agent_actions
+from replay_memory import ReplayMemory
+from shared_data import SharedData
+from state_tracker import StateTracker
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+GOALS_PATH = os.path.join(DATA_DIR, 'activity_user_goals_limited_slots_multi_req_slots_merge_address_1400.json')
+DICT_PATH = os.path.join(DATA_DIR, 'activity_dict_newest.json')
+CONSTANTS = {'agent': {'epsilon_init': 0.}, 'run': {'max_round_num': 20},
+             'emc': {'slot_error_prob': 0.05, 'slot_error_mode': 0, 'intent_error_prob': 0.02}}
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class MemoryAgent:
+    """The parts of DQNAgent the learner uses: a replay memory and the weights to broadcast."""
+
+    def __init__(self, state_size, num_actions, seed=0):
+        rng = np.random.default_rng(seed)
+        sizes = [state_size, 20, num_actions]
+        self.weights = [w for i in range(2) for w in (rng.normal(size=sizes[i:i + 2]), rng.normal(size=sizes[i + 1]))]
+        self.memory = ReplayMemory(1000, state_size)
+
+    def get_inference_weights(self):
+        return self.weights
+
+    def is_memory_full(self):
+        return self.memory.is_full()
+
+
+def test_collect_raises_when_an_actor_dies(monkeypatch):
+    """The learner notices a dead actor while waiting for a push and stops the others instead of blocking forever."""
+
+    monkeypatch.setattr(actor_learner, 'POLL_INTERVAL', 0.1)
+    database = ColumnarDB.from_records(_load(DB_PATH))
+    state_size = StateTracker(database, CONSTANTS).get_state_size()
+    agent = MemoryAgent(state_size, len(agent_actions))
+    with SharedData.create(database, _load(DICT_PATH)[0], _load(GOALS_PATH)) as shared:
+        learner = ActorLearner(agent, CONSTANTS, 2, flush_size=16, shared_handle=shared.handle)
+        learner.start(warmup=True)
+        try:
+            learner.collect(timeout=60)
+            assert len(agent.memory) == 16
+            learner.actors[1].terminate()
+            learner.actors[1].join()
+            with pytest.raises(RuntimeError, match='Actor 1 exited'):
+                learner.collect(timeout=60)
+            assert learner.actors == []
+        finally:
+            if learner.actors:
+                learner.stop()
@@ -0,0 +1,66 @@
+import pytest
+from bounded_cache import BoundedCache
+from db_query import DBQuery
+
+
+def _unit_size(key, value):
+    return 1
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = BoundedCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1, 'entries': 2, 'bytes': cache.num_bytes,
+                             'hit_rate': 0.75}
+
+
+def test_lfu_evicts_the_least_frequently_used():
+    cache = BoundedCache(max_entries=2, policy='lfu')
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    cache.put('c', 3)
+    assert 'b' not in cache and 'a' in cache
+    # The new entry is the least used one now, ties go to the least recently used
+    cache.put('d', 4)
+    assert 'c' not in cache and 'a' in cache and 'd' in cache
+    assert cache.stats()['evictions'] == 2
+
+
+def test_byte_budget():
+    cache = BoundedCache(max_bytes=3, sizeof=_unit_size)
+    for i in range(5):
+        cache.put(i, i)
+    assert len(cache) == 3 and cache.num_bytes == 3
+    assert list(cache.entries) == [2, 3, 4]
+    # Replacing an entry does not evict another one
+    cache.put(3, 'x')
+    assert len(cache) == 3 and cache.evictions == 2
+    cache.clear()
+    assert len(cache) == 0 and cache.num_bytes == 0 and cache.evictions == 2
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BoundedCache(policy='fifo')
+
+
+def test_db_query_caches_are_bounded():
+    """DBQuery keeps at most cache_max_entries results per cache and counts its hits and misses."""
+
+    records = [{'city': ['a{}'.format(i)]} for i in range(10)]
+    db_query = DBQuery(records, {'db_query': {'cache_max_entries': 4}})
+    for i in range(10):
+        assert db_query.get_db_result_ids({'city': ['a{}'.format(i)]}).tolist() == [i]
+    assert db_query.get_db_result_ids({'city': ['a9']}).tolist() == [9]
+    stats = db_query.get_cache_stats()['db']
+    assert stats['entries'] == 4
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 10, 6)
@@ -0,0 +1,31 @@
+import glob, json, os
+import pytest
+from columnar_db import ColumnarDB
+from data_cache import database_to_arrays, database_from_arrays, build_string_index
+from db_query import DBQuery
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATHS = sorted(glob.glob(os.path.join(DATA_DIR, '*db*.json')))
+
+
+@pytest.mark.parametrize('path', DB_PATHS, ids=os.path.basename)
+def test_load_database(path):
+    """Every json database under data/ builds a ColumnarDB whose items equal the loaded records."""
+
+    with open(path, encoding='utf-8') as f:
+        records = json.load(f)
+    database = ColumnarDB.from_records(records)
+    assert len(database) == len(records)
+    assert list(database) == records
+
+    # The compiled artifact round trips, e.g. the dict '_id' values of some databases
+    arrays, meta = database_to_arrays(database)
+    assert list(database_from_arrays(arrays, meta)) == records
+
+    # The shared memory copy decodes its values on access and looks them up through a hash table
+    arrays['string_index'] = build_string_index(database.values)
+    lazy = database_from_arrays(arrays, meta)
+    assert list(lazy) == records
+    assert all(lazy.value_index.get(value) == i for i, value in enumerate(database.values))
+
+    DBQuery(database)
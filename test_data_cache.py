@@ -0,0 +1,54 @@
+import json, os, pickle, stat
+import data_cache
+from data_cache import compile_file, load_json, artifact_path, StringTableView
+
+
+def _write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(content, f)
+
+
+def test_artifact_dir_gets_the_umask_mode(tmp_path):
+    """The artifact directory is readable by other users like a directory os.makedirs would make, not private."""
+
+    source = str(tmp_path / 'goals.json')
+    _write(source, [{'inform_slots': {}}])
+    umask = os.umask(0o022)
+    try:
+        dest = compile_file(source, 'json')
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(dest).st_mode) == 0o755
+
+
+def test_source_is_only_hashed_again_when_it_changes(tmp_path, monkeypatch):
+    """The stamp file keys the hash on size and mtime, so loading an unchanged source does not read it again."""
+
+    source = str(tmp_path / 'goals.json')
+    _write(source, [1])
+    calls = []
+    source_hash = data_cache.source_hash
+    monkeypatch.setattr(data_cache, 'source_hash', lambda path: calls.append(path) or source_hash(path))
+    first = artifact_path(source)
+    assert artifact_path(source) == first and len(calls) == 1
+
+    _write(source, [1, 2])
+    os.utime(source, ns=(0, 10 ** 9))
+    assert list(load_json(source)) == [1, 2]
+    assert artifact_path(source) != first and len(calls) == 2
+
+
+def test_json_lists_are_memory_mapped_string_tables(tmp_path):
+    """A json list loads as a sequence decoding fresh items from the mapped artifact, other values as json.load."""
+
+    goals = [{'inform_slots': {'city': ['hà nội']}, 'request_slots': {}}, 'text', [1, None]]
+    source, single = str(tmp_path / 'goals.json'), str(tmp_path / 'dict.json')
+    _write(source, goals)
+    _write(single, {'city': ['a', 'b']})
+
+    loaded = load_json(source)
+    assert isinstance(loaded, StringTableView) and list(loaded) == goals
+    loaded[0]['inform_slots'].clear()
+    assert loaded[0] == goals[0]
+    assert list(pickle.loads(pickle.dumps(loaded))) == goals
+    assert load_json(single) == {'city': ['a', 'b']}
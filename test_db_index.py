@@ -0,0 +1,41 @@
+import json, os, random
+import pytest
+from columnar_db import ColumnarDB
+from db_index import InvertedIndex, char_ngrams, NGRAM_SIZE
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+
+
+@pytest.fixture(scope='module')
+def database():
+    with open(DB_PATH, encoding='utf-8') as f:
+        return ColumnarDB.from_records(json.load(f))
+
+
+def test_char_ngrams():
+    assert char_ngrams('abcd') == {'abc', 'bcd'}
+    assert char_ngrams('ab') == set()
+
+
+def test_ngram_shortlist_keeps_every_match(database):
+    """The n-gram shortlist of a child value holds every value of the slot that contains it, and little else."""
+
+    index = InvertedIndex(database)
+    rng = random.Random(0)
+    for slot in sorted(database.list_slots):
+        value_ids = index.slot_arrays[slot][0]
+        values = [database.values[int(value_id)] for value_id in value_ids]
+        strings = [value for value in values if isinstance(value, str) and len(value) >= NGRAM_SIZE]
+        if not strings:
+            continue
+        for _ in range(50):
+            value = rng.choice(strings)
+            start = rng.randrange(len(value) - NGRAM_SIZE + 1)
+            child = value[start:start + rng.randint(NGRAM_SIZE, len(value) - start)]
+            candidates = set(index._candidate_values(slot, child))
+            expected = {p for p, value in enumerate(values) if isinstance(value, str) and child in value}
+            assert expected <= candidates
+            # Every candidate at least has all the n-grams of the child
+            assert all(char_ngrams(child) <= char_ngrams(values[p]) for p in candidates)
+        assert list(index._candidate_values(slot, 'zzqxj')) == []
@@ -0,0 +1,137 @@
+import json, os, random
+from collections import defaultdict
+import pytest
+from db_query import DBQuery
+from dialogue_config import no_query_keys, usersim_default_key
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _matches(children, parent):
+    """The original query check: every child value is a substring of some value of the parent."""
+
+    return all(any(child in parent_value for parent_value in parent) for child in children)
+
+
+def _scan_ids(records, constraints):
+    """The ids of the records that match the constraints, from a linear scan like the original get_db_results."""
+
+    return [i for i, data in enumerate(records)
+            if all(slot in data and _matches(children, data[slot]) for slot, children in constraints.items())]
+
+
+def _random_constraints(records, rng):
+    slots = sorted({slot for data in records for slot, value in data.items() if isinstance(value, list)})
+    constraints = {}
+    for slot in rng.sample(slots, rng.randint(1, 3)):
+        value = rng.choice(records).get(slot) or ['x']
+        constraints[slot] = [rng.choice(value)[:rng.randint(0, 8)] for _ in range(rng.randint(0, 2))]
+    return constraints
+
+
+@pytest.fixture(scope='module')
+def records():
+    return _load(DB_PATH)
+
+
+def test_results_match_a_linear_scan(records):
+    """The inverted index finds the same items as scanning every record, in database order."""
+
+    db_query = DBQuery(records)
+    rng = random.Random(0)
+    for _ in range(300):
+        constraints = _random_constraints(records, rng)
+        expected = _scan_ids(records, constraints)
+        assert db_query.get_db_result_ids(constraints).tolist() == expected
+        assert [int(i) for i in db_query.get_db_results(constraints)] == expected
+
+
+def test_scalar_slots_match_like_the_original_scan():
+    """A scalar slot is matched by iterating its value, like the original check did, instead of matching nothing."""
+
+    records = [{'city': 'ab', 'time': ['morning']},
+               {'city': 'bc', 'time': ['evening']},
+               {'time': ['morning', 'night']}]
+    db_query = DBQuery(records)
+    for constraints in [{'city': ['a']}, {'city': ['b']}, {'city': ['b', 'c']}, {'city': ['ab']}, {'city': []},
+                        {'city': ['c'], 'time': ['even']}, {'unknown': ['a']}]:
+        assert db_query.get_db_result_ids(constraints).tolist() == _scan_ids(records, constraints), constraints
+
+
+def _scan_slot_counts(records, current_informs, no_query):
+    """The counts of get_db_results_for_slots from a linear scan like the original code."""
+
+    counts = {key: 0 for key in current_informs}
+    counts['matching_all_constraints'] = 0
+    for data in records:
+        all_slots_match = True
+        for key, value in current_informs.items():
+            if key in no_query:
+                continue
+            if 'anything' in value:
+                counts[key] += 1
+            elif key in data and _matches(value, data[key]):
+                counts[key] += 1
+            else:
+                all_slots_match = False
+        counts['matching_all_constraints'] += all_slots_match
+    return counts
+
+
+@pytest.mark.parametrize('use_bitsets', [True, False])
+def test_slot_counts_match_a_linear_scan(records, use_bitsets):
+    """The bitset and the set path count the same matches per slot and for all constraints as a scan does."""
+
+    db_query = DBQuery(records, {'db_query': {'use_bitsets': use_bitsets}})
+    rng = random.Random(1)
+    for _ in range(300):
+        current_informs = _random_constraints(records, rng)
+        if rng.random() < 0.2:
+            current_informs['time'] = ['anything']
+        if rng.random() < 0.2:
+            current_informs['_id'] = ['1']
+        assert db_query.get_db_results_for_slots(current_informs) == \
+            _scan_slot_counts(records, current_informs, db_query.no_query)
+
+
+def _scan_fill(records, key, current_informs):
+    """The value fill_inform_slot picks, from a linear scan like the original code."""
+
+    constraints = {k: v for k, v in current_informs.items()
+                   if k != key and k not in no_query_keys and 'anything' not in v and v != 'no match available'}
+    ids = _scan_ids(records, constraints)
+    if key == usersim_default_key:
+        return str(ids[0])
+    ids_no_empty = [i for i in ids if isinstance(records[i].get(key), list) and records[i][key]]
+    counts = defaultdict(int)
+    for i in ids_no_empty or ids:
+        if key in records[i]:
+            counts[tuple(records[i][key])] += 1
+    return list(max(counts, key=counts.get)) if counts else 'no match available'
+
+
+def test_cached_ids_and_lazy_results(records):
+    """Results are cached as read-only id arrays and looked up lazily, with the same items and fills as a scan."""
+
+    db_query = DBQuery(records)
+    rng = random.Random(2)
+    slots = sorted({slot for data in records for slot, value in data.items() if isinstance(value, list)})
+    for _ in range(100):
+        constraints = _random_constraints(records, rng)
+        ids = db_query.get_db_result_ids(constraints)
+        assert not ids.flags.writeable
+        assert db_query.get_db_result_ids(dict(constraints)) is ids
+        results = db_query.get_db_results(constraints)
+        assert dict(results) == {str(i): records[i] for i in _scan_ids(records, constraints)}
+        if len(ids):
+            assert results[str(ids[-1])] == records[ids[-1]]
+        assert str(len(records)) not in results
+        key = rng.choice(slots)
+        assert db_query.fill_inform_slot({key: 'PLACEHOLDER'}, constraints)[key] == \
+            _scan_fill(records, key, constraints)
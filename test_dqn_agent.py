@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+from dqn_agent import DQNAgent
+from utils import mlp_forward
+
+STATE_SIZE = 12
+BATCH_SIZE = 16
+
+
+def _agent(vanilla=True, **agent_constants):
+    constants = {'agent': dict({'max_mem_size': 200, 'vanilla': vanilla, 'learning_rate': 1e-3, 'gamma': 0.9,
+                                'batch_size': BATCH_SIZE, 'dqn_hidden_size': 20, 'epsilon_init': 0.,
+                                'load_weights_file_path': '', 'save_weights_file_path': ''}, **agent_constants)}
+    return DQNAgent(STATE_SIZE, constants)
+
+
+@pytest.mark.parametrize('vanilla', [True, False])
+def test_bellman_targets_match_the_per_sample_loop(vanilla):
+    """The batch targets equal those of the original loop over the samples, for DQN and Double DQN."""
+
+    agent = _agent(vanilla)
+    rng = np.random.default_rng(0)
+    num_actions = agent.num_actions
+    beh_state_preds = rng.normal(size=(BATCH_SIZE, num_actions)).astype(np.float32)
+    tar_next_state_preds = rng.normal(size=(BATCH_SIZE, num_actions)).astype(np.float32)
+    beh_next_states_preds = None if vanilla else rng.normal(size=(BATCH_SIZE, num_actions)).astype(np.float32)
+    actions = rng.integers(num_actions, size=BATCH_SIZE).astype(np.int32)
+    rewards = rng.normal(size=BATCH_SIZE).astype(np.float32)
+    dones = rng.random(BATCH_SIZE) < 0.3
+
+    expected = beh_state_preds.copy()
+    for i, (a, r, d) in enumerate(zip(actions, rewards, dones)):
+        if not vanilla:
+            expected[i][a] = r + agent.gamma * tar_next_state_preds[i][np.argmax(beh_next_states_preds[i])] * (not d)
+        else:
+            expected[i][a] = r + agent.gamma * np.amax(tar_next_state_preds[i]) * (not d)
+
+    targets = agent._bellman_targets(beh_state_preds, actions, rewards, dones, tar_next_state_preds,
+                                     beh_next_states_preds)
+    np.testing.assert_allclose(targets, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize('batch_size, steps', [(16, [16]), (32, [32]), (80, [32, 32, 16])])
+def test_train_takes_the_steps_of_fit(batch_size, steps):
+    """Every batch takes the gradient steps fit(epochs=1) took, one per 32 samples."""
+
+    agent = _agent(batch_size=batch_size)
+    for i in range(batch_size * 2):
+        agent.add_experience(np.full((STATE_SIZE,), i), i % agent.num_actions, 1., np.zeros((STATE_SIZE,)), False)
+    step_sizes = []
+    agent.beh_model.train_on_batch = lambda states, targets: step_sizes.append(len(states))
+    agent.train()
+    assert step_sizes == steps * 2
+
+
+def test_numpy_inference_matches_keras():
+    """The NumPy forward pass used to act gives the predictions of the keras behavior model, also after training."""
+
+    agent = _agent()
+    states = np.random.default_rng(1).random((5, STATE_SIZE)).astype(np.float32)
+    for _ in range(2):
+        expected = agent._dqn_predict(states)
+        np.testing.assert_allclose(mlp_forward(states, agent.get_inference_weights()), expected, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(agent._dqn_predict_one(states[0]), expected[0], rtol=1e-5, atol=1e-6)
+        assert agent._dqn_action(states[0])[0] == np.argmax(expected[0])
+        for i in range(BATCH_SIZE):
+            agent.add_experience(states[i % 5], i % agent.num_actions, 1., states[(i + 1) % 5], False)
+        agent.train()
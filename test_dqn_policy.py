@@ -0,0 +1,51 @@
+import copy
+import pytest
+from dialogue_config import agent_actions, rule_requests
+from dqn_policy import DQNPolicy, RuleState, action_table
+from frame import Frame
+
+CONSTANTS = {'agent': {'epsilon_init': 0.}}
+
+
+def _scan_index(response):
+    """The index of the first equal possible action, like the original linear scan."""
+
+    for i, action in enumerate(agent_actions):
+        if response == action:
+            return i
+    raise ValueError('Response: {} not found in possible actions'.format(response))
+
+
+def test_action_table_matches_a_linear_scan():
+    """Every possible action maps to the index the scan finds, as a dict or a Frame, and back to an equal copy."""
+
+    for i, action in enumerate(agent_actions):
+        expected = _scan_index(action)
+        assert action_table.index_of(action) == expected
+        assert action_table.index_of(Frame.from_dict(action)) == expected
+        instance = action_table.instantiate(i)
+        assert instance.to_dict() == action
+        # The copy is free to edit, like the deep copy it replaces
+        for slot in instance['inform_slots']:
+            instance['inform_slots'][slot] = 'value'
+        instance['request_slots']['extra'] = 'UNK'
+        assert action_table.instantiate(i).to_dict() == copy.deepcopy(action)
+
+    with pytest.raises(ValueError):
+        action_table.index_of({'intent': 'request', 'inform_slots': {}, 'request_slots': {'not a slot': 'UNK'}})
+    with pytest.raises(ValueError):
+        action_table.instantiate(len(agent_actions))
+
+
+def test_rule_actions_match_a_linear_scan():
+    """The rule-based policy requests every rule slot, then says match_found and done, with the indices of the scan."""
+
+    policy = DQNPolicy(CONSTANTS)
+    rule_state = RuleState()
+    expected = [{'intent': 'request', 'inform_slots': {}, 'request_slots': {slot: 'UNK'}} for slot in rule_requests]
+    expected += [{'intent': 'match_found', 'inform_slots': {}, 'request_slots': {}},
+                 {'intent': 'done', 'inform_slots': {}, 'request_slots': {}}]
+    for response in expected:
+        index, action = policy._rule_action(rule_state)
+        assert action.to_dict() == response and index == _scan_index(response)
+    assert policy._rule_action(rule_state)[0] == _scan_index(expected[-1])
@@ -0,0 +1,68 @@
+import random
+import numpy as np
+import pytest
+from error_model_controller import ErrorModelController
+from frame import Frame
+
+DB_DICT = {'city': ['a', 'b', 'c'], 'time': ['1', '2']}
+NUM_FRAMES = 20000
+
+
+def _emc(slot_error_mode, slot_error_prob=0.6, intent_error_prob=0.1, seed=0):
+    constants = {'emc': {'slot_error_prob': slot_error_prob, 'slot_error_mode': slot_error_mode,
+                         'intent_error_prob': intent_error_prob}}
+    return ErrorModelController(DB_DICT, constants, rng=random.Random(seed), batch_rng=np.random.default_rng(seed))
+
+
+def _frame():
+    return Frame('inform', {'city': ['x'], 'time': ['y'], 'activity': ['z']})
+
+
+def _stats(frames):
+    """The fractions of frames with each slot kept, replaced by each value or missing, and with a new intent."""
+
+    stats = {'intent_changed': np.mean([frame['intent'] != 'inform' for frame in frames]),
+             'activity_kept': np.mean([frame['inform_slots'].get('activity') == ['z'] for frame in frames])}
+    for slot, values in DB_DICT.items():
+        for value in [None, 'x', 'y'] + values:
+            stats[slot, value] = np.mean([frame['inform_slots'].get(slot, [None]) == [value] for frame in frames])
+    return stats
+
+
+@pytest.mark.parametrize('slot_error_mode', [0, 1, 2, 3])
+def test_batched_errors_follow_the_single_frame_probabilities(slot_error_mode):
+    """infuse_errors makes every kind of error as often as infuse_error, it only draws the decisions differently."""
+
+    emc = _emc(slot_error_mode)
+    single = [_frame() for _ in range(NUM_FRAMES)]
+    for frame in single:
+        emc.infuse_error(frame)
+    batched = [_frame() for _ in range(NUM_FRAMES)]
+    for start in range(0, NUM_FRAMES, 16):
+        emc.infuse_errors(batched[start:start + 16])
+
+    single_stats, batched_stats = _stats(single), _stats(batched)
+    assert batched_stats['activity_kept'] == 1.
+    for key, fraction in single_stats.items():
+        assert abs(batched_stats[key] - fraction) < 0.015, key
+
+
+def test_per_frame_generators_do_not_depend_on_the_batch():
+    """With a generator per frame, a frame gets the same errors alone or batched with others."""
+
+    emc = _emc(3, slot_error_prob=0.5, intent_error_prob=0.5)
+    batched = [_frame() for _ in range(8)]
+    emc.infuse_errors(batched, [np.random.default_rng(i) for i in range(8)])
+    for i in [0, 5]:
+        alone = _frame()
+        emc.infuse_errors([alone], [np.random.default_rng(i)])
+        assert alone == batched[i]
+
+
+def test_certain_and_impossible_errors():
+    frames = [_frame() for _ in range(4)]
+    _emc(0, slot_error_prob=0., intent_error_prob=0.).infuse_errors(frames)
+    assert all(frame == _frame() for frame in frames)
+    _emc(2, slot_error_prob=1., intent_error_prob=0.).infuse_errors(frames)
+    assert all(frame['inform_slots'] == {'activity': ['z']} for frame in frames)
+    _emc(0, intent_error_prob=1.).infuse_errors([])
@@ -0,0 +1,48 @@
+import gzip, json, os
+import numpy as np
+from columnar_db import ColumnarDB
+from dialogue_config import agent_actions
+from evaluate import evaluate
+from state_tracker import StateTracker
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+GOALS_PATH = os.path.join(DATA_DIR, 'activity_user_goals_limited_slots_multi_req_slots_merge_address_1400.json')
+DICT_PATH = os.path.join(DATA_DIR, 'activity_dict_newest.json')
+# No 'db_file_paths': the workers get the data from the evaluating process
+CONSTANTS = {'agent': {'epsilon_init': 0.}, 'run': {'max_round_num': 20},
+             'emc': {'slot_error_prob': 0.05, 'slot_error_mode': 0, 'intent_error_prob': 0.02}}
+NUM_EPISODES = 30
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _weights(state_size, seed=0):
+    rng = np.random.default_rng(seed)
+    sizes = [state_size, 20, len(agent_actions)]
+    return [w for i in range(2) for w in (rng.normal(size=sizes[i:i + 2]), rng.normal(size=sizes[i + 1]))]
+
+
+def test_workers_share_the_data_and_the_epsilon(tmp_path):
+    """The workers attach to the data of the evaluating process and act with the given epsilon, reproducibly."""
+
+    database, goals, db_dict = ColumnarDB.from_records(_load(DB_PATH)), _load(GOALS_PATH), _load(DICT_PATH)[0]
+    weights = _weights(StateTracker(database, CONSTANTS).get_state_size())
+    transcript_path = str(tmp_path / 'transcripts.jsonl.gz')
+
+    greedy = evaluate(CONSTANTS, weights, database, db_dict, goals, NUM_EPISODES, num_envs=4, num_workers=2, seed=7,
+                      transcript_path=transcript_path)
+    assert greedy['episodes'] == NUM_EPISODES
+    with gzip.open(transcript_path, 'rt', encoding='utf-8') as f:
+        transcripts = [json.loads(line) for line in f]
+    assert [transcript['episode'] for transcript in transcripts] == list(range(NUM_EPISODES))
+    assert sum(transcript['success'] for transcript in transcripts) == round(greedy['success_rate'] * NUM_EPISODES)
+
+    exploring = evaluate(CONSTANTS, weights, database, db_dict, goals, NUM_EPISODES, num_envs=4, num_workers=2,
+                         seed=7, eps=0.5)
+    assert exploring == evaluate(CONSTANTS, weights, database, db_dict, goals, NUM_EPISODES, num_envs=4,
+                                 num_workers=2, seed=7, eps=0.5)
+    assert exploring['agent_intents'] != greedy['agent_intents']
@@ -0,0 +1,34 @@
+import pickle
+import pytest
+from frame import Frame, intents
+from user import User
+
+
+def test_frame_reads_and_writes_like_the_dict_format():
+    action = {'intent': 'request', 'inform_slots': {'city': ['a']}, 'request_slots': {'time': 'UNK'}}
+    frame = Frame.from_dict(action)
+    assert frame == action and frame.to_dict() == action
+    assert list(frame) == ['intent', 'inform_slots', 'request_slots'] and 'round' not in frame
+    with pytest.raises(KeyError):
+        frame['round']
+    assert frame.get('round', -1) == -1
+
+    frame.update({'round': 2, 'speaker': 'User'})
+    assert frame['round'] == 2 and frame['speaker'] == 'User' and len(frame) == 5
+    frame['inform_slots']['city'] = ['b']
+    assert action['inform_slots'] == {'city': ['a']}
+    with pytest.raises(KeyError):
+        frame['other'] = 1
+    assert pickle.loads(pickle.dumps(frame)) == frame
+
+
+def test_max_round_response_is_a_done_frame():
+    """The response at the last round is a done frame built directly, no empty intent is added to the intent table."""
+
+    num_intents = len(intents.names)
+    user = User({'run': {'max_round_num': 20}})
+    response, reward, done, success = user.step({'intent': 'request', 'inform_slots': {},
+                                                 'request_slots': {'time': 'UNK'}, 'round': 20})
+    assert response == {'intent': 'done', 'inform_slots': {}, 'request_slots': {}}
+    assert done and not success and reward < 0
+    assert '' not in intents.ids and len(intents.names) == num_intents
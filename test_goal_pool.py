@@ -0,0 +1,54 @@
+import copy, random
+from columnar_db import ColumnarDB
+from goal_pool import GoalPool
+from shared_data import SharedData
+
+GOALS = [{'request_slots': {}, 'diaact': 'request', 'inform_slots': {'name_activity': ['a'], 'time': ['b', 'c']}},
+         {'request_slots': {'reward': 'UNK'}, 'diaact': 'request', 'inform_slots': {'city': ['d']}}]
+
+
+def test_working_copies_do_not_change_the_pool():
+    """Edits to a sampled goal, like the user sim. makes during an episode, never reach the pool."""
+
+    goals = copy.deepcopy(GOALS)
+    pool = GoalPool(goals)
+    rng = random.Random(0)
+    for _ in range(10):
+        goal = pool.sample(rng)
+        goal['request_slots']['activity'] = 'UNK'
+        goal['inform_slots'].popitem()
+        goal['inform_slots'].get('time', []).append('e')
+    assert list(pool) == GOALS
+    assert goals == GOALS
+
+
+def test_shared_goals_are_not_copied_into_the_pool():
+    """A pool over the shared goals decodes only the goal it hands out instead of freezing the whole table."""
+
+    database = ColumnarDB.from_records([{'name_activity': ['a'], 'time': ['b', 'c']}])
+    with SharedData.create(database, {'city': ['d']}, GOALS) as shared:
+        pool = GoalPool(shared.user_goals)
+        assert pool.goals is shared.user_goals
+        goal = pool[0]
+        goal['inform_slots'].clear()
+        assert list(pool) == GOALS
+
+
+def test_answers_compare_whole_values():
+    """An item satisfies a goal only if each constrained slot holds the same value, a list in the same order."""
+
+    database = ColumnarDB.from_records([{'time': ['b', 'c'], 'city': 'd', 'name_activity': ['a']},
+                                        {'time': ['c', 'b'], 'city': 'd'},
+                                        {'time': ['b'], 'city': 'e', 'name_activity': ['a']},
+                                        {'time': [], 'city': 'd'}])
+    goals = [{'inform_slots': {'time': ['b', 'c']}},
+             {'inform_slots': {'city': 'd', 'name_activity': ['a']}},
+             {'inform_slots': {'time': []}},
+             {'inform_slots': {'city': ['d']}},
+             {'inform_slots': {'time': 'b', 'unknown': ['x']}},
+             {'inform_slots': {'_id': 3}}]
+    answers = GoalPool(goals).answers(database)
+    assert [None if ids is None else ids.tolist() for ids in map(answers.get, range(len(goals)))] == \
+        [[0], [0], [3], [], [], None]
+    assert answers.lookup({'city': 'd'}).tolist() == [0, 1, 3]
+    assert answers.report()['unsatisfiable'] == [3, 4]
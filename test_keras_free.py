@@ -0,0 +1,16 @@
+import os, subprocess, sys
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.parametrize('script', ['train.py', 'test.py', 'evaluate.py', 'actor_learner.py', 'sweep.py'])
+def test_spawned_workers_do_not_load_keras(script):
+    """A spawned actor or worker runs the launching script again as __mp_main__, which must not import keras."""
+
+    code = ('import runpy, sys\n'
+            'runpy.run_path({!r}, run_name="__mp_main__")\n'
+            'assert "keras" not in sys.modules, "keras loaded"\n').format(os.path.join(REPO_DIR, script))
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0, result.stderr
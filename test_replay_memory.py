@@ -0,0 +1,73 @@
+import numpy as np
+from replay_memory import ReplayMemory
+
+STATE_SIZE = 3
+
+
+def _experience(i):
+    return np.full((STATE_SIZE,), i), i, float(i), np.full((STATE_SIZE,), -i), i % 2 == 0
+
+
+def _stored(memory):
+    """The experience numbers held by the memory, oldest first."""
+
+    order = (memory.index - memory.size + np.arange(memory.size)) % memory.max_size
+    return memory.actions[order].tolist()
+
+
+def test_ring_overwrites_the_oldest_experience():
+    memory = ReplayMemory(4, STATE_SIZE)
+    for i in range(3):
+        memory.add(*_experience(i))
+    assert len(memory) == 3 and not memory.is_full()
+    for i in range(3, 7):
+        memory.add(*_experience(i))
+    assert memory.is_full() and len(memory) == 4
+    assert _stored(memory) == [3, 4, 5, 6]
+    for j in range(4):
+        i = int(memory.actions[j])
+        assert memory.states[j].tolist() == [i] * STATE_SIZE and memory.next_states[j].tolist() == [-i] * STATE_SIZE
+        assert memory.rewards[j] == i and memory.dones[j] == (i % 2 == 0)
+    assert memory.states.dtype == np.float32
+    memory.clear()
+    assert len(memory) == 0 and memory.states.shape == (4, STATE_SIZE)
+
+
+def test_sample_returns_distinct_stored_experiences():
+    memory = ReplayMemory(8, STATE_SIZE)
+    for i in range(11):
+        memory.add(*_experience(i))
+    states, actions, rewards, next_states, dones = memory.sample(8)
+    assert sorted(actions.tolist()) == list(range(3, 11))
+    assert np.array_equal(states[:, 0], actions) and np.array_equal(next_states[:, 0], -actions)
+    assert np.array_equal(rewards, actions) and np.array_equal(dones, actions % 2 == 0)
+
+
+def test_add_batch_matches_adding_one_at_a_time():
+    """A batch wraps around the ring, and a batch longer than the memory keeps only its newest experiences."""
+
+    for sizes in [[2, 3], [3, 3, 3], [9], [1, 6, 2]]:
+        one, batch = ReplayMemory(5, STATE_SIZE), ReplayMemory(5, STATE_SIZE)
+        start = 0
+        for size in sizes:
+            experiences = [_experience(i) for i in range(start, start + size)]
+            for experience in experiences:
+                one.add(*experience)
+            batch.add_batch(*[np.array(column) for column in zip(*experiences)])
+            start += size
+            assert (batch.index, batch.size) == (one.index, one.size)
+            for name in ['states', 'actions', 'rewards', 'next_states', 'dones']:
+                assert np.array_equal(getattr(batch, name), getattr(one, name))
+
+
+def test_seeded_sample_is_reproducible():
+    """Sampling from a seeded stream draws distinct stored experiences, and the same stream draws the same batch."""
+
+    actions = []
+    for _ in range(2):
+        memory = ReplayMemory(8, STATE_SIZE, rng=np.random.default_rng(0))
+        for i in range(11):
+            memory.add(*_experience(i))
+        actions.append(memory.sample(8)[1])
+    assert sorted(actions[0].tolist()) == list(range(3, 11))
+    assert np.array_equal(actions[0], actions[1])
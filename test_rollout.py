@@ -0,0 +1,115 @@
+import json, os
+import numpy as np
+import pytest
+from columnar_db import ColumnarDB
+from dqn_policy import DQNPolicy, RuleState
+from rollout import BatchRollout
+from seeding import root_entropy
+from state_tracker import StateTracker
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+GOALS_PATH = os.path.join(DATA_DIR, 'activity_user_goals_limited_slots_multi_req_slots_merge_address_1400.json')
+DICT_PATH = os.path.join(DATA_DIR, 'activity_dict_newest.json')
+CONSTANTS = {'agent': {'epsilon_init': 0.}, 'run': {'max_round_num': 20},
+             'emc': {'slot_error_prob': 0.05, 'slot_error_mode': 0, 'intent_error_prob': 0.02}}
+NUM_ENVS = 4
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class RecordingPolicy(DQNPolicy):
+    """A greedy policy over random weights that records the experiences instead of learning from them."""
+
+    def __init__(self, constants, state_size, seed=0):
+        super().__init__(constants)
+        rng = np.random.default_rng(seed)
+        sizes = [state_size, 20, self.num_actions]
+        self.set_inference_weights([w for i in range(2)
+                                    for w in (rng.normal(size=sizes[i:i + 2]), rng.normal(size=sizes[i + 1]))])
+        self.experiences = []
+
+    def add_experience(self, state, action, reward, next_state, done):
+        # The rollout reuses its state buffers
+        self.experiences.append((state.copy(), action, reward, next_state.copy(), done))
+
+
+@pytest.fixture(scope='module')
+def data():
+    return ColumnarDB.from_records(_load(DB_PATH)), _load(GOALS_PATH), _load(DICT_PATH)[0]
+
+
+def test_batched_actions_match_single_actions(data):
+    database, _, _ = data
+    policy = RecordingPolicy(CONSTANTS, StateTracker(database, CONSTANTS).get_state_size())
+    states = np.random.default_rng(1).random((6, policy.inference_weights[0].shape[0]))
+    batched = policy.get_actions(states)
+    assert [index for index, _ in batched] == [policy.get_action(state)[0] for state in states]
+    assert [dict(action) for _, action in batched] == [dict(policy.get_action(state)[1]) for state in states]
+
+    # Each dialogue follows the rule-based policy with its own progress
+    rule_states = [RuleState() for _ in range(3)]
+    for _ in range(2):
+        policy.get_actions(states[:2], use_rule=True, rule_states=rule_states[:2])
+    rule_actions = [index for index, _ in policy.get_actions(states[:3], use_rule=True, rule_states=rule_states)]
+    rule_state = RuleState()
+    expected = [policy._rule_action(rule_state)[0] for _ in range(3)]
+    assert rule_actions == [expected[2], expected[2], expected[0]]
+
+
+@pytest.mark.parametrize('warmup', [True, False])
+def test_lockstep_dialogues_chain_their_experiences(data, warmup):
+    """Every round adds one experience per dialogue, each continuing from the last state of its own dialogue."""
+
+    database, goals, db_dict = data
+    policy = RecordingPolicy(CONSTANTS, StateTracker(database, CONSTANTS).get_state_size())
+    rollout = BatchRollout(policy, goals, database, db_dict, CONSTANTS, NUM_ENVS)
+    finished = []
+    for _ in range(100):
+        finished += rollout.step(warmup=warmup)
+    assert len(policy.experiences) == 100 * NUM_ENVS
+
+    episodes = []
+    rewards = [0.] * NUM_ENVS
+    last_states = [None] * NUM_ENVS
+    for n, (state, _, reward, next_state, done) in enumerate(policy.experiences):
+        i = n % NUM_ENVS
+        if last_states[i] is not None:
+            assert np.array_equal(state, last_states[i])
+        rewards[i] += reward
+        last_states[i] = None if done else next_state
+        if done:
+            episodes.append(rewards[i])
+            rewards[i] = 0.
+    assert len(finished) == len(episodes) > 0
+    assert [reward for reward, _ in finished] == episodes
+
+
+def test_seeded_dialogues_do_not_depend_on_the_split(data):
+    """With a seed, every dialogue plays out the same whether the dialogues of a run are stepped together or split."""
+
+    database, goals, db_dict = data
+    constants = dict(CONSTANTS, agent={'epsilon_init': 0.2})
+    state_size = StateTracker(database, constants).get_state_size()
+
+    def play(splits, warmup, entropy=root_entropy(1234)):
+        dialogues = {}
+        env_offset = 0
+        for num_envs in splits:
+            policy = RecordingPolicy(constants, state_size)
+            rollout = BatchRollout(policy, goals, database, db_dict, constants, num_envs, env_offset, entropy)
+            for _ in range(40):
+                rollout.step(warmup=warmup)
+            for n, (state, action, reward, next_state, done) in enumerate(policy.experiences):
+                dialogues.setdefault(env_offset + n % num_envs, []).append(
+                    (state.tolist(), action, reward, next_state.tolist(), done))
+            env_offset += num_envs
+        return dialogues
+
+    for warmup in [True, False]:
+        together = play([6], warmup)
+        assert play([2, 4], warmup) == together and play([1] * 6, warmup) == together
+        assert play([6], warmup, root_entropy(4321)) != together
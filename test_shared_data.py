@@ -0,0 +1,62 @@
+import json, os, random
+from columnar_db import ColumnarDB
+from db_query import DBQuery
+from goal_pool import GoalPool
+from shared_data import SharedData
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+GOALS_PATH = os.path.join(DATA_DIR, 'activity_user_goals_limited_slots_multi_req_slots_merge_address_1400.json')
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_attached_data_matches_the_private_data():
+    """A worker attached to the shared block gets the same items, index matches and goal answers as a private copy."""
+
+    records, goals = _load(DB_PATH), _load(GOALS_PATH)
+    database = ColumnarDB.from_records(records)
+    pool = GoalPool(goals)
+    with SharedData.create(database, {'city': ['a', 'b']}, goals) as created, \
+            SharedData.attach(created.handle) as shared:
+        assert list(shared.database) == records
+        for value_id, value in enumerate(database.values):
+            assert shared.database.value_index.get(value) == value_id
+        assert shared.database.value_index.get('not a value') is None
+
+        rng = random.Random(0)
+        index = DBQuery(database).index
+        shared_index = DBQuery(shared.database).index
+        slots = sorted(database.list_slots)
+        for _ in range(200):
+            constraints = {}
+            for slot in rng.sample(slots, rng.randint(1, 3)):
+                value = rng.choice(records).get(slot) or ['x']
+                constraints[slot] = [rng.choice(value)[:rng.randint(0, 6)]]
+            assert shared_index.match(constraints) == index.match(constraints)
+
+        answers = pool.answers(database)
+        shared_answers = shared.goal_pool.answers(shared.database)
+        for i, goal in enumerate(goals):
+            expected, shared_ids = answers.get(i), shared_answers.get(i)
+            assert (expected is None) == (shared_ids is None)
+            if expected is not None:
+                assert shared_ids.tolist() == expected.tolist()
+        assert shared_answers.report() == answers.report()
+
+
+def test_attached_data_is_not_copied():
+    """The values, index and answers of an attached worker are views of the shared block, not private copies."""
+
+    records, goals = _load(DB_PATH), _load(GOALS_PATH)
+    with SharedData.create(ColumnarDB.from_records(records), {'city': ['a']}, goals) as created, \
+            SharedData.attach(created.handle) as shared:
+        shared_arrays = shared.block.arrays.values()
+        assert not isinstance(shared.database.values, list)
+        for array in list(shared.database.index.arrays.values()) + list(shared.goal_pool.answers(shared.database)
+                                                                          .arrays.values()):
+            assert not array.flags.writeable
+            assert any(array is shared_array for shared_array in shared_arrays)
@@ -0,0 +1,56 @@
+import json, os, random
+import numpy as np
+from columnar_db import ColumnarDB
+from dqn_policy import action_table
+from error_model_controller import ErrorModelController
+from frame import Frame
+from state_tracker import StateTracker
+from user_simulator import UserSimulator
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+GOALS_PATH = os.path.join(DATA_DIR, 'activity_user_goals_limited_slots_multi_req_slots_merge_address_1400.json')
+DICT_PATH = os.path.join(DATA_DIR, 'activity_dict_newest.json')
+CONSTANTS = {'run': {'max_round_num': 20},
+             'emc': {'slot_error_prob': 0.05, 'slot_error_mode': 0, 'intent_error_prob': 0.02}}
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_incremental_state_matches_a_full_rebuild():
+    """Updating only the changed segments gives the state of rebuilding it every turn, for the same dialogues."""
+
+    database = ColumnarDB.from_records(_load(DB_PATH))
+    user = UserSimulator(_load(GOALS_PATH), CONSTANTS, database, rng=random.Random(1))
+    emc = ErrorModelController(_load(DICT_PATH)[0], CONSTANTS, rng=random.Random(2),
+                               batch_rng=np.random.default_rng(3))
+    incremental = StateTracker(database, dict(CONSTANTS, state_tracker={'incremental': True}))
+    full = StateTracker(database, dict(CONSTANTS, state_tracker={'incremental': False}))
+    rng = random.Random(0)
+    turns = 0
+    for _ in range(100):
+        incremental.reset()
+        full.reset()
+        user_action = user.reset()
+        emc.infuse_error(user_action)
+        incremental.update_state_user(user_action)
+        full.update_state_user(Frame.from_dict(user_action))
+        assert np.array_equal(incremental.get_state(), full.get_state())
+        done = False
+        while not done:
+            index = rng.randrange(len(action_table))
+            agent_action, full_agent_action = action_table.instantiate(index), action_table.instantiate(index)
+            incremental.update_state_agent(agent_action)
+            full.update_state_agent(full_agent_action)
+            assert agent_action == full_agent_action
+            user_action, _, done, _ = user.step(agent_action)
+            if not done:
+                emc.infuse_error(user_action)
+            incremental.update_state_user(user_action)
+            full.update_state_user(Frame.from_dict(user_action))
+            assert np.array_equal(incremental.get_state(done), full.get_state(done))
+            turns += 1
+    assert turns > 500
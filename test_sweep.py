@@ -0,0 +1,56 @@
+import csv, os
+import pytest
+from sweep import apply_overrides, grid_trials, run_sweep
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def _constants(cache_dir):
+    return {'db_file_paths': {
+                'database': os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json'),
+                'dict': os.path.join(DATA_DIR, 'activity_dict_newest.json'),
+                'user_goals': os.path.join(DATA_DIR,
+                                           'activity_user_goals_limited_slots_multi_req_slots_merge_address_1400.json'),
+                'cache_dir': cache_dir},
+            'run': {'usersim': True, 'warmup_mem': 40, 'num_ep_run': 4, 'train_freq': 2,
+                    'success_rate_threshold': 0.3, 'max_round_num': 20},
+            'agent': {'max_mem_size': 200, 'vanilla': True, 'learning_rate': 1e-3, 'gamma': 0.9, 'batch_size': 16,
+                      'dqn_hidden_size': 20, 'epsilon_init': 0., 'load_weights_file_path': '',
+                      'save_weights_file_path': ''},
+            'emc': {'slot_error_prob': 0.05, 'slot_error_mode': 0, 'intent_error_prob': 0.02}}
+
+
+def test_run_sweep_without_trials(tmp_path):
+    """An empty search space runs no trials and writes an empty summary instead of starting a pool of 0 workers."""
+
+    assert grid_trials({'agent.learning_rate': []}) == []
+    assert run_sweep({}, [], str(tmp_path)) == []
+    assert os.path.exists(os.path.join(str(tmp_path), 'summary.csv'))
+
+
+def test_data_files_cannot_be_swept(tmp_path):
+    """The data is loaded once for all the trials, so overriding its files is an error instead of being ignored."""
+
+    constants = _constants(str(tmp_path))
+    assert apply_overrides(constants, {'run.train_freq': 5})['run']['train_freq'] == 5
+    assert constants['run']['train_freq'] == 2
+    with pytest.raises(ValueError):
+        apply_overrides(constants, {'db_file_paths.user_goals': 'goals.json'})
+    with pytest.raises(ValueError):
+        run_sweep(constants, [{'db_file_paths.database': 'db.json'}], str(tmp_path))
+
+
+def test_failed_trial_is_recorded(tmp_path):
+    """A trial that raises gets a row with its error and empty results, and the other trials still finish."""
+
+    pytest.importorskip('keras')
+    out_dir = str(tmp_path / 'sweep')
+    results = run_sweep(_constants(str(tmp_path)), grid_trials({'run.train_freq': [0, 2]}), out_dir, max_workers=2)
+    assert [result['trial'] for result in results] == [1, 0]
+    assert results[0]['periods'] == 2 and 'error' not in results[0]
+    assert results[1]['error'].startswith('ZeroDivisionError') and 'periods' not in results[1]
+
+    with open(os.path.join(out_dir, 'summary.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['trial'] for row in rows] == ['1', '0']
+    assert rows[1]['best_success_rate'] == '' and rows[1]['error'] == results[1]['error']
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip('keras')
+import train
+from data_cache import load_database, load_json
+from test_sweep import _constants
+
+
+@pytest.mark.parametrize('num_envs', [1, 3])
+def test_train_agent_keeps_its_components_to_itself(tmp_path, num_envs):
+    """Every run builds its own components, nothing is left in module globals for another run to pick up."""
+
+    constants = _constants(str(tmp_path))
+    constants['run']['num_envs'] = num_envs
+    paths = constants['db_file_paths']
+    database = load_database(paths['database'], paths['cache_dir'])
+    db_dict = load_json(paths['dict'], paths['cache_dir'])[0]
+    user_goals = load_json(paths['user_goals'], paths['cache_dir'])
+
+    first = train.Trainer(constants, database, db_dict, user_goals)
+    second = train.Trainer(constants, database, db_dict, user_goals)
+    assert first.dqn_agent is not second.dqn_agent and first.user is not second.user
+    # The batched loop also ends the periods of the episodes finished in the last step
+    history = first.train()
+    assert [period['episode'] for period in history][:2] == [2, 4]
+    assert second.period_history == [] and len(second.dqn_agent.memory) == 0
+    assert [period['episode'] for period in train.train_agent(constants, database, db_dict, user_goals)][:2] == [2, 4]
+    for name in ['user', 'emc', 'state_tracker', 'dqn_agent', 'rollout', 'period_history', 'WARMUP_MEM']:
+        assert not hasattr(train, name)
@@ -0,0 +1,90 @@
+import copy, json, os, random
+import numpy as np
+import pytest
+from columnar_db import ColumnarDB
+from dqn_policy import action_table
+from error_model_controller import ErrorModelController
+from state_tracker import StateTracker
+from user_simulator import UserSimulator
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DB_PATH = os.path.join(DATA_DIR, 'activity_db_limited_slots_multi_req_slots_merge_address_1400.json')
+GOALS_PATH = os.path.join(DATA_DIR, 'activity_user_goals_limited_slots_multi_req_slots_merge_address_1400.json')
+DICT_PATH = os.path.join(DATA_DIR, 'activity_dict_newest.json')
+# Frequent errors, so the error model controller edits most responses
+CONSTANTS = {'run': {'max_round_num': 20},
+             'emc': {'slot_error_prob': 0.5, 'slot_error_mode': 0, 'intent_error_prob': 0.2}}
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _play(database, goals, db_dict, constants, episodes=100, copy_responses=False):
+    """
+    Plays seeded dialogues of random agent actions and returns every state, agent action, response and reward.
+
+    With copy_responses the error model controller and state tracker get a deep copy of every user sim. response,
+    like before the responses shared their slot values with the user sim.
+    """
+
+    user = UserSimulator(goals, constants, database, rng=random.Random(1))
+    emc = ErrorModelController(db_dict, constants, rng=random.Random(2), batch_rng=np.random.default_rng(3))
+    state_tracker = StateTracker(database, constants)
+    rng = random.Random(0)
+    trajectory = []
+    for _ in range(episodes):
+        state_tracker.reset()
+        user_action = user.reset()
+        if copy_responses:
+            user_action = copy.deepcopy(user_action)
+        emc.infuse_error(user_action)
+        state_tracker.update_state_user(user_action)
+        trajectory.append(('reset', user_action.to_dict(), state_tracker.get_state().tolist()))
+        done = False
+        while not done:
+            agent_action = action_table.instantiate(rng.randrange(len(action_table)))
+            state_tracker.update_state_agent(agent_action)
+            user_action, reward, done, success = user.step(agent_action)
+            if copy_responses:
+                user_action = copy.deepcopy(user_action)
+            if not done:
+                emc.infuse_error(user_action)
+            state_tracker.update_state_user(user_action)
+            trajectory.append((agent_action.to_dict(), user_action.to_dict(), reward, success,
+                               state_tracker.get_state(done).tolist()))
+    return trajectory
+
+
+# Replacing a value and deleting a slot, the modes that replace a slot can add slots unknown to the state tracker
+@pytest.mark.parametrize('slot_error_mode', [0, 2])
+def test_responses_without_deep_copies_play_out_the_same(slot_error_mode):
+    """The receivers editing the responses do not leak into the user sim. or its goals."""
+
+    records, goals = _load(DB_PATH), _load(GOALS_PATH)
+    database, db_dict = ColumnarDB.from_records(records), _load(DICT_PATH)[0]
+    constants = dict(CONSTANTS, emc=dict(CONSTANTS['emc'], slot_error_mode=slot_error_mode))
+    shared = _play(database, goals, db_dict, constants)
+    assert shared == _play(database, goals, db_dict, constants, copy_responses=True)
+    assert len(shared) > 500
+    assert goals == _load(GOALS_PATH) and list(database) == records
+
+
+def test_fast_mode_plays_out_like_checked_mode():
+    """Fast mode plays the same dialogues as checked mode, only checked mode rejects a bad agent action."""
+
+    database, goals, db_dict = ColumnarDB.from_records(_load(DB_PATH)), _load(GOALS_PATH), _load(DICT_PATH)[0]
+    checked = dict(CONSTANTS, usersim={'checked': True})
+    fast = dict(CONSTANTS, usersim={'checked': False})
+    assert _play(database, goals, db_dict, checked) == _play(database, goals, db_dict, fast)
+
+    bad_action = {'intent': 'inform', 'inform_slots': {'city': 'PLACEHOLDER'}, 'request_slots': {}, 'round': 1}
+    for constants in [checked, fast]:
+        user = UserSimulator(goals, constants, database, rng=random.Random(1))
+        user.reset()
+        if constants['usersim']['checked']:
+            with pytest.raises(AssertionError):
+                user.step(bad_action)
+        else:
+            user.step(bad_action)
@@ -0,0 +1,17 @@
+import numpy as np
+from utils import mlp_forward
+
+
+def test_mlp_forward():
+    """Every layer but the last is relu, the last is linear."""
+
+    rng = np.random.default_rng(0)
+    weights = [rng.normal(size=shape).astype(np.float32) for shape in [(6, 4), (4,), (4, 3), (3,), (3, 2), (2,)]]
+    states = rng.normal(size=(5, 6)).astype(np.float32)
+    expected = states
+    for layer in range(3):
+        expected = expected @ weights[2 * layer] + weights[2 * layer + 1]
+        if layer < 2:
+            expected = np.where(expected > 0, expected, 0)
+    np.testing.assert_allclose(mlp_forward(states, weights), expected, rtol=1e-6)
+    np.testing.assert_allclose(mlp_forward(states[:1], weights), expected[:1], rtol=1e-6)
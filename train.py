@@ -1,144 +1,305 @@
 from user_simulator import UserSimulator
 from error_model_controller import ErrorModelController
-from dqn_agent import DQNAgent
 from state_tracker import StateTracker
+from rollout import BatchRollout
+from actor_learner import ActorLearner
 import pickle, argparse, json, math
 from utils import remove_empty_slots
 from user import User
+from data_cache import load_database, load_json
+from shared_data import SharedData
+from seeding import EnvStreams, learner_generator, root_entropy
 import time
 import json
 
-def run_round(state, warmup=False):
-    # 1) Agent takes action given state tracker's representation of dialogue (state)
-    agent_action_index, agent_action = dqn_agent.get_action(state, use_rule=warmup)
-    # 2) Update state tracker with the agent's action
-    state_tracker.update_state_agent(agent_action)
-    # print("agent: {}".format(agent_action))
-    # 3) User takes action given agent action
-    user_action, reward, done, success = user.step(agent_action)
-    # print("user: {}".format(user_action))
-    if not done:
-        # 4) Infuse error into semantic frame level of user action
-        emc.infuse_error(user_action)
-    # 5) Update state tracker with user action
-    state_tracker.update_state_user(user_action)
-    # 6) Get next state and add experience
-    next_state = state_tracker.get_state(done)
-    dqn_agent.add_experience(state, agent_action_index, reward, next_state, done)
-
-    return next_state, reward, done, success
-
-
-def warmup_run():
+class Trainer:
     """
-    Runs the warmup stage of training which is used to fill the agents memory.
-
-    The agent uses it's rule-based policy to make actions. The agent's memory is filled as this runs.
-    Loop terminates when the size of the memory is equal to WARMUP_MEM or when the memory buffer is full.
-
-    """
-
-    print('Warmup Started...')
-    total_step = 0
-    while total_step != WARMUP_MEM and not dqn_agent.is_memory_full():
-        # print(total_step)
-        # Reset episode
-        episode_reset()
-        done = False
-        # Get initial state from state tracker
-        state = state_tracker.get_state()
-        while not done:
-            next_state, _, done, _ = run_round(state, warmup=True)
-            total_step += 1
-            state = next_state
-        # print(total_step)
-        # time.sleep(1)
-    print('...Warmup Ended')
-
-
-
-def train_run():
-    """
-    Runs the loop that trains the agent.
-
-    Trains the agent on the goal-oriented chatbot task. Training of the agent's neural network occurs every episode that
-    TRAIN_FREQ is a multiple of. Terminates when the episode reaches NUM_EP_TRAIN.
-
+    One training run: the user, error model controller, state tracker and agent of the run and the loops that train
+    the agent with them.
     """
 
-    print('Training Started...')
-    episode = 0
-    period_reward_total = 0
-    period_success_total = 0
-    success_rate_best = 0.9
-    while episode < NUM_EP_TRAIN:
-        episode_reset()
-        episode += 1
-        done = False
-        ep_reward = 0
-        state = state_tracker.get_state()
-        # print(state[119:])
-        while not done:
-            next_state, reward, done, success = run_round(state)
-            # print("reward: {}".format(reward))
-            period_reward_total += reward
-            ep_reward += reward
-            state = next_state
-        # print("episode {0} success :{1}, reward:{2}".format(episode, success,ep_reward))
-
-        period_success_total += success
+    def __init__(self, constants, database, db_dict, user_goals):
+        """
+        The constructor of Trainer, builds the components of the run.
+
+        Parameters:
+            constants (dict): Loaded constants in dict
+            database (ColumnarDB): The database
+            db_dict (dict): The database dict used by the error model controller
+            user_goals (list or GoalPool): User goals loaded from file, or the GoalPool compiled from them
+        """
+
+        self.constants = constants
+        self.database = database
+        self.db_dict = db_dict
+        self.user_goals = user_goals
+
+        # Load run constants
+        run_dict = constants['run']
+        self.use_usersim = run_dict['usersim']
+        self.warmup_mem = run_dict['warmup_mem']
+        self.num_ep_train = run_dict['num_ep_run']
+        self.train_freq = run_dict['train_freq']
+        self.success_rate_threshold = run_dict['success_rate_threshold']
+        # Number of dialogues stepped in lockstep with batched agent actions, 1 runs the original single dialogue
+        # loops
+        self.num_envs = run_dict.get('num_envs', 1)
+        # Number of actor processes running the rollouts (each with num_envs dialogues) while this process learns, 0
+        # runs everything in this process
+        self.num_actors = run_dict.get('num_actors', 0)
+        # Root seed of the random streams of the user sims., error model controllers, exploration and replay
+        # sampling, None for an unseeded run
+        seed = run_dict.get('seed', None)
+        self.entropy = root_entropy(seed) if seed is not None else None
+        streams = EnvStreams(self.entropy, 0) if self.entropy is not None else None
+
+        self.period_history = []
+        # Init. Objects
+        if self.use_usersim:
+            self.user = UserSimulator(user_goals, constants, database, rng=streams.user if streams else None)
+        else:
+            self.user = User(constants)
+        self.emc = ErrorModelController(db_dict, constants, rng=streams.emc if streams else None,
+                                        batch_rng=streams.emc_batch if streams else None)
+        self.state_tracker = StateTracker(database, constants)
+        # Imported here, not at the top, since spawned actors run this module again and must not load keras
+        from dqn_agent import DQNAgent
+        self.dqn_agent = DQNAgent(self.state_tracker.get_state_size(), constants,
+                                  rng=streams.agent if streams else None,
+                                  memory_rng=learner_generator(self.entropy) if streams else None)
+        self.rollout = None
+
+    def train(self):
+        """
+        Runs the warmup and training stages, in actor processes, batched or with the original single dialogue loops
+        depending on the run constants.
+
+        Returns:
+            list: Of dict, the episode, success rate, avg reward and empty/non-empty counts of every training period
+        """
+
+        if self.use_usersim and self.num_actors > 0:
+            # The actors attach to one shared memory copy of the data
+            with SharedData.create(self.database, self.db_dict, self.user_goals) as shared:
+                actor_learner = ActorLearner(self.dqn_agent, self.constants, self.num_actors, self.num_envs,
+                                             shared_handle=shared.handle, seed_entropy=self.entropy)
+                actor_learner.warmup_run(self.warmup_mem)
+                actor_learner.train_run(self.num_ep_train, self.train_freq, self.end_period)
+        elif self.use_usersim and self.num_envs > 1:
+            self.rollout = BatchRollout(self.dqn_agent, self.user_goals, self.database, self.db_dict, self.constants,
+                                        self.num_envs, seed_entropy=self.entropy)
+            self.warmup_run_batched()
+            self.train_run_batched()
+        else:
+            self.warmup_run()
+            self.train_run()
+        return self.period_history
+
+    def run_round(self, state, warmup=False):
+        # 1) Agent takes action given state tracker's representation of dialogue (state)
+        agent_action_index, agent_action = self.dqn_agent.get_action(state, use_rule=warmup)
+        # 2) Update state tracker with the agent's action
+        self.state_tracker.update_state_agent(agent_action)
+        # print("agent: {}".format(agent_action))
+        # 3) User takes action given agent action
+        user_action, reward, done, success = self.user.step(agent_action)
+        # print("user: {}".format(user_action))
+        if not done:
+            # 4) Infuse error into semantic frame level of user action
+            self.emc.infuse_error(user_action)
+        # 5) Update state tracker with user action
+        self.state_tracker.update_state_user(user_action)
+        # 6) Get next state and add experience
+        next_state = self.state_tracker.get_state(done)
+        self.dqn_agent.add_experience(state, agent_action_index, reward, next_state, done)
+
+        return next_state, reward, done, success
+
+    def warmup_run(self):
+        """
+        Runs the warmup stage of training which is used to fill the agents memory.
+
+        The agent uses it's rule-based policy to make actions. The agent's memory is filled as this runs.
+        Loop terminates when the size of the memory is equal to warmup_mem or when the memory buffer is full.
+
+        """
+
+        print('Warmup Started...')
+        total_step = 0
+        while total_step != self.warmup_mem and not self.dqn_agent.is_memory_full():
+            # Reset episode
+            self.episode_reset()
+            done = False
+            # Get initial state from state tracker
+            state = self.state_tracker.get_state()
+            while not done:
+                next_state, _, done, _ = self.run_round(state, warmup=True)
+                total_step += 1
+                state = next_state
+        print('...Warmup Ended')
+
+    def train_run(self):
+        """
+        Runs the loop that trains the agent.
+
+        Trains the agent on the goal-oriented chatbot task. Training of the agent's neural network occurs every episode
+        that train_freq is a multiple of. Terminates when the episode reaches num_ep_train.
+
+        """
+
+        print('Training Started...')
+        episode = 0
+        period_reward_total = 0
+        period_success_total = 0
+        success_rate_best = 0.9
+        while episode < self.num_ep_train:
+            self.episode_reset()
+            episode += 1
+            done = False
+            ep_reward = 0
+            state = self.state_tracker.get_state()
+            while not done:
+                next_state, reward, done, success = self.run_round(state)
+                period_reward_total += reward
+                ep_reward += reward
+                state = next_state
+
+            period_success_total += success
 
-        # Train
-        if episode % TRAIN_FREQ == 0:
-            # Check success rate
-            empty, non_empty = user.reset_empty_count()
-            success_rate = period_success_total / TRAIN_FREQ
-            avg_reward = period_reward_total / TRAIN_FREQ
-            print("episode :{0}, success rate: {1} Avg Reward: {2} Empty-non empty count: {3} - {4}".format(episode,success_rate,avg_reward, empty, non_empty))
-            # Flush
-            if success_rate >= success_rate_best and success_rate >= SUCCESS_RATE_THRESHOLD:
-                dqn_agent.empty_memory()
-            # Update current best success rate
-            if success_rate > success_rate_best:
-                print('Episode: {} NEW BEST SUCCESS RATE: {} Avg Reward: {}' .format(episode, success_rate, avg_reward))
-                success_rate_best = success_rate
-                dqn_agent.save_weights()
-            period_success_total = 0
-            period_reward_total = 0
-            # Copy
-            dqn_agent.copy()
             # Train
-            dqn_agent.train()
-    print('...Training Ended')
-
-
-def episode_reset():
-    """
-    Resets the episode/conversation in the warmup and training loops.
-
-    Called in warmup and train to reset the state tracker, user and agent. Also get's the initial user action.
-
+            if episode % self.train_freq == 0:
+                empty, non_empty = self.user.reset_empty_count()
+                success_rate_best = self.end_period(episode, period_success_total, period_reward_total,
+                                                    success_rate_best, empty, non_empty)
+                period_success_total = 0
+                period_reward_total = 0
+        print('...Training Ended')
+
+    def end_period(self, episode, period_success_total, period_reward_total, success_rate_best, empty, non_empty):
+        """
+        Ends a period of train_freq training episodes: reports it, saves the weights on a new best success rate,
+        copies the behavior model into the target model and trains the agent.
+
+        Parameters:
+            episode (int): The number of episodes so far
+            period_success_total (int): The number of successful episodes in the period
+            period_reward_total (float): The total reward of the period
+            success_rate_best (float): The best success rate so far
+            empty (int): The number of agent informs with an empty value in the period
+            non_empty (int): The number of agent informs with a value in the period
+
+        Returns:
+            float: The best success rate so far, including this period
+        """
+
+        # Check success rate
+        success_rate = period_success_total / self.train_freq
+        avg_reward = period_reward_total / self.train_freq
+        print("episode :{0}, success rate: {1} Avg Reward: {2} Empty-non empty count: {3} - {4}".format(episode,success_rate,avg_reward, empty, non_empty))
+        # Flush
+        if success_rate >= success_rate_best and success_rate >= self.success_rate_threshold:
+            self.dqn_agent.empty_memory()
+        # Update current best success rate
+        if success_rate > success_rate_best:
+            print('Episode: {} NEW BEST SUCCESS RATE: {} Avg Reward: {}' .format(episode, success_rate, avg_reward))
+            success_rate_best = success_rate
+            self.dqn_agent.save_weights()
+        # Copy
+        self.dqn_agent.copy()
+        # Train
+        self.dqn_agent.train()
+        self.period_history.append({'episode': episode, 'success_rate': success_rate, 'avg_reward': avg_reward,
+                                    'empty': empty, 'non_empty': non_empty})
+        return success_rate_best
+
+    def warmup_run_batched(self):
+        """
+        Batched version of warmup_run, steps num_envs dialogues in lockstep with the rule-based policy.
+
+        Loop terminates when the number of steps reaches warmup_mem or when the memory buffer is full.
+
+        """
+
+        print('Warmup Started...')
+        total_step = 0
+        self.rollout.reset()
+        while total_step < self.warmup_mem and not self.dqn_agent.is_memory_full():
+            self.rollout.step(warmup=True)
+            total_step += self.rollout.num_envs
+        print('...Warmup Ended')
+
+    def train_run_batched(self):
+        """
+        Batched version of train_run, steps num_envs dialogues in lockstep with one batched agent action per step.
+
+        Finished dialogues are reset right away. Training of the agent's neural network occurs every episode that
+        train_freq is a multiple of. Terminates when the episode reaches num_ep_train.
+
+        """
+
+        print('Training Started...')
+        episode = 0
+        period_reward_total = 0
+        period_success_total = 0
+        success_rate_best = 0.9
+        self.rollout.reset()
+        while episode < self.num_ep_train:
+            for ep_reward, success in self.rollout.step():
+                episode += 1
+                period_reward_total += ep_reward
+                period_success_total += success
+                if episode % self.train_freq == 0:
+                    empty, non_empty = self.rollout.reset_empty_count()
+                    success_rate_best = self.end_period(episode, period_success_total, period_reward_total,
+                                                        success_rate_best, empty, non_empty)
+                    period_success_total = 0
+                    period_reward_total = 0
+        print('...Training Ended')
+
+    def episode_reset(self):
+        """
+        Resets the episode/conversation in the warmup and training loops.
+
+        Called in warmup and train to reset the state tracker, user and agent. Also get's the initial user action.
+
+        """
+
+        # First reset the state tracker
+        self.state_tracker.reset()
+        # Then pick an init user action
+        user_action = self.user.reset()
+        # Infuse with error
+        self.emc.infuse_error(user_action)
+        # And update state tracker
+        self.state_tracker.update_state_user(user_action)
+        # Finally, reset agent
+        self.dqn_agent.reset()
+
+
+def train_agent(constants, database, db_dict, user_goals):
     """
+    Trains an agent from scratch with the given constants.
 
-    # First reset the state tracker
-    state_tracker.reset()
-    # Then pick an init user action
-    user_action = user.reset()
-    # Infuse with error
-    emc.infuse_error(user_action)
-    # And update state tracker
-    state_tracker.update_state_user(user_action)
-    # Finally, reset agent
-    dqn_agent.reset()
+    The data is loaded by the caller so several runs, e.g. the trials of a sweep, can share it.
 
+    Parameters:
+        constants (dict): Loaded constants in dict
+        database (ColumnarDB): The database
+        db_dict (dict): The database dict used by the error model controller
+        user_goals (list or GoalPool): User goals loaded from file, or the GoalPool compiled from them
 
+    Returns:
+        list: Of dict, the episode, success rate, avg reward and empty/non-empty counts of every training period
+    """
 
+    return Trainer(constants, database, db_dict, user_goals).train()
 
 
 if __name__ == "__main__":
     # Can provide constants file path in args OR run it as is and change 'CONSTANTS_FILE_PATH' below
     # 1) In terminal: python train.py --constants_path "constants.json"
     # 2) Run this file as is
+    # To train with several values of the constants use sweep.py
     parser = argparse.ArgumentParser()
     parser.add_argument('--constants_path', dest='constants_path', type=str, default='')
     args = parser.parse_args()
@@ -154,51 +315,28 @@ if __name__ == "__main__":
     with open(constants_file) as f:
         constants = json.load(f)
 
-    constants['agent']['learning_rate']=[ i*pow(10,-4) for i in range(3,4,1)]
     # Load file path constants
     file_path_dict = constants['db_file_paths']
     DATABASE_FILE_PATH = file_path_dict['database']
     DICT_FILE_PATH = file_path_dict['dict']
     USER_GOALS_FILE_PATH = file_path_dict['user_goals']
-
-    # Load run constants
-    run_dict = constants['run']
-    USE_USERSIM = run_dict['usersim']
-    WARMUP_MEM = run_dict['warmup_mem']
-    NUM_EP_TRAIN = run_dict['num_ep_run']
-    TRAIN_FREQ = run_dict['train_freq']
-    MAX_ROUND_NUM = run_dict['max_round_num']
-    SUCCESS_RATE_THRESHOLD = run_dict['success_rate_threshold']
+    # Where the compiled binary artifacts of the files above are stored, next to the files by default
+    CACHE_DIR = file_path_dict.get('cache_dir', None)
 
     # Load movie DB
     # Note: If you get an unpickling error here then run 'pickle_converter.py' and it should fix it
-    database= json.load(open(DATABASE_FILE_PATH,encoding='utf-8'))
+    # Loaded as a ColumnarDB memory-mapped from its compiled artifact, shared by the user sim, state tracker and its
+    # DB query
+    database = load_database(DATABASE_FILE_PATH, CACHE_DIR)
     # database = pickle.load(open(DATABASE_FILE_PATH, 'rb'), encoding='latin1')
-    # print("-----------------------------------database")
-    # print(type(database))
 
     # Clean DB
     # remove_empty_slots(database)
 
     # Load movie dict
-    db_dict = json.load(open(DICT_FILE_PATH,encoding='utf-8'))[0]
+    db_dict = load_json(DICT_FILE_PATH, CACHE_DIR)[0]
 
     # Load goal File
-    user_goals = json.load(open(USER_GOALS_FILE_PATH,encoding='utf-8'))
-
-    
-    for learning_rate_index in range(len(constants['agent']['learning_rate'])):
-        print("learning rate : {0}".format(constants['agent']['learning_rate'][learning_rate_index]))
-        
-        # Init. Objects
-        if USE_USERSIM:
-            user = UserSimulator(user_goals, constants, database)
-        else:
-            user = User(constants)
-        emc = ErrorModelController(db_dict, constants)
-        state_tracker = StateTracker(database, constants)
-        dqn_agent = DQNAgent(state_tracker.get_state_size(), constants,learning_rate_index)
-        warmup_run()
-        train_run()
-
+    user_goals = load_json(USER_GOALS_FILE_PATH, CACHE_DIR)
 
+    train_agent(constants, database, db_dict, user_goals)
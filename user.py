@@ -1,5 +1,6 @@
 from dialogue_config import FAIL, SUCCESS, usersim_intents, all_slots
 from utils import reward_function
+from frame import Frame
 
 
 class User:
@@ -19,7 +20,7 @@ class User:
         Reset the user.
 
         Returns:
-            dict: The user response
+            Frame: The user response
         """
 
         return self._return_response()
@@ -35,7 +36,7 @@ class User:
         intents, informs keys and values, and request keys and values cannot contain / , :
 
         Returns:
-            dict: The response of the user
+            Frame: The response of the user
         """
 
         response = {'intent': '', 'inform_slots': {}, 'request_slots': {}}
@@ -75,8 +76,7 @@ class User:
             if intent_correct and informs_correct and requests_correct:
                 break
 
-        
-        return response
+        return Frame.from_dict(response)
 
     def _return_success(self):
         """
@@ -99,7 +99,7 @@ class User:
             agent_action (dict): The current action of the agent
 
         Returns:
-            dict: User response
+            Frame: User response
             int: Reward
             bool: Done flag
             int: Success: -1, 0 or 1 for loss, neither win nor loss, win
@@ -118,12 +118,11 @@ class User:
         # print('Agent Action: {}'.format(agent_action))
 
         done = False
-        user_response = {'intent': '', 'request_slots': {}, 'inform_slots': {}}
 
         # First check round num, if equal to max then fail
         if agent_action['round'] == self.max_round:
             success = FAIL
-            user_response['intent'] = 'done'
+            user_response = Frame('done')
         else:
             user_response = self._return_response()
             success = self._return_success()
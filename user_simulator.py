@@ -1,23 +1,30 @@
 from dialogue_config import usersim_default_key, FAIL,UNSUITABLE, NO_OUTCOME, SUCCESS, NO_VALUE, GOOD_INFORM, usersim_required_init_inform_keys, \
     no_query_keys
 from utils import reward_function
-import random, copy
+from columnar_db import as_columnar
+from frame import Frame
+from goal_pool import as_goal_pool
+import argparse, json, random, time
 
 
 class UserSimulator:
     """Simulates a real user, to train the agent with reinforcement learning."""
 
-    def __init__(self, goal_list, constants, database):
+    def __init__(self, goal_list, constants, database, rng=None):
         """
         The constructor for UserSimulator. Sets dialogue config variables.
 
         Parameters:
-            goal_list (list): User goals loaded from file
+            goal_list (list or GoalPool): User goals loaded from file, or the GoalPool compiled from them to share
+                                          one pool between user sims.
             constants (dict): Dict of constants loaded from file
-            database (dict): The database in the format dict(long: dict)
+            database (list or ColumnarDB): The database in the format list(dict) or the ColumnarDB built from it
+            rng (random.Random): The random stream of the user sim., see seeding.EnvStreams. Default: the global
+                                 random module
         """
 
-        self.goal_list = goal_list
+        self.goal_pool = as_goal_pool(goal_list)
+        self.random = rng if rng is not None else random
         self.max_round = constants['run']['max_round_num']
         self.default_key = usersim_default_key
         # A list of REQUIRED to be in the first action inform keys
@@ -25,9 +32,13 @@ class UserSimulator:
         self.no_query = no_query_keys
         self.agent_additional_informs = []
         self.success = NO_OUTCOME
+        # Checked mode verifies the invariants of the agent action and the state every step, fast mode skips them
+        self.checked = constants.get('usersim', {}).get('checked', True)
         # TEMP ----
-        self.database = database
+        self.database = as_columnar(database)
         # ---------
+        # The ids of the items that satisfy each goal, shared by the user sims. of a pool
+        self.answers = self.goal_pool.answers(self.database)
         self.empty_count = 0
         self.non_empty_count = 0
     def reset(self):
@@ -38,7 +49,11 @@ class UserSimulator:
             dict: The initial action of an episode
         """
 
-        self.goal = random.choice(self.goal_list)
+        # A working copy of a goal, so the edits made to it during the episode never reach the pool
+        goal_id = self.goal_pool.sample_index(self.random)
+        self.goal = self.goal_pool[goal_id]
+        # The items that satisfy the goal, None if any match does
+        self.goal_answers = self.answers.get(goal_id)
         # Add default slot to requests of goal
         self.goal['request_slots'][self.default_key] = 'UNK'
         self.state = {}
@@ -70,7 +85,7 @@ class UserSimulator:
         The initial action has an intent of request, required init. inform slots and a single request slot.
 
         Returns:
-            dict: Initial user response
+            Frame: Initial user response
         """
 
         # Always request
@@ -85,7 +100,7 @@ class UserSimulator:
                     self.state['history_slots'][inform_key] = self.goal['inform_slots'][inform_key]
             # If nothing was added then pick a random one to add
             if not self.state['inform_slots']:
-                key, value = random.choice(list(self.goal['inform_slots'].items()))
+                key, value = self.random.choice(list(self.goal['inform_slots'].items()))
                 self.state['inform_slots'][key] = value
                 self.state['rest_slots'].pop(key)
                 self.state['history_slots'][key] = value
@@ -93,18 +108,13 @@ class UserSimulator:
         # Now add a request, do a random one if something other than def. available
         self.goal['request_slots'].pop(self.default_key)
         if self.goal['request_slots']:
-            req_key = random.choice(list(self.goal['request_slots'].keys()))
+            req_key = self.random.choice(list(self.goal['request_slots'].keys()))
         else:
             req_key = self.default_key
         self.goal['request_slots'][self.default_key] = 'UNK'
         self.state['request_slots'][req_key] = 'UNK'
 
-        user_response = {}
-        user_response['intent'] = self.state['intent']
-        user_response['request_slots'] = copy.deepcopy(self.state['request_slots'])
-        user_response['inform_slots'] = copy.deepcopy(self.state['inform_slots'])
-        # print("user: {}".format(user_response))
-        return user_response
+        return self._build_response()
 
     def step(self, agent_action):
         """
@@ -117,21 +127,14 @@ class UserSimulator:
             agent_action (dict): The agent action that the user sim. responds to
 
         Returns:
-            dict: User sim. response
+            Frame: User sim. response
             int: Reward
             bool: Done flag
             int: Success: -1, 0 or 1 for loss, neither win nor loss, win
         """
-        
-        # Assertions -----
-        # No UNK in agent action informs
-        for value in agent_action['inform_slots'].values():
-            assert value != 'UNK'
-            assert value != 'PLACEHOLDER'
-        # No PLACEHOLDER in agent at all
-        for value in agent_action['request_slots'].values():
-            assert value != 'PLACEHOLDER'
-        # ----------------
+
+        if self.checked:
+            self._check_agent_action(agent_action)
 
         self.state['inform_slots'].clear()
         # self.state['intent'] = ''
@@ -162,7 +165,34 @@ class UserSimulator:
                 self.state['request_slots'].clear()
                 done = True
 
-        # Assumptions -------
+        if self.checked:
+            self._check_state()
+
+        user_response = self._build_response()
+
+        reward = reward_function(self.success, self.max_round)
+
+        return user_response, reward, done, True if self.success is 1 else False
+
+    def _check_agent_action(self, agent_action):
+        """
+        Asserts that the agent action is well formed, checked mode only.
+
+        Parameters:
+            agent_action (dict)
+        """
+
+        # No UNK in agent action informs
+        for value in agent_action['inform_slots'].values():
+            assert value != 'UNK'
+            assert value != 'PLACEHOLDER'
+        # No PLACEHOLDER in agent at all
+        for value in agent_action['request_slots'].values():
+            assert value != 'PLACEHOLDER'
+
+    def _check_state(self):
+        """Asserts the invariants of the state and goal after a step, checked mode only."""
+
         # If request intent, then make sure request slots
         if self.state['intent'] == 'request':
             assert self.state['request_slots']
@@ -181,8 +211,6 @@ class UserSimulator:
         for inf_key in self.goal['inform_slots']:
             # assert self.state['history_slots'].get(inf_key, False) or self.state['rest_slots'].get(inf_key, False)
             assert inf_key in self.state['history_slots'] or inf_key in self.state['rest_slots'], inf_key
-
-        
         for req_key in self.goal['request_slots']:
             # assert self.state['history_slots'].get(req_key, False) or self.state['rest_slots'].get(req_key,
             #                                                                                        False), req_key
@@ -192,16 +220,19 @@ class UserSimulator:
             # assert self.goal['inform_slots'].get(key, False) or self.goal['request_slots'].get(key, False)
             assert key in self.goal['inform_slots'] or key in self.goal['request_slots'], key
         assert self.state['intent'] != ''
-        # -----------------------
 
-        user_response = {}
-        user_response['intent'] = self.state['intent']
-        user_response['request_slots'] = copy.deepcopy(self.state['request_slots'])
-        user_response['inform_slots'] = copy.deepcopy(self.state['inform_slots'])
+    def _build_response(self):
+        """
+        Returns the user response for the current state.
 
-        reward = reward_function(self.success, self.max_round)
+        Only the slot dicts are copied: the slot values are shared with the state and goal, which never edit a value
+        in place, so the receivers of the response may replace or remove slots but must not edit a value in place.
 
-        return user_response, reward, done, True if self.success is 1 else False
+        Returns:
+            Frame: User sim. response
+        """
+
+        return Frame(self.state['intent'], dict(self.state['inform_slots']), dict(self.state['request_slots']))
 
     def _response_to_request(self, agent_action):
         """
@@ -245,7 +276,7 @@ class UserSimulator:
                 if value != 'UNK':
                     rest_informs[key] = value
             if rest_informs:
-                key_choice, value_choice = random.choice(list(rest_informs.items()))
+                key_choice, value_choice = self.random.choice(list(rest_informs.items()))
                 self.state['inform_slots'][key_choice] = value_choice
                 self.state['rest_slots'].pop(key_choice)
                 self.state['history_slots'][key_choice] = value_choice
@@ -302,12 +333,12 @@ class UserSimulator:
             #random choose slot to remove
             slots_lists = [key for key, value in self.state['history_slots'].items() if ('anything' not in value and key != self.default_key)]
             if len(slots_lists) > 0: 
-                slot_to_remove = random.choice(slots_lists)
+                slot_to_remove = self.random.choice(slots_lists)
                 self.state['intent'] = 'inform'
                 self.state['inform_slots'][slot_to_remove] = ['anything']
                 self.state['request_slots'].clear()
                 self.state['history_slots'][slot_to_remove] = ['anything']
-                self.goal['inform_slots'].pop(slot_to_remove, None)
+                self._relax_goal(slot_to_remove)
                 self.state['rest_slots'].pop(slot_to_remove, None)
                 # print(self.goal['inform_slots'])
                 # print(self.state['history_slots'])
@@ -343,7 +374,7 @@ class UserSimulator:
             elif self.state['rest_slots']:
                 def_in = self.state['rest_slots'].pop(self.default_key, False)
                 if self.state['rest_slots']:
-                    key, value = random.choice(list(self.state['rest_slots'].items()))
+                    key, value = self.random.choice(list(self.state['rest_slots'].items()))
                     if value != 'UNK':
                         self.state['intent'] = 'inform'
                         self.state['inform_slots'][key] = value
@@ -394,25 +425,22 @@ class UserSimulator:
             history_slots_list = [item for item in history_slots_list if item != 'activity']
             # print(history_slots_list)
             if len(history_slots_list) > 0:
-                slot_to_remove = random.choice(history_slots_list)
+                slot_to_remove = self.random.choice(history_slots_list)
                 # print("slot to remove {}".format(slot_to_remove))
                 self.state['intent'] = 'inform'
                 self.state['inform_slots'][slot_to_remove] = ['anything']
                 self.state['request_slots'].clear()
                 self.state['history_slots'][slot_to_remove] = ['anything']
-                self.goal['inform_slots'].pop(slot_to_remove, None)
+                self._relax_goal(slot_to_remove)
                 self.state['rest_slots'].pop(slot_to_remove, None)
 
-        # Check to see if all goal informs are in the agent informs, and that the values match
-        for key, value in self.goal['inform_slots'].items():
-            assert value != None
-            # For items that cannot be in the queries don't check to see if they are in the agent informs here
-            if key in self.no_query:
-                continue
-            # Will return true if key not in agent informs OR if value does not match value of agent informs[key]
-            if value != agent_informs.get(key, None):
-                self.constraint_check = FAIL
-                break
+        # Check to see if the matched item satisfies the goal informs, the agent informs are that item's slots
+        satisfied = self._is_answer(agent_informs[self.default_key])
+        if self.checked:
+            assert satisfied == self._informs_satisfy_goal(agent_informs), \
+                'agent informs: {}\ngoal: {}'.format(agent_informs, self.goal)
+        if not satisfied:
+            self.constraint_check = FAIL
 
         if self.constraint_check == FAIL:
             self.state['intent'] = 'reject'
@@ -436,6 +464,53 @@ class UserSimulator:
             self.state['request_slots'].clear()
             
         # return success
+    def _relax_goal(self, slot):
+        """
+        Drops an inform slot from the goal, e.g. after the agent found no match, and looks up the items that satisfy
+        the relaxed goal.
+
+        Parameters:
+            slot (string)
+        """
+
+        self.goal['inform_slots'].pop(slot, None)
+        self.goal_answers = self.answers.lookup(self.goal['inform_slots'])
+
+    def _is_answer(self, match):
+        """
+        Returns whether the item the agent matched satisfies the goal informs.
+
+        Parameters:
+            match (string): The id of the item, or 'no match available'
+
+        Returns:
+            bool
+        """
+
+        if self.goal_answers is None:
+            return True
+        return match.isdigit() and int(match) in self.goal_answers
+
+    def _informs_satisfy_goal(self, agent_informs):
+        """
+        Returns whether every goal inform is in the agent informs with the same value, the check _is_answer replaces.
+
+        Parameters:
+            agent_informs (dict)
+
+        Returns:
+            bool
+        """
+
+        for key, value in self.goal['inform_slots'].items():
+            assert value != None
+            # For items that cannot be in the queries don't check to see if they are in the agent informs here
+            if key in self.no_query:
+                continue
+            if value != agent_informs.get(key, None):
+                return False
+        return True
+
     def _response_to_done(self):
         """
         Augments the state in response to the agent action having an intent of done.
@@ -461,15 +536,52 @@ class UserSimulator:
         # TEMP: ----
         assert self.state['history_slots'][self.default_key] != 'no match available'
         # print(int(self.state['history_slots'][self.default_key]))
-        match = copy.deepcopy(self.database[int(self.state['history_slots'][self.default_key])])
-
-        for key, value in self.goal['inform_slots'].items():
-            assert value != None
-            if key in self.no_query:
-                continue
-            if value != match.get(key, None):
-                assert True is False, 'match: {}\ngoal: {}'.format(match, self.goal)
-                break
+        match = self.state['history_slots'][self.default_key]
+        assert self._is_answer(match), 'match: {}\ngoal: {}'.format(self.database[int(match)], self.goal)
         # ----------
 
         self.success = SUCCESS
+
+
+if __name__ == "__main__":
+    # Benchmarks UserSimulator.step in checked and fast mode, e.g.
+    # python user_simulator.py --constants_path "constants.json" --episodes 2000
+    from dialogue_config import agent_actions
+    from state_tracker import StateTracker
+    from data_cache import load_database, load_json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--constants_path', dest='constants_path', type=str, default='constants.json')
+    parser.add_argument('--episodes', dest='episodes', type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(args.constants_path) as f:
+        constants = json.load(f)
+    file_path_dict = constants['db_file_paths']
+    cache_dir = file_path_dict.get('cache_dir', None)
+    database = load_database(file_path_dict['database'], cache_dir)
+    user_goals = load_json(file_path_dict['user_goals'], cache_dir)
+
+    for checked in [True, False]:
+        constants['usersim'] = dict(constants.get('usersim', {}), checked=checked)
+        # The same episodes in both modes
+        user = UserSimulator(user_goals, constants, database, rng=random.Random(0))
+        state_tracker = StateTracker(database, constants)
+        action_rng = random.Random(1)
+        num_steps = 0
+        step_time = 0.
+        for _ in range(args.episodes):
+            state_tracker.reset()
+            state_tracker.update_state_user(user.reset())
+            done = False
+            while not done:
+                agent_action = dict(agent_actions[action_rng.randrange(len(agent_actions))])
+                agent_action['inform_slots'] = dict(agent_action['inform_slots'])
+                state_tracker.update_state_agent(agent_action)
+                start = time.perf_counter()
+                user_action, _, done, _ = user.step(agent_action)
+                step_time += time.perf_counter() - start
+                num_steps += 1
+                state_tracker.update_state_user(user_action)
+        print('{} mode: {} steps, {:.2f} us/step'.format('Checked' if checked else 'Fast', num_steps,
+                                                         1e6 * step_time / num_steps))
@@ -1,4 +1,6 @@
 from dialogue_config import FAIL, SUCCESS, UNSUITABLE, NO_VALUE, GOOD_INFORM
+import sys
+import numpy as np
 
 
 def convert_list_to_dict(lst):
@@ -56,3 +58,41 @@ def reward_function(success, max_round):
     elif success == GOOD_INFORM:
         reward +=  max_round / 10
     return reward
+
+
+def mlp_forward(states, weights):
+    """
+    Runs the forward pass of the agent's dense network in NumPy.
+
+    Matches the layers built by DQNAgent._build_model: every layer but the last is relu, the last is linear.
+
+    Parameters:
+        states (numpy.array): Of shape (batch size, state size)
+        weights (list): The weights as returned by keras Model.get_weights, kernel then bias for each layer
+
+    Returns:
+        numpy.array: Of shape (batch size, num actions)
+    """
+
+    x = states
+    num_layers = len(weights) // 2
+    for layer in range(num_layers):
+        x = np.dot(x, weights[2 * layer]) + weights[2 * layer + 1]
+        if layer < num_layers - 1:
+            np.maximum(x, 0., out=x)
+    return x
+
+
+def check_keras_free(process):
+    """
+    Raises if keras was loaded in a worker process that only acts, e.g. because the launching script imports it at
+    the top: spawned processes run the launching script again, so its keras import would cost every worker the memory
+    and startup time of keras.
+
+    Parameters:
+        process (string): The kind of process, for the message
+    """
+
+    if 'keras' in sys.modules:
+        raise RuntimeError('keras was loaded in an {} process, import it (e.g. dqn_agent) inside the '
+                           '__main__ block of the launching script instead of at its top'.format(process))